@@ -23,8 +23,11 @@ export default function Admin() {
   const totalAlertes = Array.isArray(alertes) ? alertes.length : 0;
   const totalSignalements = Array.isArray(signalements) ? signalements.length : 0;
 
-  // Temps réel: fait bouger les KPI de façon légère
-  const { lastEvent } = useRealtime("http://127.0.0.1:8000/api/realtime/stream");
+  // Temps réel: fait bouger les KPI de façon légère (jeton requis pour les sujets signalements)
+  const token = typeof window !== "undefined" ? localStorage.getItem("token") : null;
+  const { lastEvent } = useRealtime(
+    `http://127.0.0.1:8000/api/realtime/stream${token ? `?token=${encodeURIComponent(token)}` : ""}`
+  );
   const [kpiAlertes, setKpiAlertes] = useState<number>(totalAlertes);
   const [kpiSignalements, setKpiSignalements] = useState<number>(totalSignalements);
 
@@ -3,6 +3,11 @@ ASGI config for mairi_loc project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Le flux temps réel (/api/realtime/stream) est asynchrone: servir l'application
+en ASGI pour tenir des milliers de connexions SSE inactives dans un processus:
+
+    uvicorn information.asgi:application --host 0.0.0.0 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -11,6 +16,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mairi_loc.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'information.settings')
 
 application = get_asgi_application()
@@ -14,6 +14,7 @@ from pathlib import Path
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -140,6 +141,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+# GET conditionnels (inondation/versions.py): le front peut relire et renvoyer ETag / Last-Modified
+CORS_ALLOW_HEADERS = (*default_headers, "if-none-match", "if-modified-since")
+CORS_EXPOSE_HEADERS = ["ETag", "Last-Modified"]
 
 
 # Django REST Framework + JWT configuration
@@ -161,3 +165,82 @@ SIMPLE_JWT = {
 VAPID_PUBLIC_KEY  = os.getenv("VAPID_PUBLIC_KEY", "")
 VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY", "")
 VAPID_SUBJECT     = os.getenv("VAPID_SUBJECT", "mailto:admin@example.com")
+
+# Fan-out Web Push: nombre maximal d'envois simultanés
+PUSH_FANOUT_WORKERS = int(os.getenv("PUSH_FANOUT_WORKERS", "16"))
+
+# File d'envoi push (outbox) traitée par `manage.py push_worker`
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", "5"))
+PUSH_RETRY_BASE_SECONDS = int(os.getenv("PUSH_RETRY_BASE_SECONDS", "30"))
+PUSH_CLAIM_LEASE_SECONDS = int(os.getenv("PUSH_CLAIM_LEASE_SECONDS", "120"))
+PUSH_SEND_TIMEOUT_SECONDS = float(os.getenv("PUSH_SEND_TIMEOUT_SECONDS", "10"))
+
+# Tampon de présence (update_presence): seuil de déplacement et flush en lot
+PRESENCE_MIN_MOVE_M = float(os.getenv("PRESENCE_MIN_MOVE_M", "25"))
+PRESENCE_MAX_PENDING = int(os.getenv("PRESENCE_MAX_PENDING", "500"))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "5"))
+
+# SMS d'alerte: backend interchangeable (cf. notifications/sms.py) et débit fournisseur
+SMS_BACKEND = os.getenv("SMS_BACKEND", "notifications.sms.FileSmsBackend")
+SMS_FILE_PATH = BASE_DIR / "sms_outbox.jsonl"
+SMS_RATE_PER_SECOND = float(os.getenv("SMS_RATE_PER_SECOND", "50"))
+
+# Flux temps réel: nombre d'événements gardés pour le rejeu Last-Event-ID
+REALTIME_HISTORY_SIZE = int(os.getenv("REALTIME_HISTORY_SIZE", "1000"))
+
+# Bus d'événements temps réel: InMemoryBus (un processus) ou UnixSocketBus
+# (plusieurs workers, avec `manage.py realtime_hub`)
+REALTIME_EVENT_BUS = os.getenv("REALTIME_EVENT_BUS", "inondation.eventbus.InMemoryBus")
+REALTIME_BUS_SOCKET = os.getenv("REALTIME_BUS_SOCKET", "/tmp/sentinelle-realtime.sock")
+
+# Ingestion en masse des mesures (POST /api/mesures/bulk/)
+MESURE_BULK_MAX_ROWS = int(os.getenv("MESURE_BULK_MAX_ROWS", "50000"))
+MESURE_BULK_CHUNK_SIZE = int(os.getenv("MESURE_BULK_CHUNK_SIZE", "1000"))
+
+# Rétention des mesures brutes (jours, 0 = conservées indéfiniment), par défaut
+# et par type de capteur ("niveau_eau:90,pluviométrie:730"). Les mesures expirées
+# sont déplacées par `manage.py archive_mesures` dans des fichiers mensuels gzip.
+MESURE_RETENTION_DAYS = int(os.getenv("MESURE_RETENTION_DAYS", "365"))
+MESURE_RETENTION_BY_TYPE = {
+    key.strip(): int(days)
+    for key, _, days in (item.rpartition(":") for item in os.getenv("MESURE_RETENTION_BY_TYPE", "").split(","))
+    if key.strip()
+}
+MESURE_ARCHIVE_DIR = Path(os.getenv("MESURE_ARCHIVE_DIR", BASE_DIR / "archives"))
+MESURE_ARCHIVE_BATCH_SIZE = int(os.getenv("MESURE_ARCHIVE_BATCH_SIZE", "5000"))
+
+# Stockage compact des mesures (SQLite): horodatage en secondes epoch et valeur
+# en entier à MESURE_COMPACT_DECIMALS décimales. Une base existante se convertit
+# avec `manage.py mesure_storage --to compact` (application arrêtée).
+MESURE_COMPACT_STORAGE = os.getenv("MESURE_COMPACT_STORAGE", "0") == "1"
+MESURE_COMPACT_DECIMALS = int(os.getenv("MESURE_COMPACT_DECIMALS", "3"))
+
+# Démon d'ingestion des capteurs (`manage.py ingest_daemon`): lots écrits dès
+# INGEST_DAEMON_BATCH_SIZE relevés ou après INGEST_DAEMON_FLUSH_SECONDS ;
+# contre-pression au-delà de INGEST_DAEMON_MAX_PENDING relevés en attente.
+# Les relevés qui ne peuvent pas être écrits (base indisponible après
+# INGEST_DAEMON_MAX_RETRIES essais, relevé qui fait échouer son lot) sont
+# ajoutés à INGEST_DAEMON_DEAD_LETTER (JSON, un relevé par ligne).
+INGEST_DAEMON_BATCH_SIZE = int(os.getenv("INGEST_DAEMON_BATCH_SIZE", "5000"))
+INGEST_DAEMON_FLUSH_SECONDS = float(os.getenv("INGEST_DAEMON_FLUSH_SECONDS", "1.0"))
+INGEST_DAEMON_MAX_PENDING = int(os.getenv("INGEST_DAEMON_MAX_PENDING", "100000"))
+INGEST_DAEMON_MAX_RETRIES = int(os.getenv("INGEST_DAEMON_MAX_RETRIES", "10"))
+INGEST_DAEMON_DEAD_LETTER = Path(os.getenv("INGEST_DAEMON_DEAD_LETTER", BASE_DIR / "ingest_dead_letter.jsonl"))
+
+# Cache de la liste publique des alertes (inondation/feedcache.py): locmem (par processus)
+# ou file (partagé entre workers, ALERTE_CACHE_DIR)
+ALERTE_CACHE_BACKEND = os.getenv("ALERTE_CACHE_BACKEND", "locmem")
+ALERTE_CACHE_TTL = int(os.getenv("ALERTE_CACHE_TTL", "300"))
+ALERTE_CACHE_LOCK_SECONDS = float(os.getenv("ALERTE_CACHE_LOCK_SECONDS", "10"))
+ALERTE_CACHE_WAIT_SECONDS = float(os.getenv("ALERTE_CACHE_WAIT_SECONDS", "2"))
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "alertes": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache"
+        if ALERTE_CACHE_BACKEND == "file" else "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": os.getenv("ALERTE_CACHE_DIR", str(BASE_DIR / "cache" / "alertes"))
+        if ALERTE_CACHE_BACKEND == "file" else "alertes",
+        "TIMEOUT": ALERTE_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
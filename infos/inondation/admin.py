@@ -4,9 +4,11 @@ from .models import Signalement, SignalementPhoto
 # Enregistrer uniquement les nouveaux modèles ajoutés par nos changements
 admin.site.register(Signalement)
 admin.site.register(SignalementPhoto)
-from .models import Localisation, Capteur, Mesure, Alerte
+from .models import Localisation, Capteur, Mesure, Alerte, Seuil, ArchiveMesure
 
 admin.site.register(Localisation)
 admin.site.register(Capteur)
 admin.site.register(Mesure)
 admin.site.register(Alerte)
+admin.site.register(Seuil)
+admin.site.register(ArchiveMesure)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class InondationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inondation'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (branche les receivers post_save)
+        from . import storage  # noqa: F401  (contrôle du mode de stockage des mesures)
+        from . import search  # noqa: F401  (contrôle de l'index de recherche des alertes)
@@ -0,0 +1,173 @@
+"""Rétention des mesures brutes et archives mensuelles.
+
+Les mesures plus anciennes que la durée de rétention de leur type de capteur
+(MESURE_RETENTION_DAYS, MESURE_RETENTION_BY_TYPE) sont déplacées par lots
+bornés dans des fichiers mensuels `mesures-AAAA-MM.csv.gz` (MESURE_ARCHIVE_DIR):
+
+  - chaque lot est lu, ajouté au fichier du mois sous forme d'un bloc gzip
+    indépendant (un fichier gzip peut enchaîner plusieurs blocs), écrit sur
+    disque (fsync), puis indexé (ArchiveMesure) et supprimé de la base dans
+    une courte transaction: la base n'est verrouillée que le temps d'un lot ;
+  - l'index fait foi: un bloc écrit mais pas indexé (arrêt entre les deux
+    étapes) est tronqué au lot suivant, ses mesures étant toujours en base.
+
+Les agrégats (MesureRollup) et le dernier relevé (DerniereMesure) ne sont pas
+touchés: les séries à la minute, à l'heure ou au jour restent servies. `read()`
+relit les mesures archivées d'un capteur et d'une période via l'index, sans
+décompresser les autres blocs.
+"""
+import csv
+import io
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import ArchiveMesure, Capteur, Mesure
+
+HEADER = ("id", "capteur_id", "capteur", "date_releve", "valeur", "unite")
+
+
+def retention_days(type_capteur: str) -> int:
+    return settings.MESURE_RETENTION_BY_TYPE.get(type_capteur, settings.MESURE_RETENTION_DAYS)
+
+
+def expired_groups(now: datetime = None):
+    """[(limite, [capteur_id])]: capteurs regroupés par date limite de rétention."""
+    now = now or timezone.now()
+    groups = defaultdict(list)
+    for capteur_id, type_capteur in Capteur.objects.values_list("id", "type_capteur").order_by("id"):
+        days = retention_days(type_capteur)
+        if days > 0:
+            groups[now - timedelta(days=days)].append(capteur_id)
+    return sorted(groups.items())
+
+
+def archive_dir():
+    path = settings.MESURE_ARCHIVE_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _month_file(date: datetime) -> str:
+    return f"mesures-{date:%Y-%m}.csv.gz"
+
+
+def _encode(rows) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HEADER)
+    writer.writerows((pk, cid, code, date.isoformat(), valeur, unite) for pk, cid, code, date, valeur, unite in rows)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)  # bloc gzip autonome
+    return compressor.compress(buf.getvalue().encode("utf-8")) + compressor.flush()
+
+
+def _append(fichier: str, data: bytes) -> int:
+    """Ajoute un bloc au fichier, après la fin du dernier bloc indexé ; renvoie son offset."""
+    end = ArchiveMesure.objects.filter(fichier=fichier).aggregate(end=Max(F("offset") + F("taille")))["end"] or 0
+    path = os.path.join(archive_dir(), fichier)
+    with open(path, "ab") as out:
+        out.truncate(end)  # bloc orphelin d'un lot interrompu ; l'ajout repart de `end`
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    return end
+
+
+def archive_batch(capteur_ids, before: datetime, batch_size: int) -> int:
+    """Archive puis supprime au plus `batch_size` mesures expirées ; renvoie leur nombre."""
+    rows = list(
+        Mesure.objects.filter(capteur_id__in=capteur_ids, date_releve__lt=before)
+        .order_by("date_releve", "id")
+        .values_list("id", "capteur_id", "capteur__code", "date_releve", "valeur", "capteur__unite")[:batch_size]
+    )
+    if not rows:
+        return 0
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[_month_file(row[3])].append(row)
+
+    for fichier, month_rows in by_month.items():
+        data = _encode(month_rows)
+        offset = _append(fichier, data)
+        dates = defaultdict(list)
+        for row in month_rows:
+            dates[row[1]].append(row[3])
+        with transaction.atomic():
+            ArchiveMesure.objects.bulk_create([
+                ArchiveMesure(capteur_id=cid, fichier=fichier, offset=offset, taille=len(data),
+                              debut=min(values), fin=max(values), nombre=len(values))
+                for cid, values in dates.items()
+            ])
+            Mesure.objects.filter(id__in=[row[0] for row in month_rows]).delete()
+    return len(rows)
+
+
+def prune(now: datetime = None, batch_size: int = None, pause: float = 0.0, limit: int = None, log=None) -> int:
+    """Archive toutes les mesures expirées par lots ; renvoie le nombre de mesures déplacées."""
+    batch_size = batch_size or settings.MESURE_ARCHIVE_BATCH_SIZE
+    moved = 0
+    for before, capteur_ids in expired_groups(now):
+        while limit is None or moved < limit:
+            size = batch_size if limit is None else min(batch_size, limit - moved)
+            n = archive_batch(capteur_ids, before, size)
+            if not n:
+                break
+            moved += n
+            if log:
+                log(moved)
+            if pause:
+                time.sleep(pause)  # laisse passer les écritures de l'ingestion entre deux lots
+    return moved
+
+
+def count_expired(now: datetime = None) -> int:
+    return sum(
+        Mesure.objects.filter(capteur_id__in=ids, date_releve__lt=before).count()
+        for before, ids in expired_groups(now)
+    )
+
+
+def read(capteur_ids=None, start: datetime = None, end: datetime = None):
+    """Mesures archivées (id, capteur_id, code, date_releve, valeur, unite), bloc par bloc."""
+    segments = ArchiveMesure.objects.all()
+    if capteur_ids is not None:
+        segments = segments.filter(capteur_id__in=capteur_ids)
+    if start is not None:
+        segments = segments.filter(fin__gte=start)
+    if end is not None:
+        segments = segments.filter(debut__lt=end)
+    blocks = sorted({
+        (debut, fichier, offset, taille)
+        for debut, fichier, offset, taille in segments.values_list("debut", "fichier", "offset", "taille")
+    })
+    wanted = set(capteur_ids) if capteur_ids is not None else None
+    seen = set()
+    for _, fichier, offset, taille in blocks:
+        if (fichier, offset) in seen:
+            continue
+        seen.add((fichier, offset))
+        with open(os.path.join(settings.MESURE_ARCHIVE_DIR, fichier), "rb") as f:
+            f.seek(offset)
+            data = zlib.decompress(f.read(taille), 31)
+        reader = csv.reader(io.StringIO(data.decode("utf-8")))
+        next(reader)
+        for pk, cid, code, date, valeur, unite in reader:
+            cid = int(cid)
+            if wanted is not None and cid not in wanted:
+                continue
+            date = datetime.fromisoformat(date)
+            if (start is not None and date < start) or (end is not None and date >= end):
+                continue
+            yield int(pk), cid, code, date, float(valeur), unite
+
+
+def horizon(capteur_id):
+    """Date du dernier relevé archivé du capteur (None si rien n'est archivé)."""
+    return ArchiveMesure.objects.filter(capteur_id=capteur_id).aggregate(fin=Max("fin"))["fin"]
@@ -0,0 +1,27 @@
+"""Écritures en masse.
+
+`bulk_update` de Django génère un `CASE WHEN pk = ... THEN ...` par ligne et
+par champ: la requête et son analyse grossissent avec le lot (plus de 2 s
+pour 1000 agrégats). Ici, une seule requête préparée exécutée pour chaque
+ligne (`executemany`).
+"""
+from django.db import connection
+
+
+def update_rows(model, objs, fields):
+    """UPDATE de `fields` pour chaque objet (par clé primaire) ; auto_now n'est pas appliqué."""
+    if not objs:
+        return
+    meta = model._meta
+    qn = connection.ops.quote_name
+    columns = [meta.get_field(name) for name in fields]
+    sql = (
+        f"UPDATE {qn(meta.db_table)} SET {', '.join(f'{qn(f.column)} = %s' for f in columns)} "
+        f"WHERE {qn(meta.pk.column)} = %s"
+    )
+    params = [
+        [f.get_db_prep_save(getattr(obj, f.attname), connection) for f in columns] + [obj.pk]
+        for obj in objs
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
@@ -0,0 +1,202 @@
+"""Carte des alertes et signalements en GeoJSON (GET /api/carte/), regroupés côté serveur.
+
+Index en grille multi-résolution:
+  - chaque Localisation porte son geohash, calculé à l'enregistrement ;
+  - CarteCellule garde, par couche et pour chaque préfixe de longueur 1 à
+    MAX_PRECISION, le nombre de points et la somme de leurs coordonnées
+    (barycentre = somme / nombre).
+Les receivers de signals.py le tiennent à jour à chaque création,
+suppression ou changement de localisation d'une alerte / d'un signalement,
+et au déplacement d'une localisation. Les écritures qui contournent save()
+/ delete() (bulk_create, update()) demandent `rebuild()`
+(`manage.py carte_index --rebuild`).
+
+Pour une bbox et un zoom, la précision retenue est celle dont les cellules
+font environ CLUSTER_PX pixels à l'écran ; les cellules de la bbox sont
+lues dans CarteCellule (plages de geohash indexées, sans parcourir les
+points) et donnent un cluster chacune. Les cellules d'un seul point, et
+toutes au-delà de DETAIL_ZOOM, sont remplacées par les points eux-mêmes.
+"""
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.functions import Substr
+
+from notifications.geo import cell_size, covering_cells, prefix_filter
+
+from .models import Alerte, CarteCellule, Localisation, Signalement
+
+LAYERS = {'alertes': Alerte, 'signalements': Signalement}
+MAX_PRECISION = 8   # ~38 m x 19 m
+CLUSTER_PX = 60     # taille visée d'une cellule à l'écran
+TILE_PX = 256
+DETAIL_ZOOM = 17
+MAX_FEATURES = 2000
+
+
+def apply(layer: str, geohash: str, lat: float, lng: float, delta: int):
+    """Ajoute (delta > 0) ou retire (delta < 0) des points à une position, à toutes les précisions."""
+    if not geohash or not delta:
+        return
+    table = connection.ops.quote_name(CarteCellule._meta.db_table)
+    rows = [(layer, p, geohash[:p], delta, lat * delta, lng * delta) for p in range(1, MAX_PRECISION + 1)]
+    with connection.cursor() as cursor:
+        if delta > 0:
+            cursor.executemany(
+                f"INSERT INTO {table} (couche, precision, cellule, nombre, somme_lat, somme_lng) "
+                "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (couche, precision, cellule) DO UPDATE SET "
+                f"nombre = {table}.nombre + excluded.nombre, somme_lat = {table}.somme_lat + excluded.somme_lat, "
+                f"somme_lng = {table}.somme_lng + excluded.somme_lng",
+                rows,
+            )
+            return
+        cursor.executemany(
+            f"UPDATE {table} SET nombre = nombre + %s, somme_lat = somme_lat + %s, somme_lng = somme_lng + %s "
+            "WHERE couche = %s AND precision = %s AND cellule = %s",
+            [(n, slat, slng, couche, p, cell) for couche, p, cell, n, slat, slng in rows],
+        )
+        cursor.execute(
+            f"DELETE FROM {table} WHERE couche = %s AND cellule IN ({', '.join(['%s'] * len(rows))}) AND nombre <= 0",
+            [layer, *(row[2] for row in rows)],
+        )
+
+
+def position(localisation_id):
+    """(geohash, lat, lng) d'une localisation, None si elle n'existe plus."""
+    return Localisation.objects.filter(pk=localisation_id).values_list('geohash', 'latitude', 'longitude').first()
+
+
+def moved(layer: str, old_localisation_id, new_localisation_id):
+    """Un point change de localisation (None: création ou suppression)."""
+    if old_localisation_id == new_localisation_id:
+        return
+    for localisation_id, delta in ((old_localisation_id, -1), (new_localisation_id, 1)):
+        pos = position(localisation_id) if localisation_id is not None else None
+        if pos is not None:
+            apply(layer, *pos, delta)
+
+
+def localisation_moved(localisation, old):
+    """Une localisation change de coordonnées: ses alertes et signalements la suivent."""
+    for layer, model in LAYERS.items():
+        n = model.objects.filter(localisation_id=localisation.pk).count()
+        if n:
+            apply(layer, *old, -n)
+            apply(layer, localisation.geohash, localisation.latitude, localisation.longitude, n)
+
+
+def rebuild(conn=None) -> int:
+    """Recalcule tout l'index depuis les alertes et signalements ; renvoie le nombre de cellules."""
+    conn = conn or connection
+    table = conn.ops.quote_name(CarteCellule._meta.db_table)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        for layer, model in LAYERS.items():
+            for p in range(1, MAX_PRECISION + 1):
+                cursor.execute(
+                    f"INSERT INTO {table} (couche, precision, cellule, nombre, somme_lat, somme_lng) "
+                    "SELECT %s, %s, substr(l.geohash, 1, %s), COUNT(*), SUM(l.latitude), SUM(l.longitude) "
+                    f"FROM {conn.ops.quote_name(model._meta.db_table)} t "
+                    "JOIN inondation_localisation l ON l.id = t.localisation_id "
+                    "WHERE l.geohash <> '' GROUP BY substr(l.geohash, 1, %s)",
+                    [layer, p, p, p],
+                )
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Précision geohash dont les cellules font au plus ~CLUSTER_PX pixels au zoom donné."""
+    target = 360.0 / (1 << zoom) * CLUSTER_PX / TILE_PX  # degrés de longitude
+    for p in range(1, MAX_PRECISION + 1):
+        if cell_size(p)[1] <= target:
+            return p
+    return MAX_PRECISION
+
+
+def _prefixes(bbox, precision):
+    """Préfixes geohash (au plus `precision` caractères) couvrant la bbox."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return sorted({c[:precision] for c in covering_cells(min_lat, min_lng, max_lat, max_lng)})
+
+
+def clusters(layer, bbox, precision):
+    """(cellule, nombre, lat, lng) des cellules de la bbox, depuis l'index seul."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return list(
+        CarteCellule.objects
+        .filter(prefix_filter('cellule', _prefixes(bbox, precision)), couche=layer, precision=precision)
+        .annotate(lat=ExpressionWrapper(F('somme_lat') / F('nombre'), output_field=FloatField()),
+                  lng=ExpressionWrapper(F('somme_lng') / F('nombre'), output_field=FloatField()))
+        .filter(nombre__gt=0, lat__range=(min_lat, max_lat), lng__range=(min_lng, max_lng))
+        .values_list('cellule', 'nombre', 'lat', 'lng')
+    )
+
+
+def _points_queryset(layer, bbox):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    model = LAYERS[layer]
+    return model.objects.filter(
+        prefix_filter('localisation__geohash', _prefixes(bbox, MAX_PRECISION + 1)),
+        localisation__latitude__range=(min_lat, max_lat),
+        localisation__longitude__range=(min_lng, max_lng),
+    )
+
+
+def _point_feature(layer, row):
+    if layer == 'alertes':
+        pk, lat, lng, niveau, message, date, lieu = row
+        properties = {'niveau': niveau, 'message': message, 'date_alerte': date, 'lieu': lieu}
+    else:
+        pk, lat, lng, status, severity, type_incident, alerte_id, created_at = row
+        properties = {'status': status, 'severity': severity, 'type_incident': type_incident,
+                      'alerte_id': alerte_id, 'created_at': created_at}
+    return {
+        'type': 'Feature',
+        'id': f"{layer}.{pk}",
+        'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+        'properties': {'layer': layer, 'id': pk, **properties},
+    }
+
+
+POINT_FIELDS = {
+    'alertes': ('niveau', 'message', 'date_alerte', 'localisation__nom'),
+    'signalements': ('status', 'severity', 'type_incident', 'alerte_id', 'created_at'),
+}
+
+
+def points(layer, bbox, cells=None, precision=None):
+    """Points de la bbox (limités aux cellules `cells` de longueur `precision` si fournies)."""
+    qs = _points_queryset(layer, bbox)
+    if cells is not None:
+        qs = qs.annotate(cellule=Substr('localisation__geohash', 1, precision)).filter(cellule__in=cells)
+    rows = qs.order_by('-id').values_list(
+        'id', 'localisation__latitude', 'localisation__longitude', *POINT_FIELDS[layer]
+    )[:MAX_FEATURES]
+    return [_point_feature(layer, row) for row in rows]
+
+
+def features(bbox, zoom: int, layers):
+    """FeatureCollection GeoJSON: clusters et points de la bbox (min_lng, min_lat, max_lng, max_lat)."""
+    out = []
+    precision = precision_for_zoom(zoom)
+    for layer in layers:
+        if zoom >= DETAIL_ZOOM:
+            out.extend(points(layer, bbox))
+            continue
+        found = clusters(layer, bbox, precision)
+        p = precision
+        while len(found) > MAX_FEATURES and p > 1:  # bbox bien plus grande que l'écran: grille plus grossière
+            p -= 1
+            found = clusters(layer, bbox, p)
+        singles = [cell for cell, n, _, _ in found if n == 1]
+        for cell, n, lat, lng in found:
+            if n > 1:
+                out.append({
+                    'type': 'Feature',
+                    'id': f"{layer}.{cell}",
+                    'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                    'properties': {'layer': layer, 'cluster': True, 'count': n, 'cell': cell},
+                })
+        if singles:
+            out.extend(points(layer, bbox, singles, p))
+    return {'type': 'FeatureCollection', 'features': out}
@@ -0,0 +1,410 @@
+"""Démon d'ingestion des capteurs (`manage.py ingest_daemon`).
+
+Les capteurs gardent une connexion ouverte (TCP ou socket Unix) ou envoient
+des datagrammes UDP, au lieu d'un POST HTTP par relevé. Deux formats:
+
+  - lignes: un objet JSON par ligne (mêmes champs que l'ingestion en masse,
+    cf. ingest.py), ou `code,valeur[,epoch]` ;
+  - binaire: une connexion (ou un datagramme) qui commence par ingest.MAGIC,
+    suivie d'enregistrements de 12 octets.
+
+Les relevés sont mis en tampon puis écrits par un thread unique, par lots
+(`ingest` / `ingest_records`: mêmes validations, agrégats, seuils et flux
+temps réel), dès que le tampon atteint `batch_size` ou que le plus ancien
+relevé attend depuis `flush_interval`.
+
+Contre-pression: au-delà de `max_pending` relevés en attente (base qui ne
+suit pas), les connexions ne sont plus lues (le noyau puis les capteurs
+ralentissent d'eux-mêmes) jusqu'à ce que le tampon redescende à la moitié ;
+les datagrammes UDP, eux, sont comptés comme perdus.
+
+Échecs d'écriture: une erreur de base (verrouillée, connexion perdue) est
+retentée au plus `max_retries` fois, le lot restant compté dans le tampon ;
+toute autre erreur vient des données: le lot est coupé en deux jusqu'à isoler
+le ou les relevés fautifs, les autres sont écrits. Les relevés qui ne peuvent
+pas être écrits sont ajoutés au fichier `dead_letter` (un objet JSON par
+ligne: les relevés texte tels que reçus, rejouables par l'ingestion en masse
+NDJSON ; les relevés binaires en capteur_id, timestamp, valeur).
+
+Une ligne `stats` sur une connexion renvoie les métriques en JSON:
+profondeur du tampon, relevés reçus/écrits/rejetés/perdus, latence des
+écritures, temps passé en contre-pression.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from django.db import InterfaceError, OperationalError, close_old_connections
+from rest_framework.exceptions import ParseError
+
+from .ingest import MAGIC, RECORD_DTYPE, ingest, ingest_records, parse_records
+from .stats import percentile
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE = 64 * 1024  # octets sans fin de ligne avant de couper la connexion
+READ_SIZE = 64 * 1024
+
+
+def parse_line(line: bytes):
+    """Ligne texte -> relevé (dict pour `ingest`) ; None si illisible."""
+    line = line.strip()
+    if not line:
+        return None
+    if line[:1] == b"{":
+        try:
+            row = json.loads(line)
+        except ValueError:
+            return None
+        return row if isinstance(row, dict) else None
+    parts = line.decode("utf-8", "replace").split(",")
+    if len(parts) not in (2, 3):
+        return None
+    row = {"capteur": parts[0].strip(), "valeur": parts[1].strip()}
+    if len(parts) == 3:
+        row["date_releve"] = parts[2].strip()
+    return row
+
+
+class Metrics:
+    def __init__(self):
+        self.received = 0
+        self.written = 0
+        self.rejected = 0
+        self.malformed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dead_letter = 0
+        self.connections = 0
+        self.paused_seconds = 0.0
+        self.max_depth = 0
+        self.started = time.time()
+        self._latencies = deque(maxlen=1000)  # durée des derniers lots
+
+    def flushed(self, seconds, report):
+        self.flushes += 1
+        self.written += report["created"]
+        self.rejected += len(report["rejected"])
+        self._latencies.append(seconds)
+
+    def as_dict(self, depth):
+        latencies = sorted(self._latencies)
+        uptime = time.time() - self.started
+        return {
+            "uptime_s": round(uptime, 1),
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "written": self.written,
+            "written_per_s": round(self.written / uptime, 1) if uptime else 0.0,
+            "rejected": self.rejected,
+            "malformed": self.malformed,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dead_letter": self.dead_letter,
+            "connections": self.connections,
+            "paused_s": round(self.paused_seconds, 3),
+            "flush_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            },
+        }
+
+
+class Buffer:
+    """Relevés en attente d'écriture, partagés entre la boucle réseau et le thread d'écriture."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.rows = []      # relevés texte -> ingest()
+        self.records = []   # tableaux binaires -> ingest_records()
+        self.pending = 0    # relevés en tampon + lot en cours d'écriture
+        self.oldest = None  # time.monotonic() du plus ancien relevé en attente
+        self.cond = threading.Condition()
+
+    def add(self, rows=None, records=None) -> int:
+        n = len(rows or ()) + len(records if records is not None else ())
+        if not n:
+            return 0
+        with self.cond:
+            if rows:
+                self.rows.extend(rows)
+            if records is not None and len(records):
+                self.records.append(records)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.pending += n
+            self.cond.notify()
+        return n
+
+    def full(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def drained(self) -> bool:
+        return self.pending <= self.max_pending // 2
+
+    def take(self):
+        """Vide le tampon (appelé sous self.cond) ; le compte `pending` baisse après écriture."""
+        rows, records = self.rows, self.records
+        self.rows, self.records, self.oldest = [], [], None
+        return rows, records
+
+
+class IngestDaemon:
+    def __init__(self, batch_size: int = 5000, flush_interval: float = 1.0, max_pending: int = 100000,
+                 retry_seconds: float = 1.0, max_retries: int = 10, dead_letter=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_seconds = retry_seconds
+        self.max_retries = max_retries
+        self.dead_letter = dead_letter  # chemin du fichier des relevés non écrits (None: journal seulement)
+        self.buffer = Buffer(max_pending)
+        self.metrics = Metrics()
+        self._stopping = False
+        self._inflight = 0
+        self._loop = None
+        self._resume = None  # asyncio.Event: tampon redescendu sous le seuil bas
+        self._paused_since = None
+        self._writer = threading.Thread(target=self._write_loop, name="ingest-writer", daemon=True)
+
+    # --- réseau (boucle asyncio) ----------------------------------------------
+
+    def _accepted(self, n):
+        self.metrics.received += n
+        if self.buffer.pending > self.metrics.max_depth:
+            self.metrics.max_depth = self.buffer.pending
+
+    async def _backpressure(self):
+        if not self.buffer.full():
+            return
+        if self._paused_since is None:
+            self._paused_since = time.monotonic()
+        self._resume.clear()
+        while not self.buffer.drained() and not self._stopping:
+            await self._resume.wait()
+            self._resume.clear()
+        if self._paused_since is not None:  # première connexion relancée: durée de la pause, une fois
+            self.metrics.paused_seconds += time.monotonic() - self._paused_since
+            self._paused_since = None
+
+    def _lines(self, data: bytes):
+        rows = []
+        for line in data.split(b"\n"):
+            row = parse_line(line)
+            if row is not None:
+                rows.append(row)
+            elif line.strip():
+                self.metrics.malformed += 1
+        return rows
+
+    async def handle_stream(self, reader, writer):
+        self.metrics.connections += 1
+        try:
+            try:
+                head = await reader.readexactly(len(MAGIC))
+            except asyncio.IncompleteReadError as exc:  # connexion plus courte que l'en-tête
+                head = exc.partial
+            if head == MAGIC:
+                await self._binary_stream(reader)
+            else:
+                await self._line_stream(reader, writer, head)
+        except ConnectionError:
+            pass
+        finally:
+            self.metrics.connections -= 1
+            writer.close()
+
+    async def _line_stream(self, reader, writer, tail: bytes):
+        while True:
+            await self._backpressure()
+            data = await reader.read(READ_SIZE)
+            if not data:
+                break
+            complete, _, tail = (tail + data).rpartition(b"\n")
+            if len(tail) > MAX_LINE:
+                self.metrics.malformed += 1
+                break
+            if not complete:
+                continue
+            if complete.strip() == b"stats":
+                writer.write(json.dumps(self.stats()).encode() + b"\n")
+                await writer.drain()
+                continue
+            self._accepted(self.buffer.add(rows=self._lines(complete)))
+        if tail.strip():
+            self._accepted(self.buffer.add(rows=self._lines(tail)))
+
+    async def _binary_stream(self, reader):
+        size = RECORD_DTYPE.itemsize
+        tail = b""
+        while True:
+            await self._backpressure()
+            data = await reader.read(READ_SIZE)
+            if not data:
+                break
+            data = tail + data
+            cut = len(data) - len(data) % size
+            tail = data[cut:]
+            if cut:
+                self._accepted(self.buffer.add(records=np.frombuffer(data[:cut], dtype=RECORD_DTYPE)))
+        if tail:
+            self.metrics.malformed += 1  # enregistrement tronqué
+
+    def datagram(self, data: bytes):
+        """Un datagramme UDP: binaire (MAGIC) ou lignes. Pas de contre-pression possible: perdu si plein."""
+        if data[:len(MAGIC)] == MAGIC:
+            try:
+                records, rows = parse_records(data), None
+            except ParseError:
+                self.metrics.malformed += 1
+                return
+        else:
+            records, rows = None, self._lines(data)
+        if self.buffer.full():
+            self.metrics.dropped += len(rows or ()) + (len(records) if records is not None else 0)
+            return
+        self._accepted(self.buffer.add(rows=rows, records=records))
+
+    # --- écriture (thread) ----------------------------------------------------
+
+    def _write_loop(self):
+        buffer = self.buffer
+        while True:
+            with buffer.cond:
+                while not self._stopping:
+                    if buffer.pending >= self.batch_size:
+                        break
+                    if buffer.oldest is not None and time.monotonic() - buffer.oldest >= self.flush_interval:
+                        break
+                    timeout = self.flush_interval
+                    if buffer.oldest is not None:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - buffer.oldest))
+                    buffer.cond.wait(timeout)
+                rows, records = buffer.take()
+                self._inflight = len(rows) + sum(len(r) for r in records)
+            if self._inflight:
+                self._flush(rows, records)
+            with buffer.cond:
+                buffer.pending -= self._inflight
+                self._inflight = 0
+                stop = self._stopping and not buffer.pending
+            if self._loop is not None and buffer.drained():
+                try:
+                    self._loop.call_soon_threadsafe(self._resume.set)
+                except RuntimeError:  # boucle déjà fermée (arrêt)
+                    pass
+            if stop:
+                return
+
+    def _flush(self, rows, records):
+        binary = np.concatenate(records) if records else None
+        batches = [(ingest, rows[i:i + self.batch_size]) for i in range(0, len(rows), self.batch_size)]
+        if binary is not None:
+            batches += [(ingest_records, binary[i:i + self.batch_size])
+                         for i in range(0, len(binary), self.batch_size)]
+        for fn, batch in batches:
+            self._write(fn, batch)
+
+    def _write(self, fn, batch):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                report = fn(batch)
+            except ParseError as exc:
+                self.metrics.rejected += len(batch)
+                logger.warning("ingest_daemon: lot de %d relevés refusé: %s", len(batch), exc)
+                return
+            except (OperationalError, InterfaceError):
+                # Base indisponible ou verrouillée: le lot est retenté, le tampon se remplit
+                self.metrics.failures += 1
+                attempt += 1
+                logger.exception("ingest_daemon: échec d'écriture d'un lot de %d relevés (essai %d)",
+                                 len(batch), attempt)
+                close_old_connections()
+                if self._stopping or attempt > self.max_retries:
+                    self._set_aside(fn, batch, "base indisponible")
+                    return
+                time.sleep(self.retry_seconds)
+                continue
+            except Exception:
+                # Erreur due aux données: on coupe le lot pour écrire les relevés sains
+                self.metrics.failures += 1
+                logger.exception("ingest_daemon: échec d'écriture d'un lot de %d relevés", len(batch))
+                if len(batch) == 1:
+                    self._set_aside(fn, batch, "relevé en échec")
+                else:
+                    half = len(batch) // 2
+                    self._write(fn, batch[:half])
+                    self._write(fn, batch[half:])
+                return
+            self.metrics.flushed(time.perf_counter() - started, report)
+            return
+
+    def _set_aside(self, fn, batch, reason):
+        """Relevés non écrits: comptés, journalisés et ajoutés au fichier `dead_letter`."""
+        self.metrics.dead_letter += len(batch)
+        logger.error("ingest_daemon: %d relevés non écrits (%s)", len(batch), reason)
+        if self.dead_letter is None:
+            return
+        if fn is ingest:
+            lines = [json.dumps(row, default=str) for row in batch]
+        else:
+            lines = [
+                json.dumps({"capteur_id": int(c), "timestamp": int(t), "valeur": float(v)})
+                for c, t, v in batch.tolist()
+            ]
+        try:
+            with open(self.dead_letter, "a", encoding="utf-8") as out:
+                out.write("\n".join(lines) + "\n")
+        except OSError:
+            logger.exception("ingest_daemon: écriture impossible dans %s", self.dead_letter)
+
+    # --- cycle de vie -----------------------------------------------------------
+
+    def stats(self):
+        return self.metrics.as_dict(self.buffer.pending)
+
+    async def serve(self, host=None, tcp_port=None, udp_port=None, unix_path=None, ready=None):
+        self._loop = asyncio.get_running_loop()
+        self._resume = asyncio.Event()
+        self._writer.start()
+        servers = []
+        if tcp_port is not None:
+            servers.append(await asyncio.start_server(self.handle_stream, host, tcp_port))
+        if unix_path is not None:
+            servers.append(await asyncio.start_unix_server(self.handle_stream, path=unix_path))
+        transport = None
+        if udp_port is not None:
+            daemon = self
+
+            class Datagrams(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    daemon.datagram(data)
+
+            transport, _ = await self._loop.create_datagram_endpoint(
+                Datagrams, local_addr=(host or "0.0.0.0", udp_port),
+            )
+        if ready is not None:
+            ready.set()
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in servers), asyncio.Event().wait())
+        finally:
+            for s in servers:
+                s.close()
+            if transport is not None:
+                transport.close()
+
+    def stop(self, timeout: float = 30.0):
+        """Arrête l'écriture après avoir vidé le tampon."""
+        with self.buffer.cond:
+            self._stopping = True
+            self.buffer.cond.notify()
+        self._writer.join(timeout)
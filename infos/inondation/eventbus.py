@@ -0,0 +1,202 @@
+"""Bus d'événements derrière le flux temps réel.
+
+Les signaux publient sur le bus ; le bus remet chaque événement au
+`broadcaster` de *chaque* processus serveur. Backend choisi par
+`settings.REALTIME_EVENT_BUS`:
+
+  - "inondation.eventbus.InMemoryBus" (défaut): un seul processus, remise directe ;
+  - "inondation.eventbus.UnixSocketBus": plusieurs workers gunicorn/uvicorn.
+    Un hub (`manage.py realtime_hub`) écoute sur `REALTIME_BUS_SOCKET` ; chaque
+    worker s'y connecte, y publie ses événements une fois et reçoit ceux de
+    tous les workers. Le hub numérote les événements: les ids SSE (et donc le
+    rejeu Last-Event-ID) sont cohérents d'un worker à l'autre.
+
+Chaque bus mesure la latence de bout en bout (publication -> remise locale).
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .realtime import broadcaster
+from .stats import percentile
+
+
+HELLO = {"hello": 1}
+MAX_CLIENT_BUFFER = 8 * 1024 * 1024  # octets en attente d'envoi vers un worker
+
+
+class BaseBus:
+    def __init__(self, on_event=None):
+        self.on_event = on_event or broadcaster.publish
+        self.received = 0
+        self._latencies = deque(maxlen=1000)
+
+    def start(self):
+        pass
+
+    def publish(self, event_type: str, payload: dict, topics=None, point=None, capteur=None):
+        raise NotImplementedError
+
+    def _deliver(self, message: dict, event_id: int = None):
+        self.received += 1
+        self._latencies.append(time.time() - message["sent_at"])
+        self.on_event(
+            message["type"], message["payload"],
+            topics=message.get("topics"), point=message.get("point"),
+            capteur=message.get("capteur"), event_id=event_id,
+        )
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "backend": type(self).__name__,
+            "received": self.received,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 3),
+                "p95": round(percentile(latencies, 95) * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            },
+        }
+
+
+class InMemoryBus(BaseBus):
+    def publish(self, event_type, payload, topics=None, point=None, capteur=None):
+        self._deliver({
+            "type": event_type, "payload": payload, "topics": topics,
+            "point": point, "capteur": capteur, "sent_at": time.time(),
+        })
+
+
+class UnixSocketBus(BaseBus):
+    RECONNECT_SECONDS = 1.0
+
+    def __init__(self, path: str = None, on_event=None):
+        super().__init__(on_event)
+        self.path = path or getattr(settings, "REALTIME_BUS_SOCKET", "/tmp/sentinelle-realtime.sock")
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._started = False
+        self._connected = threading.Event()
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            threading.Thread(target=self._run, name="realtime-bus", daemon=True).start()
+
+    def wait_connected(self, timeout: float = 5.0) -> bool:
+        return self._connected.wait(timeout)
+
+    def publish(self, event_type, payload, topics=None, point=None, capteur=None):
+        self.start()
+        message = {
+            "type": event_type, "payload": payload, "topics": topics,
+            "point": point, "capteur": capteur, "sent_at": time.time(),
+        }
+        line = (json.dumps(message, cls=DjangoJSONEncoder) + "\n").encode("utf-8")
+        with self._send_lock:
+            sock = self._sock
+            if sock is not None:
+                try:
+                    sock.sendall(line)
+                    return
+                except OSError:
+                    pass
+        # Hub injoignable: remise locale seulement (les autres workers ne la verront pas)
+        self._deliver(json.loads(line))
+
+    def _run(self):
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError:
+                time.sleep(self.RECONNECT_SECONDS)
+                continue
+            try:
+                lines = sock.makefile("rb")
+                # Le hub confirme l'inscription: à partir d'ici rien n'est manqué
+                if json.loads(lines.readline() or b"null") != HELLO:
+                    raise ValueError("réponse inattendue du hub")
+                with self._send_lock:
+                    self._sock = sock
+                self._connected.set()
+                for line in lines:
+                    message = json.loads(line)
+                    self._deliver(message, event_id=message.get("seq"))
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._connected.clear()
+                with self._send_lock:
+                    self._sock = None
+                sock.close()
+            time.sleep(self.RECONNECT_SECONDS)
+
+
+async def run_hub(path: str, ready: threading.Event = None):
+    """Hub du bus: numérote chaque message reçu et le renvoie à tous les workers."""
+    clients = set()
+    seq = int(time.time() * 1000)  # ids croissants même après un redémarrage du hub
+
+    async def handle(reader, writer):
+        nonlocal seq
+        clients.add(writer)
+        writer.write((json.dumps(HELLO) + "\n").encode("utf-8"))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                seq += 1
+                message["seq"] = seq
+                out = (json.dumps(message) + "\n").encode("utf-8")
+                for client in list(clients):
+                    if client.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                        # Worker bloqué: on le coupe, il se reconnectera
+                        clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(out)
+        except (ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Arrêt du hub avec des workers connectés: la connexion se termine
+            # normalement (sinon asyncio journalise une erreur par connexion)
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus() -> BaseBus:
+    """Bus du processus, créé et démarré à la première utilisation."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                path = getattr(settings, "REALTIME_EVENT_BUS", "inondation.eventbus.InMemoryBus")
+                bus = import_string(path)()
+                bus.start()
+                _bus = bus
+    return _bus
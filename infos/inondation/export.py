@@ -0,0 +1,164 @@
+"""Export en flux de l'historique des mesures.
+
+Les lignes (mesure + capteur + localisation) sont lues par
+`iterator(chunk_size=...)` et encodées au fil de l'eau: la mémoire reste
+constante quelle que soit la période exportée.
+
+Formats:
+  - csv    : CSV compressé gzip (toujours disponible) ;
+  - parquet: Apache Parquet, un row group par morceau ;
+  - arrow  : flux Arrow IPC.
+Parquet et Arrow demandent `pyarrow` (dépendance optionnelle, non requise
+par le reste de l'application).
+"""
+import csv
+import io
+import zlib
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # export colonnaire indisponible, CSV seulement
+    pyarrow = None
+
+from .models import Mesure
+
+COLUMNS = (
+    ("id", "id"),
+    ("capteur", "capteur__code"),
+    ("type_capteur", "capteur__type_capteur"),
+    ("localisation", "capteur__localisation__nom"),
+    ("latitude", "capteur__localisation__latitude"),
+    ("longitude", "capteur__localisation__longitude"),
+    ("date_releve", "date_releve"),
+    ("valeur", "valeur"),
+    ("unite", "capteur__unite"),
+)
+FORMATS = {
+    "csv": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+DEFAULT_CHUNK_SIZE = 20000
+
+
+class FormatUnavailable(Exception):
+    pass
+
+
+def available_formats():
+    return [f for f in FORMATS if f == "csv" or pyarrow is not None]
+
+
+def export_queryset(capteur_ids=None, start=None, end=None):
+    qs = Mesure.objects.all()
+    if capteur_ids is not None:
+        qs = qs.filter(capteur_id__in=capteur_ids)
+    if start is not None:
+        qs = qs.filter(date_releve__gte=start)
+    if end is not None:
+        qs = qs.filter(date_releve__lt=end)
+    return qs.order_by("date_releve", "id").values_list(*(field for _, field in COLUMNS))
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_gzip(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: en-tête et pied gzip
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in COLUMNS])
+    for chunk in _chunks(queryset, chunk_size):
+        writer.writerows((*row[:6], row[6].isoformat(), *row[7:]) for row in chunk)
+        data = compressor.compress(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate()
+        if data:
+            yield data
+    yield compressor.compress(buf.getvalue().encode("utf-8")) + compressor.flush()
+
+
+class _Sink(io.RawIOBase):
+    """Fichier en écriture seule dont on récupère le contenu au fur et à mesure."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _schema():
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("capteur", pyarrow.string()),
+        ("type_capteur", pyarrow.string()),
+        ("localisation", pyarrow.string()),
+        ("latitude", pyarrow.float64()),
+        ("longitude", pyarrow.float64()),
+        ("date_releve", pyarrow.timestamp("us", tz="UTC")),
+        ("valeur", pyarrow.float64()),
+        ("unite", pyarrow.string()),
+    ])
+
+
+def _columnar(queryset, chunk_size, open_writer):
+    schema = _schema()
+    sink = _Sink()
+    writer = open_writer(pyarrow.PythonFile(sink, mode="w"), schema)
+    for chunk in _chunks(queryset, chunk_size):
+        columns = list(zip(*chunk))
+        writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema,
+        ))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def parquet(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _columnar(queryset, chunk_size,
+                     lambda out, schema: pyarrow.parquet.ParquetWriter(out, schema, compression="zstd"))
+
+
+def arrow(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _columnar(queryset, chunk_size, lambda out, schema: pyarrow.ipc.new_stream(out, schema))
+
+
+def encode(fmt: str, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Générateur d'octets pour `fmt`.
+
+    FormatUnavailable est levée ici, avant le premier octet, et non pendant
+    le flux: la réponse peut encore être une erreur.
+    """
+    if fmt not in FORMATS:
+        raise FormatUnavailable(f"format inconnu: {fmt}")
+    if fmt != "csv" and pyarrow is None:
+        raise FormatUnavailable(f"format {fmt} indisponible (pyarrow n'est pas installé)")
+    return {"csv": csv_gzip, "parquet": parquet, "arrow": arrow}[fmt](queryset, chunk_size)
@@ -0,0 +1,121 @@
+"""Cache des réponses de la liste publique des alertes (GET anonyme /api/alertes/).
+
+Une entrée par combinaison de filtres (search, level): le JSON rendu et la
+version de la ressource "alertes" (versions.py) qu'il reflète. La version
+est incrémentée à chaque écriture d'Alerte, de Signalement ou de
+Localisation: une entrée d'une autre version est périmée, sans
+invalidation explicite.
+
+Contre l'effet de meute (toute la ville qui recharge la page après une
+alerte): à version nouvelle, un seul client recalcule (verrou `cache.add`)
+pendant que les autres reçoivent l'entrée précédente, avec son propre ETag
+(le client la revalidera ensuite). Sans entrée précédente, ils attendent le
+calcul au plus `wait` secondes puis calculent eux-mêmes.
+
+Backend: cache Django "alertes" (ALERTE_CACHE_BACKEND: locmem par
+processus, ou fichiers partagés entre workers, où le verrou n'est qu'à peu
+près exclusif). Compteurs dans /api/realtime/stats.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import versions
+
+RESOURCE = 'alertes'
+
+
+class FeedCache:
+    def __init__(self, alias='alertes', ttl=300, lock_seconds=10.0, wait=2.0, poll=0.02):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.wait = wait
+        self.poll = poll
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'waited': 0, 'recomputes': 0}
+        self._compute_ms = 0.0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def cacheable(request) -> bool:
+        return not request.user.is_authenticated and request.accepted_renderer.format == 'json'
+
+    @staticmethod
+    def key(search=None, level=None) -> str:
+        search = hashlib.md5((search or '').strip().encode(), usedforsecurity=False).hexdigest()
+        level = hashlib.md5((level or '').lower().strip().encode(), usedforsecurity=False).hexdigest()[:8]
+        return f"{RESOURCE}:{level}:{search}"
+
+    def _count(self, name, compute_ms=None):
+        with self._lock:
+            self.counters[name] += 1
+            if compute_ms is not None:
+                self._compute_ms += compute_ms
+
+    def response(self, request, version, compute):
+        """Réponse pour `version` (valeur, date) ; `compute()` renvoie les données à sérialiser."""
+        value, updated_at = version
+        stamp = (value, updated_at.timestamp())
+        key = self.key(request.query_params.get('search'), request.query_params.get('level'))
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            self._count('hits')
+            return self._http(request, entry)
+        self._count('misses')
+        lock = f"{key}:lock"
+        owner = self.cache.add(lock, 1, self.lock_seconds)
+        if not owner:
+            if entry is not None:
+                self._count('stale')
+                return self._http(request, entry)
+            deadline = time.monotonic() + self.wait
+            while time.monotonic() < deadline:
+                time.sleep(self.poll)
+                entry = self.cache.get(key)
+                if entry is not None and entry[0] == stamp:
+                    self._count('waited')
+                    return self._http(request, entry)
+        try:
+            started = time.perf_counter()
+            content = request.accepted_renderer.render(compute(), request.accepted_media_type)
+            entry = (stamp, request.accepted_renderer.media_type, content)
+            current = self.cache.get(key)
+            if current is None or current[0][0] <= value:  # ne pas remplacer une version plus récente
+                self.cache.set(key, entry, self.ttl)
+            self._count('recomputes', (time.perf_counter() - started) * 1000)
+        finally:
+            if owner:
+                self.cache.delete(lock)
+        return self._http(request, entry)
+
+    def _http(self, request, entry):
+        (value, timestamp), content_type, content = entry
+        response = HttpResponse(content, content_type=content_type)
+        return versions.stamp(response, versions.etag(request, RESOURCE, value), int(timestamp))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            compute_ms = self._compute_ms
+        served = counters['hits'] + counters['stale'] + counters['waited']
+        lookups = served + counters['recomputes']
+        return {
+            **counters,
+            'hit_ratio': round(served / lookups, 3) if lookups else 0.0,
+            'compute_ms_avg': round(compute_ms / counters['recomputes'], 1) if counters['recomputes'] else 0.0,
+        }
+
+
+feed_cache = FeedCache(
+    ttl=getattr(settings, 'ALERTE_CACHE_TTL', 300),
+    lock_seconds=getattr(settings, 'ALERTE_CACHE_LOCK_SECONDS', 10.0),
+    wait=getattr(settings, 'ALERTE_CACHE_WAIT_SECONDS', 2.0),
+)
@@ -0,0 +1,60 @@
+"""Champs des mesures pour le stockage compact (MESURE_COMPACT_STORAGE).
+
+En mode compact, dans les mêmes colonnes:
+  - date_releve est stocké en secondes epoch (entier) au lieu du texte ISO
+    (~26 octets par ligne sous SQLite) ;
+  - valeur est stocké en entier mis à l'échelle (valeur x 10^MESURE_COMPACT_DECIMALS),
+    que SQLite écrit sur 1 à 4 octets au lieu des 8 d'un réel.
+
+Les conversions se font à l'écriture (get_db_prep_value) et à la lecture
+(from_db_value): le reste du code manipule toujours des datetime et des
+float. La seconde est la précision de l'horodatage, MESURE_COMPACT_DECIMALS
+celle de la valeur. `manage.py mesure_storage` convertit une base existante
+d'un mode à l'autre.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import models
+
+
+def compact_storage() -> bool:
+    return getattr(settings, "MESURE_COMPACT_STORAGE", False)
+
+
+def value_scale() -> int:
+    return 10 ** getattr(settings, "MESURE_COMPACT_DECIMALS", 3)
+
+
+class EpochDateTimeField(models.DateTimeField):
+    def get_internal_type(self):
+        # Entier en base: pas de conversion datetime du backend à la lecture
+        return "BigIntegerField" if compact_storage() else super().get_internal_type()
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not compact_storage():
+            return super().get_db_prep_value(value, connection, prepared)
+        if not prepared:
+            value = self.get_prep_value(value)
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not compact_storage():
+            return value
+        return datetime.fromtimestamp(int(value), dt_timezone.utc)
+
+
+class ScaledFloatField(models.FloatField):
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None or not compact_storage():
+            return value
+        return round(value * value_scale())
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not compact_storage():
+            return value
+        return value / value_scale()
@@ -0,0 +1,378 @@
+"""Ingestion en masse des mesures de capteurs.
+
+Un lot arrive en JSON (tableau d'objets), NDJSON (un objet par ligne), CSV
+(ligne d'en-tête) ou au format binaire compact décrit plus bas. Chaque ligne
+porte:
+
+    capteur      code du capteur (obligatoire)
+    valeur       nombre fini (alias: value)
+    unite        unité, ex. "mm" (alias: unit) ; facultative, elle doit être
+                 celle du capteur, ou la fixe si le capteur n'en a pas encore
+    date_releve  horodatage du capteur, ISO 8601 ou epoch en secondes
+                 (alias: ts) ; à défaut, l'heure de réception
+
+Les codes sont résolus en une requête par lot (cache mémoire ensuite), les
+valeurs et horodatages sont validés colonne par colonne avec NumPy. Les
+lignes valides sont écrites par `bulk_create` en morceaux, puis ajoutées aux
+agrégats (cf. rollups.py) et aux dernières valeurs (cf. latest.py) ; après
+commit, le moteur de seuils les évalue (cf. thresholds.py). Les lignes
+rejetées sont renvoyées une à une avec leur numéro (à partir de 0) et la
+raison.
+"""
+import codecs
+import csv
+import json
+import math
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import latest, rollups
+from .models import Capteur, Mesure
+from .thresholds import evaluate_on_commit
+
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # horodatages futurs tolérés (dérive d'horloge)
+# Plus ancien epoch (ms) représentable en datetime ; en dessous, la ligne est rejetée
+MIN_EPOCH_MS = datetime(1, 1, 2, tzinfo=dt_timezone.utc).timestamp() * 1000.0
+ALIASES = {"value": "valeur", "unit": "unite", "ts": "date_releve", "code": "capteur"}
+
+
+class NDJSONParser(BaseParser):
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        rows = []
+        for n, raw in enumerate(stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                rows.append(json.loads(raw))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON invalide ligne {n}: {exc}")
+        return rows
+
+
+class CSVParser(BaseParser):
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        text = codecs.getreader("utf-8")(stream)
+        try:
+            return list(csv.DictReader(text))
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f"CSV invalide: {exc}")
+
+
+class CapteurCache:
+    """Code -> id (et id -> unité) des capteurs, chargé à la demande et vidé quand un Capteur change."""
+
+    def __init__(self):
+        self._ids = {}
+        self._units = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, codes):
+        missing = {c for c in codes if c not in self._ids}
+        if missing:
+            found = Capteur.objects.filter(code__in=missing).values_list("code", "id", "unite")
+            with self._lock:
+                for code, pk, unite in found:
+                    self._ids[code] = pk
+                    self._units[pk] = unite
+        return {c: self._ids[c] for c in codes if c in self._ids}
+
+    def unite(self, capteur_id):
+        """Unité d'un capteur déjà résolu ("" si pas encore fixée)."""
+        return self._units.get(capteur_id, "")
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._units.clear()
+
+
+capteur_cache = CapteurCache()
+
+
+def _column(rows, name):
+    return [row.get(name) if isinstance(row, dict) else None for row in rows]
+
+
+def _normalize(rows):
+    out = []
+    for row in rows:
+        if isinstance(row, dict):
+            row = {ALIASES.get(k, k): v for k, v in row.items()}
+        out.append(row)
+    return out
+
+
+def _as_floats(values):
+    """Colonne -> tableau float64 (NaN pour les valeurs non numériques)."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        arr = np.full(len(values), np.nan)
+        for i, v in enumerate(values):
+            try:
+                arr[i] = float(v)
+            except (TypeError, ValueError):
+                pass
+        return arr
+
+
+def _utc_datetimes(epoch_ms):
+    """Epochs en ms -> datetimes UTC.
+
+    Hors de la plage de datetime, NumPy renvoie des entiers: les appelants
+    doivent avoir écarté ces valeurs (rejet de la ligne) avant la conversion.
+    """
+    stamps = np.asarray(epoch_ms).astype("datetime64[ms]").astype(datetime)
+    return [d.replace(tzinfo=dt_timezone.utc) for d in stamps]
+
+
+def _timestamps(values, received_at):
+    """Colonne d'horodatages -> (datetimes UTC, indices illisibles, indices dans le futur).
+
+    Les lignes rejetées reçoivent l'heure de réception comme date de remplacement.
+    """
+    epoch_ms = np.full(len(values), np.nan)
+    invalid = []
+    text_idx = []
+    for i, v in enumerate(values):
+        if v in (None, ""):
+            continue
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            try:
+                ms = v * 1000.0
+            except OverflowError:  # entier JSON hors de la plage des flottants
+                ms = math.nan
+            if math.isnan(ms):
+                invalid.append(i)
+            else:
+                epoch_ms[i] = ms
+        else:
+            text_idx.append(i)
+    # Les epochs arrivent souvent en texte (CSV): conversion groupée
+    if text_idx:
+        as_num = _as_floats([values[i] for i in text_idx])
+        for i, num in zip(text_idx, as_num):
+            if np.isfinite(num):
+                epoch_ms[i] = num * 1000.0
+                continue
+            dt = parse_datetime(str(values[i]))
+            if dt is None:
+                invalid.append(i)
+                continue
+            if timezone.is_naive(dt):
+                dt = timezone.make_aware(dt)
+            epoch_ms[i] = dt.timestamp() * 1000.0
+
+    limit_ms = (received_at + MAX_CLOCK_SKEW).timestamp() * 1000.0
+    with np.errstate(invalid="ignore"):
+        too_late = epoch_ms > limit_ms  # y compris +inf et les ms envoyées comme des secondes
+        too_early = epoch_ms < MIN_EPOCH_MS
+    invalid.extend(np.flatnonzero(too_early).tolist())
+    replace = too_late | too_early | np.isnan(epoch_ms)
+    epoch_ms[replace] = received_at.timestamp() * 1000.0
+    return _utc_datetimes(epoch_ms), sorted(set(invalid)), np.flatnonzero(too_late).tolist()
+
+
+def ingest(rows, chunk_size: int = None):
+    """Valide et enregistre un lot ; renvoie le compte rendu (créées, rejetées)."""
+    if not isinstance(rows, list):
+        raise ParseError("le lot doit être une liste de mesures")
+    max_rows = getattr(settings, "MESURE_BULK_MAX_ROWS", 50000)
+    if len(rows) > max_rows:
+        raise ParseError(f"lot trop volumineux ({len(rows)} lignes, maximum {max_rows})")
+    received_at = timezone.now()
+    rows = _normalize(rows)
+    n = len(rows)
+    errors = {}
+
+    def reject(indices, message):
+        for i in indices:
+            errors.setdefault(int(i), message)
+
+    reject([i for i, r in enumerate(rows) if not isinstance(r, dict)], "ligne non objet")
+
+    codes = [str(c).strip() if c not in (None, "") else "" for c in _column(rows, "capteur")]
+    ids = capteur_cache.resolve({c for c in codes if c})
+    reject([i for i, c in enumerate(codes) if not c], "capteur manquant")
+    reject([i for i, c in enumerate(codes) if c and c not in ids], "capteur inconnu")
+
+    valeurs = _as_floats(_column(rows, "valeur"))
+    reject(np.flatnonzero(~np.isfinite(valeurs)), "valeur non numérique")
+
+    unites = [str(u).strip() if u not in (None, "") else "" for u in _column(rows, "unite")]
+    unite_max = Capteur._meta.get_field("unite").max_length
+    reject([i for i, u in enumerate(unites) if len(u) > unite_max], "unite trop longue")
+    # L'unité est celle du capteur ; un capteur qui n'en a pas prend la première reçue
+    fixed = {}
+    for i, (code, u) in enumerate(zip(codes, unites)):
+        if i in errors:
+            continue
+        pk = ids[code]
+        expected = capteur_cache.unite(pk) or fixed.get(pk)
+        if not expected:
+            if u:
+                fixed[pk] = u
+            else:
+                errors[i] = "unite manquante (capteur sans unité)"
+        elif u and u != expected:
+            errors[i] = f"unite {u} différente de celle du capteur ({expected})"
+
+    dates, bad_dates, future = _timestamps(_column(rows, "date_releve"), received_at)
+    reject(bad_dates, "date_releve invalide")
+    reject(future, "date_releve dans le futur")
+
+    objs = [
+        Mesure(capteur_id=ids[codes[i]], valeur=float(valeurs[i]), date_releve=dates[i])
+        for i in range(n) if i not in errors
+    ]
+    _write(objs, chunk_size, fixed)
+    return _report(n, objs, errors)
+
+
+def _write(objs, chunk_size: int = None, unites=None):
+    """Écriture commune aux formats d'entrée: mesures, agrégats, dernières valeurs, seuils, flux.
+
+    `unites`: {capteur_id: unité} des capteurs qui n'en avaient pas encore.
+    """
+    chunk_size = chunk_size or getattr(settings, "MESURE_BULK_CHUNK_SIZE", 1000)
+    with transaction.atomic():
+        if unites:
+            for capteur in Capteur.objects.filter(pk__in=list(unites), unite=""):
+                capteur.unite = unites[capteur.pk]
+                capteur.save(update_fields=["unite"])  # post_save: vide les caches capteurs
+        for start in range(0, len(objs), chunk_size):
+            Mesure.objects.bulk_create(objs[start:start + chunk_size])
+        rollups.apply(objs)
+        latest.record(objs)
+        evaluate_on_commit(objs)
+        transaction.on_commit(lambda: _publish(objs))
+
+
+def _report(n, objs, errors):
+    return {
+        "received": n,
+        "created": len(objs),
+        "rejected": [{"row": i, "error": errors[i]} for i in sorted(errors)],
+    }
+
+
+# --- Format binaire compact ---------------------------------------------------
+#
+# Pour les capteurs sur liaison GSM facturée à l'octet: en-tête MAGIC (4 octets)
+# puis des enregistrements de 12 octets, petit-boutiste:
+#
+#     capteur     uint32   id du Capteur
+#     timestamp   uint32   epoch en secondes (0: heure de réception)
+#     valeur      float32
+#
+# L'unité n'est pas transmise: c'est celle du capteur, ou le paramètre `unite`
+# de la requête pour un capteur qui n'en a pas encore.
+
+MAGIC = b"SDM1"
+RECORD_DTYPE = np.dtype([("capteur", "<u4"), ("timestamp", "<u4"), ("valeur", "<f4")])
+
+
+def encode_records(records) -> bytes:
+    """[(capteur_id, epoch, valeur), ...] -> corps binaire (côté capteur, tests, benchmark)."""
+    return MAGIC + np.array(list(records), dtype=RECORD_DTYPE).tobytes()
+
+
+def parse_records(buffer):
+    """Corps binaire -> tableau structuré NumPy, vue sur le tampon (sans copie)."""
+    view = memoryview(buffer)
+    if view[:len(MAGIC)] != MAGIC:
+        raise ParseError("en-tête binaire invalide")
+    body = view[len(MAGIC):]
+    if len(body) % RECORD_DTYPE.itemsize:
+        raise ParseError(f"taille invalide: enregistrements de {RECORD_DTYPE.itemsize} octets attendus")
+    return np.frombuffer(body, dtype=RECORD_DTYPE)
+
+
+class BinaryMesureParser(BaseParser):
+    media_type = "application/x-sentinelle-mesures"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return parse_records(stream.read() if stream is not None else b"")
+
+
+def ingest_records(records, unite: str = None, chunk_size: int = None):
+    """Valide (par colonnes) et enregistre un lot binaire ; même compte rendu que `ingest`."""
+    n = len(records)
+    max_rows = getattr(settings, "MESURE_BULK_MAX_ROWS", 50000)
+    if n > max_rows:
+        raise ParseError(f"lot trop volumineux ({n} lignes, maximum {max_rows})")
+    received_at = timezone.now()
+    errors = {}
+
+    def reject(mask, message):
+        for i in np.flatnonzero(mask):
+            errors.setdefault(int(i), message)
+
+    capteurs = records["capteur"].astype(np.int64)
+    unique = np.unique(capteurs).tolist()
+    known = dict(Capteur.objects.filter(id__in=unique).values_list("id", "unite"))
+    reject(~np.isin(capteurs, list(known)), "capteur inconnu")
+
+    # float32 -> float64 par la représentation décimale la plus courte (1.1 et non 1.100000023841858)
+    valeurs = records["valeur"].astype(str).astype(np.float64)
+    reject(~np.isfinite(valeurs), "valeur non numérique")
+
+    seconds = records["timestamp"].astype(np.int64)
+    now_s = int(received_at.timestamp())
+    seconds = np.where(seconds == 0, now_s, seconds)
+    reject(seconds > now_s + MAX_CLOCK_SKEW.total_seconds(), "date_releve dans le futur")
+
+    if unite and len(unite) > Capteur._meta.get_field("unite").max_length:
+        raise ParseError("unite trop longue")
+    if unite:
+        mismatch = [pk for pk, u in known.items() if u and u != unite]
+        reject(np.isin(capteurs, mismatch), "unite différente de celle du capteur")
+        fixed = {pk: unite for pk, u in known.items() if not u}
+    else:
+        fixed = {}
+        reject(np.isin(capteurs, [pk for pk, u in known.items() if not u]), "unite inconnue (paramètre unite)")
+
+    keep = np.ones(n, dtype=bool)
+    keep[list(errors)] = False
+    # uint32: jamais avant 1970 ; au-delà de l'heure de réception, la ligne vient d'être rejetée
+    keep &= seconds <= now_s + MAX_CLOCK_SKEW.total_seconds()
+    valid = np.flatnonzero(keep)
+    stamps = _utc_datetimes(seconds[valid] * 1000)
+    ids = capteurs[valid].tolist()
+    values = valeurs[valid].tolist()
+    objs = [Mesure(capteur_id=c, valeur=v, date_releve=d) for c, v, d in zip(ids, values, stamps)]
+    _write(objs, chunk_size, {c: fixed[c] for c in set(ids) if c in fixed})
+    return _report(n, objs, errors)
+
+
+def _publish(objs):
+    """Publie la dernière mesure de chaque capteur du lot sur le flux temps réel.
+
+    bulk_create ne déclenche pas post_save ; un lot de plusieurs milliers de
+    relevés ne doit pas non plus noyer le flux (ni son tampon de rejeu).
+    """
+    from .eventbus import get_bus
+    from .signals import mesure_event
+
+    newest = {}
+    for m in objs:
+        current = newest.get(m.capteur_id)
+        if current is None or m.date_releve >= current.date_releve:
+            newest[m.capteur_id] = m
+    bus = get_bus()
+    for m in newest.values():
+        payload, routing = mesure_event(m)
+        bus.publish("metric", payload, **routing)
@@ -0,0 +1,126 @@
+"""Valeur courante de chaque capteur.
+
+`DerniereMesure` garde une ligne par capteur, mise à jour dans la transaction
+qui enregistre les mesures (post_save ou ingestion en masse): lire l'état de
+tous les capteurs ne parcourt plus la table Mesure.
+
+`current_values()` renvoie, en une seule requête, la dernière valeur de
+chaque capteur avec sa localisation et ses variations sur 15 min et 1 h
+(écart avec la moyenne de la minute correspondante dans les agrégats, cf.
+rollups.py). `snapshot()` en garde une copie en mémoire quelques secondes ;
+le flux temps réel l'envoie aux clients qui se connectent.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .bulk import update_rows
+from .models import DerniereMesure, MesureRollup
+
+TREND_WINDOWS = {"15m": timedelta(minutes=15), "1h": timedelta(hours=1)}
+SNAPSHOT_TTL = 5.0  # secondes ; invalidé aussitôt dans ce processus
+
+
+def record(mesures):
+    """Met à jour la dernière valeur des capteurs présents dans `mesures`."""
+    newest = {}
+    for m in mesures:
+        current = newest.get(m.capteur_id)
+        if current is None or (m.date_releve, m.id or 0) >= (current.date_releve, current.id or 0):
+            newest[m.capteur_id] = m
+    if not newest:
+        return
+    with transaction.atomic():
+        existing = {
+            d.capteur_id: d
+            for d in DerniereMesure.objects.select_for_update().filter(capteur_id__in=list(newest))
+        }
+        to_update, to_create = [], []
+        now = timezone.now()
+        for capteur_id, m in newest.items():
+            row = existing.get(capteur_id)
+            if row is None:
+                to_create.append(DerniereMesure(capteur_id=capteur_id, mesure_id=m.id, valeur=m.valeur,
+                                                date_releve=m.date_releve))
+            elif m.date_releve >= row.date_releve:  # un relevé en retard ne remplace pas le plus récent
+                row.mesure_id, row.valeur, row.date_releve = m.id, m.valeur, m.date_releve
+                row.updated_at = now  # update_rows n'applique pas auto_now
+                to_update.append(row)
+        update_rows(DerniereMesure, to_update, ["mesure", "valeur", "date_releve", "updated_at"])
+        DerniereMesure.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+        transaction.on_commit(snapshot_cache.invalidate)
+
+
+def _reference(window: timedelta):
+    """Moyenne de la dernière minute agrégée au plus tard `window` avant le relevé."""
+    return Subquery(
+        MesureRollup.objects.filter(
+            capteur_id=OuterRef("capteur_id"),
+            resolution="minute",
+            bucket__lte=OuterRef("date_releve") - window,
+        )
+        .order_by("-bucket")
+        .annotate(avg=Cast(F("total"), FloatField()) / F("count"))
+        .values("avg")[:1],
+        output_field=FloatField(),
+    )
+
+
+def current_values():
+    qs = (
+        DerniereMesure.objects.select_related("capteur__localisation")
+        .annotate(**{f"ref_{name}": _reference(window) for name, window in TREND_WINDOWS.items()})
+        .order_by("capteur_id")
+    )
+    out = []
+    for d in qs:
+        loc = d.capteur.localisation
+        trend = {}
+        for name in TREND_WINDOWS:
+            ref = getattr(d, f"ref_{name}")
+            trend[name] = None if ref is None else round(d.valeur - ref, 6)
+        out.append({
+            "capteur_id": d.capteur_id,
+            "capteur": d.capteur.code,
+            "type_capteur": d.capteur.type_capteur,
+            "localisation": {"id": loc.id, "nom": loc.nom, "latitude": loc.latitude, "longitude": loc.longitude},
+            "mesure_id": d.mesure_id,
+            "value": d.valeur,
+            "unite": d.capteur.unite,
+            "date_releve": d.date_releve,
+            "delta": trend,
+        })
+    return out
+
+
+class SnapshotCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is not None and time.monotonic() < self._expires:
+            return self._value
+        with self._lock:
+            # Un seul recalcul quand plusieurs requêtes arrivent en même temps
+            if self._value is None or time.monotonic() >= self._expires:
+                self._value = current_values()
+                self._expires = time.monotonic() + self.ttl
+            return self._value
+
+    def invalidate(self):
+        self._expires = 0.0
+
+
+snapshot_cache = SnapshotCache(SNAPSHOT_TTL)
+
+
+def snapshot():
+    return snapshot_cache.get()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inondation import search
+from inondation.models import Alerte
+
+
+class Command(BaseCommand):
+    help = (
+        "Index de recherche plein texte des alertes: --rebuild le recrée (triggers compris) ; "
+        "avec un texte, affiche les meilleurs résultats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("text", nargs="?", default=None)
+        parser.add_argument("--rebuild", action="store_true")
+        parser.add_argument("--limit", type=int, default=10)
+
+    def handle(self, *args, **opts):
+        if not search.supported():
+            raise CommandError("recherche plein texte: SQLite ou PostgreSQL uniquement")
+        if opts["rebuild"]:
+            started = time.perf_counter()
+            search.install()
+            self.stdout.write(f"index reconstruit en {time.perf_counter() - started:.1f}s")
+        self.stdout.write(f"index {'en place' if search.index_installed() else 'absent ou incomplet'}")
+        if opts["text"]:
+            started = time.perf_counter()
+            results = list(search.filter_alertes(
+                Alerte.objects.select_related("localisation"), opts["text"]
+            )[:opts["limit"]])
+            self.stdout.write(f"{len(results)} résultats en {(time.perf_counter() - started) * 1000:.1f} ms")
+            for alerte in results:
+                rank = getattr(alerte, "search_rank", None)
+                self.stdout.write(
+                    f"  {alerte.id:>8} {'' if rank is None else f'{rank:7.3f}'} {alerte.niveau:7} "
+                    f"{alerte.localisation.nom}: {alerte.message[:70]!r}"
+                )
@@ -0,0 +1,62 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inondation import archive
+from inondation.models import Capteur
+from inondation.rollups import parse_instant
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les mesures expirées (rétention par type de capteur) vers les archives mensuelles "
+        "gzip, par lots bornés ; --read relit les mesures archivées en CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="compte les mesures expirées sans rien déplacer")
+        parser.add_argument("--batch-size", type=int, default=settings.MESURE_ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=0.0, help="secondes d'attente entre deux lots")
+        parser.add_argument("--limit", type=int, default=None, help="nombre maximal de mesures déplacées")
+        parser.add_argument("--read", action="store_true", help="écrit les mesures archivées (CSV) sur la sortie")
+        parser.add_argument("--capteur", action="append", default=None, help="avec --read: code du capteur")
+        parser.add_argument("--from", dest="start", default=None, help="avec --read: début (ISO 8601 ou epoch)")
+        parser.add_argument("--to", dest="end", default=None, help="avec --read: fin exclue (ISO 8601 ou epoch)")
+
+    def handle(self, *args, **opts):
+        if opts["read"]:
+            return self._read(opts)
+        for type_capteur in sorted(set(Capteur.objects.values_list("type_capteur", flat=True))):
+            days = archive.retention_days(type_capteur)
+            self.stdout.write(f"{type_capteur}: {f'{days} jours' if days else 'conservées'}")
+        if opts["dry_run"]:
+            self.stdout.write(f"{archive.count_expired()} mesures expirées")
+            return
+
+        started = time.perf_counter()
+        moved = archive.prune(
+            batch_size=opts["batch_size"], pause=opts["pause"], limit=opts["limit"],
+            log=(lambda n: self.stdout.write(f"  {n} mesures archivées")) if opts["verbosity"] > 1 else None,
+        )
+        self.stdout.write(
+            f"{moved} mesures archivées dans {settings.MESURE_ARCHIVE_DIR} en {time.perf_counter() - started:.1f}s"
+        )
+
+    def _read(self, opts):
+        capteur_ids = None
+        if opts["capteur"]:
+            found = dict(Capteur.objects.filter(code__in=opts["capteur"]).values_list("code", "id"))
+            unknown = set(opts["capteur"]) - set(found)
+            if unknown:
+                raise CommandError(f"capteur(s) inconnu(s): {', '.join(sorted(unknown))}")
+            capteur_ids = list(found.values())
+        try:
+            start, end = parse_instant(opts["start"]), parse_instant(opts["end"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        writer = csv.writer(self.stdout)
+        writer.writerow(archive.HEADER)
+        for pk, cid, code, date, valeur, unite in archive.read(capteur_ids, start, end):
+            writer.writerow((pk, cid, code, date.isoformat(), valeur, unite))
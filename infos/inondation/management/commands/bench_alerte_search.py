@@ -0,0 +1,102 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from inondation import search
+
+QUARTIERS = ["Médina", "Pikine", "Guédiawaye", "Parcelles Assainies", "Grand Yoff", "Fass", "Colobane",
+             "Thiaroye", "Keur Massar", "Rufisque", "Ouakam", "Yoff", "Hann", "Bel-Air", "Sicap Liberté"]
+MOTS = ["inondation", "inondé", "inondée", "rue", "quartier", "eau", "stagnante", "pluie", "pluies", "forte",
+        "canal", "bouché", "évacuation", "maison", "école", "route", "coupée", "niveau", "monte", "montée",
+        "habitants", "bloqués", "marché", "dégâts", "alerte", "crue", "débordement", "caniveau", "sable",
+        "voiture", "nuit", "matin", "secours", "pompiers", "famille", "sinistrés", "zone", "basse", "près", "du"]
+NIVEAUX = ["faible", "moyen", "fort"]
+# Saisies types de la page des alertes
+QUERIES = ["inondé", "inonde", "Guédiawaye", "canal bouché", "évacuation école", "pompi", "sinistres marche"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la recherche des alertes icontains (LIKE '%...%' sur 3 colonnes) et l'index "
+        "plein texte FTS5 (base SQLite temporaire, même schéma et mêmes triggers)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--localisations", type=int, default=2000)
+
+    def handle(self, *args, **opts):
+        n = opts["rows"]
+        random.seed(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = sqlite3.connect(os.path.join(tmp, "alertes.sqlite3"))
+            db.execute("CREATE TABLE inondation_localisation (id integer PRIMARY KEY AUTOINCREMENT, "
+                       "nom varchar(100) NOT NULL, latitude real NOT NULL, longitude real NOT NULL)")
+            db.execute("CREATE TABLE inondation_alerte (id integer PRIMARY KEY AUTOINCREMENT, "
+                       "niveau varchar(50) NOT NULL, message text NOT NULL, date_alerte datetime NOT NULL, "
+                       "localisation_id bigint NOT NULL REFERENCES inondation_localisation (id))")
+            db.execute("CREATE INDEX inondation_alerte_localisation_id ON inondation_alerte (localisation_id)")
+            db.executemany("INSERT INTO inondation_localisation (nom, latitude, longitude) VALUES (?, 14.7, -17.4)",
+                           [(f"{random.choice(QUARTIERS)} {i}",) for i in range(opts["localisations"])])
+            start = datetime(2024, 1, 1)
+            rows = [(random.choice(NIVEAUX), " ".join(random.choices(MOTS, k=random.randint(6, 14))),
+                     (start + timedelta(seconds=30 * k)).strftime("%Y-%m-%d %H:%M:%S"),
+                     random.randint(1, opts["localisations"])) for k in range(n)]
+
+            insert = ("INSERT INTO inondation_alerte (niveau, message, date_alerte, localisation_id) "
+                      "VALUES (?, ?, ?, ?)")
+            started = time.perf_counter()
+            db.executemany(insert, rows)
+            db.commit()
+            plain = time.perf_counter() - started
+            started = time.perf_counter()
+            for sql in search.SQLITE_INSTALL:
+                db.execute(sql)
+            db.commit()
+            build = time.perf_counter() - started
+            sample = rows[:20000]
+            started = time.perf_counter()
+            db.executemany(insert, sample)
+            db.commit()
+            indexed = time.perf_counter() - started
+            index_size = db.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE ?",
+                                    (f"{search.TABLE}%",)).fetchone()[0]
+            table_size = db.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'inondation_alerte'").fetchone()[0]
+            self.stdout.write(
+                f"{n} alertes: insertion {n / plain:,.0f}/s sans index, {len(sample) / indexed:,.0f}/s avec "
+                f"triggers ; construction de l'index {build:.1f}s ; index {index_size / 1e6:.0f} Mo "
+                f"(table {table_size / 1e6:.0f} Mo)"
+            )
+
+            like = ("SELECT a.id FROM inondation_alerte a JOIN inondation_localisation l ON l.id = a.localisation_id "
+                    "WHERE a.message LIKE ? ESCAPE '\\' OR a.niveau LIKE ? ESCAPE '\\' OR l.nom LIKE ? ESCAPE '\\' "
+                    "ORDER BY a.date_alerte DESC")
+            fts = (f"SELECT a.id FROM inondation_alerte a JOIN {search.TABLE} f ON f.rowid = a.id "
+                   f"WHERE {search.TABLE} MATCH ? ORDER BY f.rank, a.date_alerte DESC")
+            self.stdout.write(f"  {'recherche':20} {'icontains':>22} {'plein texte':>22}")
+            for text in QUERIES:
+                pattern = f"%{text}%"
+                query = search.match_expression(text, "sqlite")
+                like_all, like_n = self._best(db, like, (pattern,) * 3)
+                like_top, _ = self._best(db, like + " LIMIT 50", (pattern,) * 3)
+                fts_all, fts_n = self._best(db, fts, (query,))
+                fts_top, _ = self._best(db, fts + " LIMIT 50", (query,))
+                self.stdout.write(
+                    f"  {text:20} {like_n:>8} {like_all * 1000:6.0f} ms ({like_top * 1000:4.0f}) "
+                    f"{fts_n:>8} {fts_all * 1000:6.0f} ms ({fts_top * 1000:4.0f})"
+                )
+            self.stdout.write("  (résultats, temps pour tous les résultats, entre parenthèses pour les 50 premiers)")
+            db.close()
+
+    def _best(self, db, sql, params):
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            found = db.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+        return min(timings), len(found)
@@ -0,0 +1,81 @@
+import gzip
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inondation.ingest import encode_records, ingest, ingest_records, parse_records
+from inondation.models import Capteur, Localisation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le format binaire compact au JSON pour l'ingestion des mesures: octets "
+        "transmis, débit de décodage et ingestion complète (dans une transaction annulée)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=50000)
+        parser.add_argument("--capteurs", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def _best(self, fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def handle(self, *args, **opts):
+        n, repeat = opts["records"], opts["repeat"]
+        with transaction.atomic():
+            loc = Localisation.objects.create(nom="BENCH-loc", latitude=0, longitude=0)
+            capteurs = Capteur.objects.bulk_create([
+                Capteur(code=f"BENCH-{i}", localisation=loc, type_capteur="bench", unite="mm") for i in range(opts["capteurs"])
+            ])
+            now = int(time.time())
+            records = [
+                (capteurs[k % len(capteurs)].id, now - n + k, round(random.uniform(0, 200), 1)) for k in range(n)
+            ]
+            json_body = json.dumps([
+                {"capteur": capteurs[k % len(capteurs)].code, "valeur": v, "unite": "mm", "date_releve": ts}
+                for k, (_, ts, v) in enumerate(records)
+            ]).encode()
+            binary_body = encode_records(records)
+
+            self.stdout.write(f"{n} mesures, {len(capteurs)} capteurs")
+            self.stdout.write("octets transmis:")
+            for name, body in (("JSON", json_body), ("binaire", binary_body)):
+                self.stdout.write(
+                    f"  {name:8} {len(body):>10} ({len(body) / n:.1f} o/mesure), "
+                    f"gzip {len(gzip.compress(body)):>9}"
+                )
+
+            t_json = self._best(lambda: json.loads(json_body), repeat)
+
+            def decode_binary():
+                # frombuffer seul est en O(1): on matérialise aussi les colonnes utilisées par la validation
+                records = parse_records(binary_body)
+                return records["capteur"].astype("i8"), records["timestamp"].astype("i8"), records["valeur"].astype("f8")
+
+            t_bin = self._best(decode_binary, repeat)
+            self.stdout.write("décodage:")
+            self.stdout.write(f"  JSON     {n / t_json:>14,.0f} mesures/s (json.loads)")
+            self.stdout.write(f"  binaire  {n / t_bin:>14,.0f} mesures/s (numpy.frombuffer + colonnes)")
+
+            def full(fn):
+                def run():
+                    with transaction.atomic():
+                        fn()
+                        transaction.set_rollback(True)
+                return run
+
+            t_json = self._best(full(lambda: ingest(json.loads(json_body))), repeat)
+            t_bin = self._best(full(lambda: ingest_records(parse_records(binary_body), unite="mm")), repeat)
+            self.stdout.write("décodage + validation + écriture (annulée):")
+            self.stdout.write(f"  JSON     {n / t_json:>14,.0f} mesures/s")
+            self.stdout.write(f"  binaire  {n / t_bin:>14,.0f} mesures/s")
+            transaction.set_rollback(True)
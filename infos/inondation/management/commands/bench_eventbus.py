@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from inondation.eventbus import UnixSocketBus, run_hub
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la latence de bout en bout du bus UnixSocketBus: un hub local et N "
+        "connexions « worker » ; chaque message publié doit être reçu par tous les workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--rate", type=float, default=0, help="messages/s (0: rafale)")
+
+    def handle(self, *args, **opts):
+        n_workers, n_messages = opts["workers"], opts["messages"]
+        path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+        ready = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(run_hub(path, ready)), daemon=True).start()
+        ready.wait(5)
+
+        done = threading.Event()
+        lock = threading.Lock()
+        received = [0]
+
+        def on_event(*args, **kwargs):
+            with lock:
+                received[0] += 1
+                if received[0] == n_workers * n_messages:
+                    done.set()
+
+        buses = [UnixSocketBus(path, on_event=on_event) for _ in range(n_workers)]
+        for bus in buses:
+            bus.start()
+        if not all(bus.wait_connected(5) for bus in buses):
+            self.stderr.write("connexion au hub impossible")
+            return
+
+        pause = 1.0 / opts["rate"] if opts["rate"] > 0 else 0
+        started = time.perf_counter()
+        for i in range(n_messages):
+            buses[i % n_workers].publish("alert", {"i": i}, point=(14.7, -17.4))
+            if pause:
+                time.sleep(pause)
+        done.wait(60)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{received[0]}/{n_workers * n_messages} remises en {elapsed:.2f}s "
+            f"({received[0] / elapsed:.0f} remises/s)"
+        )
+        for i, bus in enumerate(buses):
+            lat = bus.stats()["latency_ms"]
+            self.stdout.write(f"worker {i}: p50={lat['p50']} ms p95={lat['p95']} ms max={lat['max']} ms")
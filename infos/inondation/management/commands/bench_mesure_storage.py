@@ -0,0 +1,80 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+
+from inondation.fields import value_scale
+
+# Même schéma que la table Mesure (et ses deux index), sous trois formes
+LAYOUTS = {
+    "avant (unite par ligne)": (
+        "capteur_id integer NOT NULL, valeur real NOT NULL, unite varchar(20) NOT NULL, date_releve datetime NOT NULL",
+        lambda cid, ts, v: (cid, v, "mm", datetime.fromtimestamp(ts, dt_timezone.utc).strftime("%Y-%m-%d %H:%M:%S")),
+    ),
+    "unite sur Capteur": (
+        "capteur_id integer NOT NULL, valeur real NOT NULL, date_releve datetime NOT NULL",
+        lambda cid, ts, v: (cid, v, datetime.fromtimestamp(ts, dt_timezone.utc).strftime("%Y-%m-%d %H:%M:%S")),
+    ),
+    "compact": (
+        "capteur_id integer NOT NULL, valeur real NOT NULL, date_releve datetime NOT NULL",
+        lambda cid, ts, v: (cid, round(v * value_scale()), ts),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la place occupée et la vitesse de parcours de la table des mesures: unité "
+        "par ligne, unité sur le capteur, stockage compact (bases SQLite temporaires)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--capteurs", type=int, default=100)
+
+    def handle(self, *args, **opts):
+        n, n_capteurs = opts["rows"], opts["capteurs"]
+        start = int(datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp())
+        # Relevé k: capteur k % n, toutes les 10 s ; valeurs au dixième (hauteur d'eau en cm)
+        readings = [(k % n_capteurs + 1, start + k * 10, round(random.uniform(0, 300), 1)) for k in range(n)]
+        self.stdout.write(f"{n} mesures, {n_capteurs} capteurs")
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, (columns, encode) in LAYOUTS.items():
+                path = os.path.join(tmp, "mesures.sqlite3")
+                size, scan, seek = self._measure(path, columns, [encode(*r) for r in readings])
+                os.remove(path)
+                self.stdout.write(
+                    f"  {name:24} {size / n:6.1f} o/mesure ({size / 1e6:7.1f} Mo) ; "
+                    f"parcours complet {scan * 1000:7.1f} ms ; 1 capteur sur 30 jours {seek * 1000:6.2f} ms"
+                )
+
+    def _measure(self, path, columns, rows):
+        db = sqlite3.connect(path)
+        placeholders = ", ".join("?" * len(rows[0]))
+        names = [c.split()[0] for c in columns.split(", ")]
+        db.execute(f"CREATE TABLE mesure (id integer PRIMARY KEY AUTOINCREMENT, {columns})")
+        db.execute("CREATE INDEX mesure_capteur_date_idx ON mesure (capteur_id, date_releve, id)")
+        db.execute("CREATE INDEX mesure_date_idx ON mesure (date_releve, id)")
+        db.executemany(f"INSERT INTO mesure ({', '.join(names)}) VALUES ({placeholders})", rows)
+        db.commit()
+        db.execute("VACUUM")
+        size = os.path.getsize(path)
+
+        def best(sql, params=()):
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                db.execute(sql, params).fetchall()
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        scan = best("SELECT COUNT(*), SUM(valeur), MAX(date_releve) FROM mesure")
+        low, high = rows[0][-1], rows[min(len(rows) - 1, 30 * 8640)][-1]  # 30 jours
+        seek = best("SELECT valeur, date_releve FROM mesure WHERE capteur_id = ? AND date_releve >= ? "
+                    "AND date_releve < ? ORDER BY date_releve, id", (1, low, high))
+        db.close()
+        return size, scan, seek
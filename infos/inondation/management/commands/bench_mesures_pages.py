@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from inondation.models import Capteur, Localisation, Mesure
+from inondation.pagination import MesureKeysetPagination
+from inondation.views import MesureViewSet
+
+BENCH_PREFIX = "BENCH-"
+BASE_DATE = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la latence d'une page de /api/mesures/ (pagination par curseur) à "
+        "OFFSET/LIMIT selon la profondeur de la page. Insère des mesures de test sur "
+        f"des capteurs {BENCH_PREFIX}* (supprimées à la fin sauf --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--capteurs", type=int, default=10)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--samples", type=int, default=5)
+        parser.add_argument("--keep", action="store_true", help="garder les données de test")
+
+    def handle(self, *args, **opts):
+        capteurs = self._capteurs(opts["capteurs"])
+        ids = [c.id for c in capteurs]
+        existing = Mesure.objects.filter(capteur_id__in=ids).count()
+        if existing != opts["rows"]:
+            self._seed(ids, opts["rows"])
+        try:
+            self._measure(ids, opts)
+        finally:
+            if not opts["keep"]:
+                self._cleanup(ids)
+
+    def _capteurs(self, n):
+        loc, _ = Localisation.objects.get_or_create(nom=f"{BENCH_PREFIX}loc", defaults={"latitude": 0, "longitude": 0})
+        return [
+            Capteur.objects.get_or_create(code=f"{BENCH_PREFIX}{i}", defaults={"localisation": loc, "type_capteur": "bench"})[0]
+            for i in range(n)
+        ]
+
+    def _seed(self, ids, rows):
+        self._delete_rows(ids)
+        table = connection.ops.quote_name(Mesure._meta.db_table)
+        sql = f"INSERT INTO {table} (capteur_id, valeur, date_releve) VALUES (%s, %s, %s)"
+        # Valeurs converties par les champs: le stockage compact est respecté
+        valeur = Mesure._meta.get_field("valeur").get_db_prep_value
+        date = Mesure._meta.get_field("date_releve").get_db_prep_value
+        started = time.perf_counter()
+        chunk = 50_000
+        n = len(ids)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, rows, chunk):
+                # Relevé k: capteur k % n, une seconde après le relevé précédent
+                cursor.executemany(sql, [
+                    (ids[k % n], valeur(random.random() * 100, connection),
+                     date(BASE_DATE + timedelta(seconds=k), connection))
+                    for k in range(start, min(start + chunk, rows))
+                ])
+                self.stdout.write(f"\r{min(start + chunk, rows)}/{rows} mesures insérées", ending="")
+        self.stdout.write(f"\ninsertion: {time.perf_counter() - started:.0f}s")
+
+    def _delete_rows(self, ids):
+        with connection.cursor() as cursor:
+            table = connection.ops.quote_name(Mesure._meta.db_table)
+            cursor.execute(f"DELETE FROM {table} WHERE capteur_id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+    def _cleanup(self, ids):
+        self._delete_rows(ids)
+        Capteur.objects.filter(id__in=ids).delete()
+        Localisation.objects.filter(nom=f"{BENCH_PREFIX}loc").delete()
+
+    def _timed(self, fn, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def _measure(self, ids, opts):
+        factory = APIRequestFactory()
+        view = MesureViewSet.as_view({"get": "list"})
+        paginator = MesureKeysetPagination()
+        size, n = opts["page_size"], len(ids)
+        capteur = ids[0]
+        per_capteur = Mesure.objects.filter(capteur_id=capteur).count()
+        total = Mesure.objects.count()
+        self.stdout.write(f"{total} mesures au total, {per_capteur} pour le capteur {capteur}, pages de {size}")
+        self.stdout.write("SQL: requête de la page seule ; API: requête HTTP complète (sérialisation comprise)")
+        self.stdout.write(
+            f"{'profondeur':>12} {'curseur SQL':>12} {'OFFSET SQL':>11} {'curseur API':>12} {'API tous capteurs':>18}  (ms)"
+        )
+
+        for fraction in (0, 0.1, 0.5, 0.9, 0.99):
+            depth = int(per_capteur * fraction)
+            # Clé du relevé `depth` du capteur, connue par construction du jeu de test
+            date = BASE_DATE + timedelta(seconds=depth * n)
+            cursor = paginator._encode({"date_releve": date, "id": 0})
+
+            def keyset(params):
+                request = factory.get("/api/mesures/", params)
+                response = view(request)
+                response.render()
+                assert response.status_code == 200, response.status_code
+
+            params = {"capteur": capteur, "cursor": cursor, "page_size": size}
+            paginator._setup(Request(factory.get("/api/mesures/", params)))
+            page_sql = self._timed(
+                lambda: list(paginator._page_queryset(Mesure.objects.filter(capteur_id=capteur))), opts["samples"]
+            )
+            offset_sql = self._timed(
+                lambda: list(Mesure.objects.filter(capteur_id=capteur).order_by("date_releve", "id")[depth:depth + size]),
+                opts["samples"],
+            )
+            filtered = self._timed(lambda: keyset(params), opts["samples"])
+            unfiltered = self._timed(lambda: keyset({"cursor": cursor, "page_size": size}), opts["samples"])
+            self.stdout.write(f"{depth:>12} {page_sql:>12.2f} {offset_sql:>11.2f} {filtered:>12.2f} {unfiltered:>18.2f}")
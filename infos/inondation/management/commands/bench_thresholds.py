@@ -0,0 +1,56 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+
+from inondation.models import Mesure, Seuil
+from inondation.thresholds import ThresholdEngine
+
+
+class Command(BaseCommand):
+    help = (
+        "Débit du moteur de seuils (mesures évaluées par seconde), en mémoire: "
+        "règles niveau + montée + cumul sur chaque capteur, sans écriture en base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readings", type=int, default=1_000_000)
+        parser.add_argument("--capteurs", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        n_capteurs, batch_size = opts["capteurs"], opts["batch_size"]
+        rules = {
+            cid: [
+                Seuil(mesure="niveau", faible=80, moyen=90, fort=95, hysteresis=2),
+                Seuil(mesure="montee", fenetre_minutes=30, moyen=20, fort=40, hysteresis=2),
+                Seuil(mesure="cumul", fenetre_minutes=60, moyen=3000, fort=4000, hysteresis=100),
+            ]
+            for cid in range(1, n_capteurs + 1)
+        }
+        changes = [0]
+
+        def on_change(*args):
+            changes[0] += 1
+
+        engine = ThresholdEngine(rules=rules, on_change=on_change, warm_up=False)
+
+        # Un relevé par capteur et par minute, marche aléatoire autour de 50
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        levels = [50.0] * (n_capteurs + 1)
+        readings = []
+        for k in range(opts["readings"]):
+            cid = k % n_capteurs + 1
+            levels[cid] = min(100.0, max(0.0, levels[cid] + random.uniform(-3, 3)))
+            readings.append(Mesure(capteur_id=cid, valeur=levels[cid],
+                                   date_releve=start + timedelta(minutes=k // n_capteurs)))
+
+        started = time.perf_counter()
+        for i in range(0, len(readings), batch_size):
+            engine.process(readings[i:i + batch_size])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{len(readings)} mesures, {n_capteurs} capteurs, 3 règles chacun, lots de {batch_size}: "
+            f"{elapsed:.2f}s soit {len(readings) / elapsed:,.0f} mesures/s ; {changes[0]} changements de niveau"
+        )
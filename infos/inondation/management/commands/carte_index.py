@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from inondation import carte
+from inondation.models import CarteCellule
+
+
+class Command(BaseCommand):
+    help = (
+        "Index en grille de la carte (cellules geohash par couche et précision): affiche son état ; "
+        "--rebuild le recalcule depuis les alertes et signalements."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true")
+
+    def handle(self, *args, **opts):
+        if opts["rebuild"]:
+            started = time.perf_counter()
+            cells = carte.rebuild()
+            self.stdout.write(f"{cells} cellules recalculées en {time.perf_counter() - started:.1f}s")
+        rows = (CarteCellule.objects.values("couche", "precision").annotate(cellules=Count("id"), points=Sum("nombre"))
+                .order_by("couche", "precision"))
+        for row in rows:
+            self.stdout.write(f"  {row['couche']:13} précision {row['precision']}: "
+                              f"{row['cellules']:>7} cellules, {row['points']} points")
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inondation import export
+from inondation.models import Capteur
+from inondation.rollups import parse_instant
+
+
+class Command(BaseCommand):
+    help = "Exporte l'historique des mesures en flux (CSV gzip, Parquet ou Arrow), en mémoire constante."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=list(export.FORMATS), default="csv")
+        parser.add_argument("--output", "-o", default=None, help="fichier de sortie (défaut: sortie standard)")
+        parser.add_argument("--capteur", action="append", default=None, help="code du capteur (répétable)")
+        parser.add_argument("--from", dest="start", default=None, help="début (ISO 8601 ou epoch)")
+        parser.add_argument("--to", dest="end", default=None, help="fin exclue (ISO 8601 ou epoch)")
+        parser.add_argument("--chunk-size", type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        capteur_ids = None
+        if opts["capteur"]:
+            found = dict(Capteur.objects.filter(code__in=opts["capteur"]).values_list("code", "id"))
+            unknown = set(opts["capteur"]) - set(found)
+            if unknown:
+                raise CommandError(f"capteur(s) inconnu(s): {', '.join(sorted(unknown))}")
+            capteur_ids = list(found.values())
+        try:
+            start, end = parse_instant(opts["start"]), parse_instant(opts["end"])
+            chunks = export.encode(opts["format"], export.export_queryset(capteur_ids, start, end),
+                                   opts["chunk_size"])
+        except (ValueError, export.FormatUnavailable) as exc:
+            raise CommandError(str(exc))
+
+        out = open(opts["output"], "wb") if opts["output"] else sys.stdout.buffer
+        started, written = time.perf_counter(), 0
+        try:
+            for data in chunks:
+                out.write(data)
+                written += len(data)
+        finally:
+            if opts["output"]:
+                out.close()
+        self.stderr.write(f"{written} octets écrits en {time.perf_counter() - started:.1f}s")
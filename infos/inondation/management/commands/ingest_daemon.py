@@ -0,0 +1,66 @@
+import asyncio
+import json
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inondation.daemon import IngestDaemon
+
+
+class Command(BaseCommand):
+    help = (
+        "Démon d'ingestion des capteurs: relevés en lignes (JSON ou code,valeur[,epoch]) ou binaires "
+        "sur TCP, UDP ou socket Unix, écrits en base par lots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="0.0.0.0")
+        parser.add_argument("--tcp", type=int, default=None, help="port TCP")
+        parser.add_argument("--udp", type=int, default=None, help="port UDP")
+        parser.add_argument("--socket", default=None, help="chemin d'un socket Unix")
+        parser.add_argument("--batch-size", type=int, default=settings.INGEST_DAEMON_BATCH_SIZE)
+        parser.add_argument("--flush-interval", type=float, default=settings.INGEST_DAEMON_FLUSH_SECONDS)
+        parser.add_argument("--max-pending", type=int, default=settings.INGEST_DAEMON_MAX_PENDING)
+        parser.add_argument("--max-retries", type=int, default=settings.INGEST_DAEMON_MAX_RETRIES)
+        parser.add_argument("--dead-letter", default=settings.INGEST_DAEMON_DEAD_LETTER,
+                            help="fichier des relevés non écrits (JSON, un par ligne)")
+        parser.add_argument("--stats-interval", type=float, default=10.0,
+                            help="secondes entre deux lignes de métriques")
+
+    def handle(self, *args, **opts):
+        if opts["tcp"] is None and opts["udp"] is None and opts["socket"] is None:
+            raise CommandError("indiquer au moins --tcp, --udp ou --socket")
+        if opts["batch_size"] > settings.MESURE_BULK_MAX_ROWS:
+            raise CommandError(f"--batch-size au plus MESURE_BULK_MAX_ROWS ({settings.MESURE_BULK_MAX_ROWS})")
+        daemon = IngestDaemon(opts["batch_size"], opts["flush_interval"], opts["max_pending"],
+                              max_retries=opts["max_retries"], dead_letter=opts["dead_letter"])
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(opts["stats_interval"]):
+                self.stdout.write(json.dumps(daemon.stats()))
+
+        threading.Thread(target=report, daemon=True).start()
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt  # SIGTERM: même arrêt propre que Ctrl-C (tampon vidé)
+
+        signal.signal(signal.SIGTERM, terminate)
+        listening = ", ".join(
+            f"{kind} {where}" for kind, where in
+            (("tcp", opts["tcp"]), ("udp", opts["udp"]), ("unix", opts["socket"])) if where is not None
+        )
+        self.stdout.write(f"ingest_daemon en écoute ({listening}), lots de {opts['batch_size']}")
+        try:
+            asyncio.run(daemon.serve(opts["host"], opts["tcp"], opts["udp"], opts["socket"]))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            started = time.perf_counter()
+            daemon.stop()
+            self.stdout.write(f"tampon vidé en {time.perf_counter() - started:.1f}s")
+            self.stdout.write(json.dumps(daemon.stats()))
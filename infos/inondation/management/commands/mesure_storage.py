@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inondation import storage
+from inondation.fields import compact_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Affiche ou convertit le mode de stockage des mesures (standard / compact). "
+        "À lancer application arrêtée, puis basculer MESURE_COMPACT_STORAGE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=storage.MODES, default=None)
+        parser.add_argument("--batch-size", type=int, default=50000)
+        parser.add_argument("--vacuum", action="store_true", help="VACUUM après conversion (rend l'espace libéré)")
+
+    def handle(self, *args, **opts):
+        if connection.vendor != "sqlite":
+            raise CommandError("stockage compact des mesures: SQLite uniquement")
+        self._report()
+        if not opts["to"]:
+            return
+        started = time.perf_counter()
+        converted = storage.convert(
+            opts["to"], opts["batch_size"],
+            log=(lambda n: self.stdout.write(f"  {n} lignes converties")) if opts["verbosity"] > 1 else None,
+        )
+        self.stdout.write(f"{converted} lignes converties en {time.perf_counter() - started:.1f}s")
+        if opts["vacuum"]:
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+        self._report()
+        expected = opts["to"] == "compact"
+        if compact_storage() != expected:
+            self.stdout.write(f"à faire: MESURE_COMPACT_STORAGE={int(expected)}")
+
+    def _report(self):
+        size = storage.table_bytes()
+        self.stdout.write(
+            f"données: {storage.current_mode() or 'pas de table'} ; réglage: "
+            f"{'compact' if compact_storage() else 'standard'} ; "
+            f"table + index: {'inconnu (dbstat absent)' if size is None else f'{size / 1e6:.1f} Mo'}"
+        )
@@ -0,0 +1,21 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inondation.eventbus import run_hub
+
+
+class Command(BaseCommand):
+    help = "Hub du bus temps réel (UnixSocketBus): relaie les événements entre workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=None, help="chemin du socket Unix (REALTIME_BUS_SOCKET)")
+
+    def handle(self, *args, **opts):
+        path = opts["socket"] or settings.REALTIME_BUS_SOCKET
+        self.stdout.write(f"realtime_hub en écoute sur {path}")
+        try:
+            asyncio.run(run_hub(path))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inondation.models import Capteur
+from inondation.rollups import backfill, parse_instant
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit les agrégats minute/heure/jour (MesureRollup) depuis les mesures brutes. "
+        "Idempotent: les agrégats de la période sont supprimés puis recalculés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--capteur", action="append", default=None,
+                            help="code du capteur (répétable) ; tous par défaut")
+        parser.add_argument("--since", default=None, help="date de début (ISO 8601), arrondie au jour")
+
+    def handle(self, *args, **opts):
+        capteur_ids = None
+        if opts["capteur"]:
+            found = dict(Capteur.objects.filter(code__in=opts["capteur"]).values_list("code", "id"))
+            unknown = set(opts["capteur"]) - set(found)
+            if unknown:
+                raise CommandError(f"capteur(s) inconnu(s): {', '.join(sorted(unknown))}")
+            capteur_ids = list(found.values())
+        try:
+            since = parse_instant(opts["since"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        started = time.perf_counter()
+        written = backfill(capteur_ids, since)
+        self.stdout.write(f"{written} agrégats écrits en {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import random
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from inondation.ingest import MAGIC, encode_records
+from inondation.models import Capteur, Localisation, Mesure
+
+
+class Command(BaseCommand):
+    help = (
+        "Flotte de capteurs simulés pour ingest_daemon: N capteurs envoient des relevés à un débit "
+        "donné (lignes ou binaire), puis on vérifie qu'ils sont tous arrivés en base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--tcp", type=int, default=None)
+        parser.add_argument("--udp", type=int, default=None)
+        parser.add_argument("--socket", default=None)
+        parser.add_argument("--sensors", type=int, default=200)
+        parser.add_argument("--rate", type=float, default=5.0, help="relevés/s par capteur")
+        parser.add_argument("--duration", type=float, default=10.0, help="secondes")
+        parser.add_argument("--format", choices=["line", "json", "binary"], default="line")
+        parser.add_argument("--prefix", default="SIM-")
+        parser.add_argument("--wait", type=float, default=30.0, help="attente max de l'écriture en base (s)")
+
+    def handle(self, *args, **opts):
+        if sum(opts[k] is not None for k in ("tcp", "udp", "socket")) != 1:
+            raise CommandError("indiquer une cible: --tcp, --udp ou --socket")
+        capteurs = self._capteurs(opts["prefix"], opts["sensors"])
+        last_id = Mesure.objects.aggregate(last=Max("id"))["last"] or 0
+
+        started = time.perf_counter()
+        sent = asyncio.run(self._fleet(capteurs, opts))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{sent} relevés envoyés en {elapsed:.1f}s ({sent / elapsed:,.0f}/s)"
+                          f" par {len(capteurs)} capteurs ({opts['format']})")
+
+        ids = [c.id for c in capteurs]
+        deadline = time.monotonic() + opts["wait"]
+        while True:
+            stored = Mesure.objects.filter(capteur_id__in=ids, id__gt=last_id).count()
+            if stored >= sent or time.monotonic() > deadline:
+                break
+            time.sleep(0.5)
+        self.stdout.write(f"{stored}/{sent} relevés en base {time.perf_counter() - started - elapsed:.1f}s après "
+                          f"le dernier envoi")
+        if opts["udp"] is None:
+            self.stdout.write(f"démon: {json.dumps(asyncio.run(self._stats(opts)))}")
+
+    def _capteurs(self, prefix, n):
+        loc, _ = Localisation.objects.get_or_create(nom=f"{prefix}loc", defaults={"latitude": 14.7, "longitude": -17.4})
+        existing = {c.code: c for c in Capteur.objects.filter(code__startswith=prefix)}
+        missing = [
+            Capteur(code=f"{prefix}{i}", localisation=loc, type_capteur="simulation", unite="cm")
+            for i in range(n) if f"{prefix}{i}" not in existing
+        ]
+        Capteur.objects.bulk_create(missing)
+        return list(Capteur.objects.filter(code__in=[f"{prefix}{i}" for i in range(n)]).order_by("id"))
+
+    async def _open(self, opts):
+        if opts["socket"] is not None:
+            return await asyncio.open_unix_connection(opts["socket"])
+        return await asyncio.open_connection(opts["host"], opts["tcp"])
+
+    def _payload(self, fmt, capteur, level):
+        now = int(time.time())
+        if fmt == "binary":
+            return encode_records([(capteur.id, now, level)])[len(MAGIC):]
+        if fmt == "json":
+            return (json.dumps({"capteur": capteur.code, "valeur": level, "date_releve": now}) + "\n").encode()
+        return f"{capteur.code},{level},{now}\n".encode()
+
+    async def _sensor(self, capteur, opts, stop_at):
+        fmt, pause = opts["format"], 1.0 / opts["rate"]
+        level = random.uniform(20, 80)
+        sent = 0
+        await asyncio.sleep(random.random() * pause)  # capteurs désynchronisés
+        if opts["udp"] is not None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            target = (opts["host"], opts["udp"])
+            while time.monotonic() < stop_at:
+                level = round(min(300.0, max(0.0, level + random.uniform(-1, 1))), 1)
+                data = self._payload(fmt, capteur, level)
+                sock.sendto(MAGIC + data if fmt == "binary" else data, target)
+                sent += 1
+                await asyncio.sleep(pause)
+            sock.close()
+            return sent
+        reader, writer = await self._open(opts)
+        if fmt == "binary":
+            writer.write(MAGIC)
+        while time.monotonic() < stop_at:
+            level = round(min(300.0, max(0.0, level + random.uniform(-1, 1))), 1)
+            writer.write(self._payload(fmt, capteur, level))
+            await writer.drain()  # bloque quand le démon applique la contre-pression
+            sent += 1
+            await asyncio.sleep(pause)
+        writer.close()
+        await writer.wait_closed()
+        return sent
+
+    async def _fleet(self, capteurs, opts):
+        stop_at = time.monotonic() + opts["duration"]
+        return sum(await asyncio.gather(*(self._sensor(c, opts, stop_at) for c in capteurs)))
+
+    async def _stats(self, opts):
+        reader, writer = await self._open(opts)
+        writer.write(b"stats\n")
+        await writer.drain()
+        line = await reader.readline()
+        writer.close()
+        return json.loads(line)
@@ -0,0 +1,88 @@
+import asyncio
+import resource
+import time
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge du flux SSE: ouvre N connexions simultanées sur un serveur ASGI "
+        "déjà lancé et mesure la mémoire du serveur par connexion (--pid, Linux)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/api/realtime/stream")
+        parser.add_argument("--connections", type=int, default=1000)
+        parser.add_argument("--pid", type=int, default=None, help="PID du serveur (lecture de VmRSS)")
+        parser.add_argument("--hold", type=float, default=10.0, help="durée (s) de maintien des connexions")
+
+    def handle(self, *args, **opts):
+        url = urlparse(opts["url"])
+        if url.scheme != "http":
+            raise CommandError("seul http:// est supporté")
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = opts["connections"] + 64
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+        asyncio.run(self._run(url, opts))
+
+    async def _open(self, url, results):
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            writer.write(
+                f"GET {url.path or '/'}{'?' + url.query if url.query else ''} HTTP/1.1\r\n"
+                f"Host: {url.netloc}\r\nAccept: text/event-stream\r\n\r\n".encode()
+            )
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 30)
+            if b" 200 " not in head.split(b"\r\n", 1)[0]:
+                raise ValueError(head.split(b"\r\n", 1)[0].decode(errors="replace"))
+            await asyncio.wait_for(reader.readuntil(b"\n\n"), 30)  # premier événement (retry:)
+            results["ok"].append((reader, writer))
+        except Exception as exc:
+            results["errors"].append(repr(exc))
+
+    async def _run(self, url, opts):
+        n, pid = opts["connections"], opts["pid"]
+        rss_before = _rss_kb(pid) if pid else None
+        results = {"ok": [], "errors": []}
+        started = time.perf_counter()
+        await asyncio.gather(*(self._open(url, results) for _ in range(n)))
+        opened_in = time.perf_counter() - started
+        ok = len(results["ok"])
+        self.stdout.write(f"connexions ouvertes: {ok}/{n} en {opened_in:.2f}s")
+        if results["errors"]:
+            self.stdout.write(f"échecs: {len(results['errors'])} (ex: {results['errors'][0]})")
+
+        # Pendant le maintien, lire ce qui arrive pour vérifier que les flux restent vivants
+        received = 0
+        deadline = time.monotonic() + opts["hold"]
+        while time.monotonic() < deadline:
+            chunks = await asyncio.gather(
+                *(asyncio.wait_for(r.read(4096), 0.5) for r, _ in results["ok"]),
+                return_exceptions=True,
+            )
+            received += sum(1 for c in chunks if isinstance(c, bytes) and c)
+        self.stdout.write(f"lectures reçues pendant {opts['hold']:.0f}s: {received}")
+
+        if pid:
+            rss_during = _rss_kb(pid)
+            per_conn = (rss_during - rss_before) / ok if ok else 0
+            self.stdout.write(
+                f"RSS serveur: {rss_before} kB -> {rss_during} kB, soit {per_conn:.1f} kB par connexion"
+            )
+        for _, writer in results["ok"]:
+            writer.close()
+        await asyncio.sleep(1)
+        if pid:
+            self.stdout.write(f"RSS serveur après fermeture: {_rss_kb(pid)} kB")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0005_signalement_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mesure',
+            name='date_releve',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0006_mesure_date_releve_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesureRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'minute'), ('hour', 'heure'), ('day', 'jour')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('capteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='inondation.capteur')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('capteur', 'resolution', 'bucket'), name='uniq_mesure_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0007_mesurerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mesure',
+            index=models.Index(fields=['capteur', 'date_releve', 'id'], name='mesure_capteur_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mesure',
+            index=models.Index(fields=['date_releve', 'id'], name='mesure_date_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_derniere_mesure(apps, schema_editor):
+    Capteur = apps.get_model('inondation', 'Capteur')
+    Mesure = apps.get_model('inondation', 'Mesure')
+    DerniereMesure = apps.get_model('inondation', 'DerniereMesure')
+    rows = []
+    for capteur_id in Capteur.objects.values_list('id', flat=True).iterator():
+        m = Mesure.objects.filter(capteur_id=capteur_id).order_by('-date_releve', '-id').first()
+        if m is not None:
+            rows.append(DerniereMesure(capteur_id=capteur_id, mesure_id=m.id, valeur=m.valeur,
+                                       unite=m.unite, date_releve=m.date_releve))
+    DerniereMesure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0008_mesure_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DerniereMesure',
+            fields=[
+                ('capteur', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='derniere_mesure', serialize=False, to='inondation.capteur')),
+                ('valeur', models.FloatField()),
+                ('unite', models.CharField(max_length=20)),
+                ('date_releve', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mesure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inondation.mesure')),
+            ],
+        ),
+        migrations.RunPython(backfill_derniere_mesure, migrations.RunPython.noop),
+    ]
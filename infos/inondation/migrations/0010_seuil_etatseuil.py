@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0009_dernieremesure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Seuil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_capteur', models.CharField(blank=True, default='', max_length=50)),
+                ('mesure', models.CharField(choices=[('niveau', 'niveau'), ('montee', 'vitesse de montée'), ('cumul', 'cumul')], default='niveau', max_length=10)),
+                ('fenetre_minutes', models.PositiveIntegerField(default=60)),
+                ('faible', models.FloatField(blank=True, null=True)),
+                ('moyen', models.FloatField(blank=True, null=True)),
+                ('fort', models.FloatField(blank=True, null=True)),
+                ('hysteresis', models.FloatField(default=0)),
+                ('actif', models.BooleanField(default=True)),
+                ('capteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seuils', to='inondation.capteur')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EtatSeuil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('niveau', models.CharField(blank=True, default='', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('alerte', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inondation.alerte')),
+                ('capteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inondation.capteur')),
+                ('seuil', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='etats', to='inondation.seuil')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('seuil', 'capteur'), name='uniq_etat_seuil')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0010_seuil_etatseuil'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMesure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fichier', models.CharField(max_length=100)),
+                ('offset', models.BigIntegerField()),
+                ('taille', models.BigIntegerField()),
+                ('debut', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('nombre', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('capteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='inondation.capteur')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['capteur', 'debut'], name='archive_capteur_debut_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:12
+
+import django.utils.timezone
+import inondation.fields
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def unite_to_capteur(apps, schema_editor):
+    """Reporte l'unité des mesures sur leur capteur ; refuse les capteurs aux unités mélangées."""
+    Capteur = apps.get_model('inondation', 'Capteur')
+    Mesure = apps.get_model('inondation', 'Mesure')
+    units = {}
+    for row in Mesure.objects.values('capteur_id', 'unite').annotate(n=Count('id')).order_by('capteur_id', '-n'):
+        units.setdefault(row['capteur_id'], []).append(f"{row['unite']!r} ({row['n']})")
+    mixed = {cid: found for cid, found in units.items() if len(found) > 1}
+    if mixed:
+        details = "; ".join(f"capteur {cid}: {', '.join(found)}" for cid, found in sorted(mixed.items()))
+        raise RuntimeError(
+            f"unités incohérentes, à corriger avant migration (conversion des valeurs ou nouveau capteur): {details}"
+        )
+    for row in Mesure.objects.values('capteur_id', 'unite').distinct().order_by():
+        Capteur.objects.filter(pk=row['capteur_id']).update(unite=row['unite'])
+
+
+def unite_to_mesure(apps, schema_editor):
+    Capteur = apps.get_model('inondation', 'Capteur')
+    Mesure = apps.get_model('inondation', 'Mesure')
+    DerniereMesure = apps.get_model('inondation', 'DerniereMesure')
+    for capteur_id, unite in Capteur.objects.exclude(unite='').values_list('id', 'unite'):
+        Mesure.objects.filter(capteur_id=capteur_id).update(unite=unite)
+        DerniereMesure.objects.filter(capteur_id=capteur_id).update(unite=unite)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0011_archivemesure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='capteur',
+            name='unite',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.RunPython(unite_to_capteur, unite_to_mesure),
+        migrations.RemoveField(
+            model_name='dernieremesure',
+            name='unite',
+        ),
+        migrations.RemoveField(
+            model_name='mesure',
+            name='unite',
+        ),
+        migrations.AlterField(
+            model_name='mesure',
+            name='date_releve',
+            field=inondation.fields.EpochDateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='mesure',
+            name='valeur',
+            field=inondation.fields.ScaledFloatField(),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from inondation import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0012_capteur_unite_compact_mesure'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
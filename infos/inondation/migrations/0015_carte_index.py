@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from notifications.geo import geohash_encode
+
+    Localisation = apps.get_model('inondation', 'Localisation')
+    batch = []
+    for loc in Localisation.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=1000):
+        loc.geohash = geohash_encode(loc.latitude, loc.longitude)
+        batch.append(loc)
+        if len(batch) >= 1000:
+            Localisation.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Localisation.objects.bulk_update(batch, ['geohash'])
+
+
+def drop_search_triggers(apps, schema_editor):
+    # Les triggers de recherche (0013) empêchent SQLite de reconstruire inondation_localisation
+    from inondation import search
+
+    search.uninstall(schema_editor.connection)
+
+
+def install_search_triggers(apps, schema_editor):
+    from inondation import search
+
+    search.install(schema_editor.connection)
+
+
+def rebuild_cells(apps, schema_editor):
+    from inondation import carte
+
+    carte.rebuild(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0014_resource_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='localisation',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.CreateModel(
+            name='CarteCellule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('couche', models.CharField(max_length=20)),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('cellule', models.CharField(max_length=12)),
+                ('nombre', models.IntegerField(default=0)),
+                ('somme_lat', models.FloatField(default=0.0)),
+                ('somme_lng', models.FloatField(default=0.0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('couche', 'precision', 'cellule'), name='carte_cellule_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_cells, migrations.RunPython.noop),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from notifications.geo import geohash_encode, parse_coordinates
+
+    AssistanceRequest = apps.get_model('inondation', 'AssistanceRequest')
+    batch = []
+    for request in AssistanceRequest.objects.only('id', 'location_text').iterator(chunk_size=1000):
+        coords = parse_coordinates(request.location_text)
+        if coords:
+            request.geohash = geohash_encode(*coords)
+            batch.append(request)
+        if len(batch) >= 1000:
+            AssistanceRequest.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        AssistanceRequest.objects.bulk_update(batch, ['geohash'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inondation', '0015_carte_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistancerequest',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,23 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .fields import EpochDateTimeField, ScaledFloatField
 
 
 class Localisation(models.Model):
     nom = models.CharField(max_length=100)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    geohash = models.CharField(max_length=12, blank=True, default="", db_index=True)  # cf. carte.py
+
+    def save(self, *args, **kwargs):
+        from notifications.geo import geohash_encode
+
+        self.geohash = geohash_encode(self.latitude, self.longitude)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nom
@@ -15,6 +27,7 @@ class Capteur(models.Model):
     code = models.CharField(max_length=50, unique=True)
     localisation = models.ForeignKey(Localisation, on_delete=models.CASCADE)
     type_capteur = models.CharField(max_length=50)  # ex: "niveau_eau", "pluviométrie"
+    unite = models.CharField(max_length=20, blank=True, default="")  # ex: "mm", "m3/s" ; fixée au premier relevé
 
     def __str__(self):
         return f"{self.code} - {self.type_capteur}"
@@ -22,12 +35,77 @@ class Capteur(models.Model):
 
 class Mesure(models.Model):
     capteur = models.ForeignKey(Capteur, on_delete=models.CASCADE)
+    valeur = ScaledFloatField()
+    date_releve = EpochDateTimeField(default=timezone.now)  # horodatage fourni par le capteur, sinon réception
+
+    class Meta:
+        indexes = [
+            # Pagination par curseur (date_releve, id), avec ou sans filtre capteur
+            models.Index(fields=['capteur', 'date_releve', 'id'], name='mesure_capteur_date_idx'),
+            models.Index(fields=['date_releve', 'id'], name='mesure_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.capteur} - {self.valeur} {self.capteur.unite}"
+
+
+class DerniereMesure(models.Model):
+    """Dernier relevé de chaque capteur (tenu à jour à chaque ingestion)."""
+    capteur = models.OneToOneField(Capteur, on_delete=models.CASCADE, primary_key=True, related_name='derniere_mesure')
+    mesure = models.ForeignKey(Mesure, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     valeur = models.FloatField()
-    unite = models.CharField(max_length=20)  # ex: "mm", "m3/s"
-    date_releve = models.DateTimeField(auto_now_add=True)
+    date_releve = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.capteur} - {self.valeur} {self.unite}"
+        return f"{self.capteur_id} = {self.valeur} ({self.date_releve:%Y-%m-%d %H:%M})"
+
+
+class MesureRollup(models.Model):
+    """Agrégat des mesures d'un capteur sur un intervalle (minute, heure ou jour)."""
+    RESOLUTIONS = [("minute", "minute"), ("hour", "heure"), ("day", "jour")]
+
+    capteur = models.ForeignKey(Capteur, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    bucket = models.DateTimeField()  # début de l'intervalle (UTC)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['capteur', 'resolution', 'bucket'], name='uniq_mesure_rollup'),
+        ]
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.capteur_id} {self.resolution} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class ArchiveMesure(models.Model):
+    """Index des mesures archivées: un bloc gzip d'un fichier mensuel, pour un capteur.
+
+    Un même bloc (fichier, offset, taille) peut contenir plusieurs capteurs:
+    il est indexé une fois par capteur présent, avec ses dates extrêmes.
+    """
+    capteur = models.ForeignKey(Capteur, on_delete=models.CASCADE, related_name='archives')
+    fichier = models.CharField(max_length=100)  # relatif à MESURE_ARCHIVE_DIR, ex: "mesures-2024-01.csv.gz"
+    offset = models.BigIntegerField()
+    taille = models.BigIntegerField()
+    debut = models.DateTimeField()
+    fin = models.DateTimeField()  # dernier relevé inclus
+    nombre = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['capteur', 'debut'], name='archive_capteur_debut_idx')]
+
+    def __str__(self):
+        return f"{self.fichier}@{self.offset} {self.capteur_id} ({self.nombre})"
 
 
 class Alerte(models.Model):
@@ -40,6 +118,43 @@ class Alerte(models.Model):
         return f"Alerte {self.niveau} - {self.localisation.nom}"
 
 
+class Seuil(models.Model):
+    """Règle de déclenchement d'Alerte à partir des mesures d'un capteur (ou d'un type de capteur).
+
+    `mesure`: niveau = dernière valeur ; montee = hausse sur la fenêtre ;
+    cumul = somme des valeurs sur la fenêtre (pluviométrie). Une alerte est
+    levée au premier seuil (faible < moyen < fort) atteint, escaladée au
+    suivant, et le niveau ne redescend que sous `seuil - hysteresis`.
+    """
+    MESURES = [("niveau", "niveau"), ("montee", "vitesse de montée"), ("cumul", "cumul")]
+
+    capteur = models.ForeignKey(Capteur, on_delete=models.CASCADE, null=True, blank=True, related_name='seuils')
+    type_capteur = models.CharField(max_length=50, blank=True, default="")  # si pas de capteur précis
+    mesure = models.CharField(max_length=10, choices=MESURES, default="niveau")
+    fenetre_minutes = models.PositiveIntegerField(default=60)  # montee / cumul
+    faible = models.FloatField(null=True, blank=True)
+    moyen = models.FloatField(null=True, blank=True)
+    fort = models.FloatField(null=True, blank=True)
+    hysteresis = models.FloatField(default=0)
+    actif = models.BooleanField(default=True)
+
+    def __str__(self):
+        cible = self.capteur.code if self.capteur_id else self.type_capteur
+        return f"Seuil {self.mesure} {cible}"
+
+
+class EtatSeuil(models.Model):
+    """Niveau courant d'un seuil pour un capteur et alerte en cours."""
+    seuil = models.ForeignKey(Seuil, on_delete=models.CASCADE, related_name='etats')
+    capteur = models.ForeignKey(Capteur, on_delete=models.CASCADE, related_name='+')
+    niveau = models.CharField(max_length=10, blank=True, default="")  # "" = sous les seuils
+    alerte = models.ForeignKey('Alerte', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['seuil', 'capteur'], name='uniq_etat_seuil')]
+
+
 class Signalement(models.Model):
     """Signalement citoyen de terrain, potentiellement à l'origine d'une Alerte."""
     localisation = models.ForeignKey(Localisation, on_delete=models.CASCADE)
@@ -99,6 +214,43 @@ class AssistanceRequest(models.Model):
     availability = models.CharField(max_length=100, blank=True, default="")  # ou urgence texte libre
     urgency_note = models.TextField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
+    geohash = models.CharField(max_length=12, blank=True, default="", db_index=True)  # si location_text = "lat, lng"
+
+    def save(self, *args, **kwargs):
+        from notifications.geo import geohash_encode, parse_coordinates
+
+        coords = parse_coordinates(self.location_text)
+        self.geohash = geohash_encode(*coords) if coords else ""
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'geohash'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Assistance {self.id} - {self.help_type}"
+
+class ResourceVersion(models.Model):
+    """Version d'une ressource publique (cf. versions.py), incrémentée à chaque écriture."""
+    name = models.CharField(max_length=50, primary_key=True)  # "alertes", "localisations", "signalements"
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} v{self.value}"
+
+
+class CarteCellule(models.Model):
+    """Agrégat d'une cellule geohash pour la carte (cf. carte.py), tenu à jour à chaque écriture."""
+    couche = models.CharField(max_length=20)  # "alertes" | "signalements"
+    precision = models.PositiveSmallIntegerField()
+    cellule = models.CharField(max_length=12)  # préfixe geohash de longueur `precision`
+    nombre = models.IntegerField(default=0)
+    somme_lat = models.FloatField(default=0.0)
+    somme_lng = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['couche', 'precision', 'cellule'], name='carte_cellule_unique'),
+        ]
 
     def __str__(self):
-        return f"Assistance {self.id} - {self.help_type}"
\ No newline at end of file
+        return f"{self.couche} {self.cellule} ({self.nombre})"
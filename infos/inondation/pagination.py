@@ -0,0 +1,116 @@
+"""Pagination par curseur (keyset) des mesures.
+
+Les pages sont ordonnées par (date_releve, id) et le curseur encode la clé
+de la dernière ligne servie: la page suivante est lue par
+`WHERE (date_releve, id) > (d, i) ORDER BY date_releve, id LIMIT n`, qui
+descend directement dans l'index (capteur, date_releve, id) ou
+(date_releve, id). Le coût d'une page ne dépend donc pas de sa position,
+contrairement à OFFSET qui relit toutes les lignes précédentes.
+
+Paramètres: `page_size` (défaut 100, max 10000), `cursor` (fourni par
+`next`), `order=desc` pour parcourir du plus récent au plus ancien. Au-delà de
+`STREAM_THRESHOLD` lignes, la page est envoyée en flux (StreamingHttpResponse)
+sans passer par le sérialiseur, pour ne pas la construire en mémoire.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+FIELDS = ("id", "valeur", "unite", "date_releve", "capteur")
+COLUMNS = ("id", "valeur", "capteur__unite", "date_releve", "capteur")  # l'unité est portée par le capteur
+
+
+class MesureKeysetPagination(BasePagination):
+    page_size = 100
+    max_page_size = 10000
+    STREAM_THRESHOLD = 1000
+
+    def _encode(self, row):
+        raw = f"{row['date_releve'].isoformat()}|{row['id']}".encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def _decode(self, cursor):
+        try:
+            date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(date), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("curseur invalide")
+
+    def _setup(self, request):
+        try:
+            size = int(request.query_params.get("page_size", self.page_size))
+        except ValueError:
+            size = self.page_size
+        self.size = max(1, min(size, self.max_page_size))
+        self.desc = request.query_params.get("order") == "desc"
+        self.request = request
+
+    def _page_queryset(self, queryset):
+        cursor = self.request.query_params.get("cursor")
+        if cursor:
+            date, pk = self._decode(cursor)
+            # Borne simple sur date_releve (parcours d'index), puis départage par id
+            if self.desc:
+                queryset = queryset.filter(Q(date_releve__lt=date) | Q(id__lt=pk), date_releve__lte=date)
+            else:
+                queryset = queryset.filter(Q(date_releve__gt=date) | Q(id__gt=pk), date_releve__gte=date)
+        ordering = ("-date_releve", "-id") if self.desc else ("date_releve", "id")
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        return queryset.order_by(*ordering)[:self.size + 1]
+
+    def _next_link(self, last_row):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, "cursor", self._encode(last_row))
+
+    def wants_stream(self, request):
+        self._setup(request)
+        return self.size > self.STREAM_THRESHOLD
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._setup(request)
+        rows = list(self._page_queryset(queryset))
+        self.has_next = len(rows) > self.size
+        rows = rows[:self.size]
+        self.next = self._next_link({"date_releve": rows[-1].date_releve, "id": rows[-1].id}) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next, "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def stream_response(self, queryset):
+        """Page envoyée au fil de la lecture (curseur serveur, pas de liste en mémoire)."""
+        rows = self._page_queryset(queryset).values_list(*COLUMNS).iterator(chunk_size=2000)
+        dates = serializers.DateTimeField()
+
+        def generate():
+            yield b'{"results":['
+            last, count, has_next = None, 0, False
+            for values in rows:
+                if count == self.size:
+                    has_next = True
+                    break
+                last = dict(zip(FIELDS, values))
+                row = dict(last, date_releve=dates.to_representation(last["date_releve"]))
+                yield (b"," if count else b"") + json.dumps(row).encode()
+                count += 1
+            next_link = self._next_link(last) if has_next else None
+            yield b'],"next":' + json.dumps(next_link).encode() + b"}"
+
+        return StreamingHttpResponse(generate(), content_type="application/json")
@@ -0,0 +1,267 @@
+"""Diffusion temps réel des événements métier vers les flux SSE.
+
+Les signaux post_save (cf. signals.py) publient des événements dans le
+`broadcaster` du processus. Chaque événement reçoit un id croissant et est
+sérialisé une seule fois en trame SSE ; les derniers événements sont gardés
+dans un tampon circulaire pour rejouer ce qu'un client a manqué lorsqu'il se
+reconnecte avec l'en-tête `Last-Event-ID`.
+
+Types d'événements (alignés sur le front, cf. useRealtime.ts):
+  - "alert"  : création/mise à jour d'une Alerte ;
+  - "report" : création d'un Signalement ou changement de statut ;
+  - "metric" : nouvelle Mesure de capteur.
+
+Chaque client peut filtrer son flux (cf. StreamFilter): par sujets, par codes
+de capteurs et par bounding box. Le routage passe par des index précalculés
+(sujet -> clients, capteur -> clients, cellule de grille -> clients) pour ne
+toucher que les clients concernés par un événement.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from math import floor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.timezone import now
+
+
+TOPICS = ("alerts", "signalements", "signalement_status", "mesures")
+# Réservés au personnel, comme la liste des signalements et leur couche sur la carte
+STAFF_TOPICS = frozenset({"signalements", "signalement_status"})
+DEFAULT_TOPICS = {"alert": ("alerts",), "report": ("signalements",), "metric": ("mesures",)}
+
+# Grilles de l'index géographique: fine pour les vues de quartier, grossière
+# pour les vues de ville/région ; au-delà, la bbox est ignorée.
+GRID_LEVELS = (0.05, 1.0)
+MAX_CELLS_PER_LEVEL = 256
+
+
+def _cell(level: float, lat: float, lng: float):
+    return (level, floor(lat / level), floor(lng / level))
+
+
+class Event:
+    __slots__ = ("id", "type", "payload", "topics", "point", "capteur", "frame")
+
+    def __init__(self, event_id: int, event_type: str, payload: dict,
+                 topics=None, point=None, capteur: str = None):
+        self.id = event_id
+        self.type = event_type
+        self.payload = payload
+        self.topics = tuple(topics or DEFAULT_TOPICS.get(event_type, ()))
+        self.point = point  # (lat, lng) ou None
+        self.capteur = capteur
+        data = json.dumps({"type": event_type, "ts": now().isoformat(), "payload": payload}, cls=DjangoJSONEncoder)
+        # Trame SSE sans nom d'événement: reçue par `EventSource.onmessage`.
+        # Sans id (état initial), elle ne modifie pas le Last-Event-ID du client.
+        head = f"id: {event_id}\n" if event_id is not None else ""
+        self.frame = f"{head}data: {data}\n\n".encode("utf-8")
+
+
+class StreamFilter:
+    """Filtre d'un client: sujets, codes de capteurs (sujet mesures) et bbox.
+
+    Paramètres de requête acceptés par /api/realtime/stream:
+      - topics=alerts,signalements,signalement_status,mesures (sans ce
+        paramètre: tous les sujets accessibles au client)
+      - capteurs=CODE1,CODE2 (restreint le sujet mesures)
+      - bbox=minLng,minLat,maxLng,maxLat
+    """
+
+    def __init__(self, topics=None, capteurs=None, bbox=None):
+        self.topics = frozenset(topics) if topics else frozenset(TOPICS)
+        self.capteurs = frozenset(capteurs) if capteurs else None
+        self.bbox = bbox  # (min_lat, min_lng, max_lat, max_lng) ou None
+        self.level = None
+        if bbox is not None:
+            for level in GRID_LEVELS:
+                _, r0, c0, r1, c1 = self._span(level)
+                if (r1 - r0 + 1) * (c1 - c0 + 1) <= MAX_CELLS_PER_LEVEL:
+                    self.level = level
+                    break
+            else:
+                self.bbox = None  # zone trop vaste: pas de filtre géographique
+
+    @classmethod
+    def from_params(cls, params, staff: bool = False):
+        def split(name):
+            return [v.strip() for v in (params.get(name) or "").split(",") if v.strip()]
+
+        allowed = TOPICS if staff else tuple(t for t in TOPICS if t not in STAFF_TOPICS)
+        topics = [t for t in split("topics") if t in allowed] or list(allowed)
+        bbox = None
+        parts = split("bbox")
+        if len(parts) == 4:
+            try:
+                min_lng, min_lat, max_lng, max_lat = (float(p) for p in parts)
+                bbox = (min(min_lat, max_lat), min(min_lng, max_lng), max(min_lat, max_lat), max(min_lng, max_lng))
+            except ValueError:
+                bbox = None
+        return cls(topics=topics, capteurs=split("capteurs"), bbox=bbox)
+
+    def _span(self, level: float):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        _, r0, c0 = _cell(level, min_lat, min_lng)
+        _, r1, c1 = _cell(level, max_lat, max_lng)
+        return level, r0, c0, r1, c1
+
+    def cells(self, level: float):
+        level, r0, c0, r1, c1 = self._span(level)
+        return [(level, r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def contains(self, point) -> bool:
+        if self.bbox is None:
+            return True
+        if point is None:
+            return False
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return min_lat <= point[0] <= max_lat and min_lng <= point[1] <= max_lng
+
+    def matches(self, event: Event) -> bool:
+        if not self.topics.intersection(event.topics):
+            return False
+        if "mesures" in event.topics and self.capteurs is not None and event.capteur not in self.capteurs:
+            return False
+        return self.contains(event.point)
+
+    def index_keys(self):
+        """Clés d'index sous lesquelles ranger ce client."""
+        keys = []
+        for topic in self.topics:
+            if topic == "mesures" and self.capteurs is not None:
+                keys.extend(("capteur", code) for code in self.capteurs)
+            elif self.bbox is not None:
+                keys.extend(("cell", topic, cell) for cell in self.cells(self.level))
+            else:
+                keys.append(("topic", topic))
+        return keys
+
+
+class Subscriber:
+    """File d'attente d'un client SSE asynchrone, alimentée depuis n'importe quel thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int, stream_filter: StreamFilter = None):
+        self.loop = loop
+        self.filter = stream_filter or StreamFilter()
+        self.keys = self.filter.index_keys()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _put(self, event: Event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client trop lent: on le déconnecte, il rejouera via Last-Event-ID
+            self.overflowed = True
+
+    def deliver(self, event: Event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+
+class Broadcaster:
+    def __init__(self, history: int = 1000, queue_size: int = 1000):
+        self._seq = 0
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._index = defaultdict(set)  # clé d'index -> clients
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.queue_size = queue_size
+
+    @property
+    def last_id(self) -> int:
+        with self._lock:
+            return self._history[-1].id if self._history else 0
+
+    def publish(self, event_type: str, payload: dict, topics=None, point=None, capteur: str = None,
+                event_id: int = None) -> Event:
+        """Diffuse un événement ; `event_id` est fourni par le bus inter-processus."""
+        with self._lock:
+            # Les ids restent strictement croissants dans le tampon
+            self._seq = event_id if event_id is not None and event_id > self._seq else self._seq + 1
+            event = Event(self._seq, event_type, payload, topics=topics, point=point, capteur=capteur)
+            self._history.append(event)
+            recipients = self._route(event)
+            self._changed.notify_all()
+        for sub in recipients:
+            try:
+                sub.deliver(event)
+            except RuntimeError:
+                # Boucle d'événements fermée: client parti sans se désinscrire
+                self.unsubscribe(sub)
+        return event
+
+    def _route(self, event: Event):
+        """Clients concernés, via les index (sans parcourir tous les abonnés)."""
+        index = self._index
+        recipients = set()
+        for topic in event.topics:
+            recipients.update(index.get(("topic", topic), ()))
+            if event.point is not None:
+                for level in GRID_LEVELS:
+                    cell = _cell(level, *event.point)
+                    recipients.update(
+                        s for s in index.get(("cell", topic, cell), ()) if s.filter.contains(event.point)
+                    )
+        if event.capteur is not None:
+            recipients.update(
+                s for s in index.get(("capteur", event.capteur), ()) if s.filter.contains(event.point)
+            )
+        return recipients
+
+    def since(self, last_id: int):
+        """Événements postérieurs à `last_id` encore présents dans le tampon.
+
+        Un id supérieur au dernier connu vient d'un processus précédent
+        (redémarrage): tout le tampon est alors renvoyé.
+        """
+        with self._lock:
+            if self._history and last_id > self._history[-1].id:
+                last_id = 0
+            return [e for e in self._history if e.id > last_id]
+
+    def subscribe(self, last_id: int = None, stream_filter: StreamFilter = None):
+        """Abonne le client courant (à appeler depuis la boucle asyncio).
+
+        Renvoie (subscriber, événements à rejouer) ; l'inscription et la
+        lecture du tampon sont atomiques, aucun événement n'est perdu entre les deux.
+        """
+        sub = Subscriber(asyncio.get_running_loop(), self.queue_size, stream_filter)
+        with self._lock:
+            self._subscribers.add(sub)
+            for key in sub.keys:
+                self._index[key].add(sub)
+            backlog = []
+            if last_id is not None:
+                if self._history and last_id > self._history[-1].id:
+                    last_id = 0
+                backlog = [e for e in self._history if e.id > last_id and sub.filter.matches(e)]
+        return sub, backlog
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.discard(sub)
+                for key in sub.keys:
+                    bucket = self._index.get(key)
+                    if bucket is not None:
+                        bucket.discard(sub)
+                        if not bucket:
+                            del self._index[key]
+
+    def wait(self, last_id: int, timeout: float):
+        """Version bloquante (flux WSGI): attend un événement postérieur à `last_id`."""
+        with self._changed:
+            if not self._history or self._history[-1].id <= last_id:
+                self._changed.wait(timeout)
+        return self.since(last_id)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+broadcaster = Broadcaster(history=getattr(settings, "REALTIME_HISTORY_SIZE", 1000))
@@ -0,0 +1,221 @@
+"""Agrégats des mesures par capteur à la minute, à l'heure et au jour.
+
+Les agrégats (MesureRollup: nombre, somme, min, max) sont mis à jour au fil
+de l'eau dans la transaction qui crée les mesures (post_save ou ingestion en
+masse). `manage.py rollup_backfill` les reconstruit depuis l'historique ;
+c'est aussi le moyen de les corriger après une modification ou suppression
+de mesures, qui ne sont pas répercutées. Les jours déjà archivés (archive.py)
+ne sont pas recalculés: leurs mesures brutes ne sont plus en base.
+
+Une série demandée avec une résolution (ex. 15m, 1h, 6h, 1d) est servie par
+l'agrégat le plus grossier dont l'intervalle divise cette résolution, puis
+regroupée si besoin ; les mesures brutes ne sont lues que pour une résolution
+plus fine que la minute.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from . import archive
+from .bulk import update_rows
+from .fields import compact_storage
+from .models import Mesure, MesureRollup
+
+RESOLUTION_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_DURATION_RE = re.compile(r"^(\d+)\s*([smhd])$")
+
+
+def parse_resolution(raw: str):
+    """"15m", "1h", "day", "300"... -> secondes ; "raw" -> None."""
+    raw = (raw or "").strip().lower()
+    if raw == "raw":
+        return None
+    if raw in RESOLUTION_SECONDS:
+        return RESOLUTION_SECONDS[raw]
+    if raw.isdigit():
+        seconds = int(raw)
+    else:
+        match = _DURATION_RE.match(raw)
+        if not match:
+            raise ValueError(f"résolution invalide: {raw!r}")
+        seconds = int(match.group(1)) * _UNITS[match.group(2)]
+    if seconds <= 0:
+        raise ValueError(f"résolution invalide: {raw!r}")
+    return seconds
+
+
+def parse_instant(raw: str):
+    """ISO 8601 ou epoch (secondes) -> datetime aware, None si absent."""
+    if not raw:
+        return None
+    try:
+        return datetime.fromtimestamp(float(raw), tz=dt_timezone.utc)
+    except ValueError:
+        pass
+    dt = parse_datetime(raw)
+    if dt is None:
+        raise ValueError(f"date invalide: {raw!r}")
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def bucket_start(dt: datetime, seconds: int) -> datetime:
+    ts = int(dt.timestamp())
+    return datetime.fromtimestamp(ts - ts % seconds, tz=dt_timezone.utc)
+
+
+def _aggregate(mesures):
+    """{resolution: {(capteur_id, bucket): [count, total, min, max]}}"""
+    out = {res: {} for res in RESOLUTION_SECONDS}
+    for m in mesures:
+        for res, seconds in RESOLUTION_SECONDS.items():
+            key = (m.capteur_id, bucket_start(m.date_releve, seconds))
+            agg = out[res].get(key)
+            if agg is None:
+                out[res][key] = [1, m.valeur, m.valeur, m.valeur]
+            else:
+                agg[0] += 1
+                agg[1] += m.valeur
+                agg[2] = min(agg[2], m.valeur)
+                agg[3] = max(agg[3], m.valeur)
+    return out
+
+
+def _merge(res: str, groups: dict):
+    capteurs = {c for c, _ in groups}
+    buckets = [b for _, b in groups]
+    existing = {
+        (r.capteur_id, r.bucket): r
+        for r in MesureRollup.objects.select_for_update().filter(
+            capteur_id__in=capteurs, resolution=res, bucket__range=(min(buckets), max(buckets)),
+        )
+    }
+    to_update, to_create = [], []
+    for key, (count, total, low, high) in groups.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(MesureRollup(
+                capteur_id=key[0], resolution=res, bucket=key[1],
+                count=count, total=total, minimum=low, maximum=high,
+            ))
+        else:
+            row.count += count
+            row.total += total
+            row.minimum = min(row.minimum, low)
+            row.maximum = max(row.maximum, high)
+            to_update.append(row)
+    update_rows(MesureRollup, to_update, ["count", "total", "minimum", "maximum"])
+    MesureRollup.objects.bulk_create(to_create, batch_size=500)
+
+
+def apply(mesures):
+    """Ajoute des mesures (déjà enregistrées) aux agrégats."""
+    mesures = list(mesures)
+    if not mesures:
+        return
+    for res, groups in _aggregate(mesures).items():
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    _merge(res, groups)
+                break
+            except IntegrityError:
+                # Un autre processus a créé le même intervalle entre-temps: on relit
+                if attempt:
+                    raise
+
+
+def _truncate(res: str):
+    """Début d'intervalle calculé en base (secondes epoch entières en stockage compact)."""
+    if not compact_storage():
+        return Trunc("date_releve", res, tzinfo=dt_timezone.utc)
+    seconds = RESOLUTION_SECONDS[res]
+    return ExpressionWrapper(F("date_releve") - F("date_releve") % seconds,
+                             output_field=Mesure._meta.get_field("date_releve"))
+
+
+def backfill(capteur_ids=None, since: datetime = None) -> int:
+    """Recalcule les agrégats depuis les mesures brutes ; renvoie le nombre de lignes écrites."""
+    if since is not None:
+        since = bucket_start(since, RESOLUTION_SECONDS["day"])
+    mesures = Mesure.objects.all()
+    if capteur_ids is not None:
+        mesures = mesures.filter(capteur_id__in=capteur_ids)
+    ids = list(mesures.values_list("capteur_id", flat=True).distinct().order_by())
+    written = 0
+    for capteur_id in ids:
+        source = Mesure.objects.filter(capteur_id=capteur_id)
+        rollups = MesureRollup.objects.filter(capteur_id=capteur_id)
+        start = since
+        archived = archive.horizon(capteur_id)
+        if archived is not None:
+            # Agrégats gardés jusqu'au dernier jour archivé inclus
+            first_day = bucket_start(archived, RESOLUTION_SECONDS["day"]) + timedelta(days=1)
+            start = first_day if start is None else max(start, first_day)
+        if start is not None:
+            source = source.filter(date_releve__gte=start)
+            rollups = rollups.filter(bucket__gte=start)
+        with transaction.atomic():
+            rollups.delete()
+            for res in RESOLUTION_SECONDS:
+                rows = (
+                    source.annotate(bucket=_truncate(res))
+                    .values("bucket")
+                    .annotate(count=Count("id"), total=Sum("valeur"), minimum=Min("valeur"), maximum=Max("valeur"))
+                    .order_by()
+                )
+                objs = [MesureRollup(capteur_id=capteur_id, resolution=res, **row) for row in rows.iterator()]
+                MesureRollup.objects.bulk_create(objs, batch_size=1000)
+                written += len(objs)
+    return written
+
+
+def source_for(seconds):
+    """Agrégat le plus grossier utilisable pour une résolution (None: mesures brutes)."""
+    for res in ("day", "hour", "minute"):
+        if seconds is not None and seconds % RESOLUTION_SECONDS[res] == 0:
+            return res
+    return None
+
+
+def series(capteur_ids, start: datetime, end: datetime, seconds: int):
+    """Série agrégée [start, end) par capteur et par intervalle de `seconds`."""
+    res = source_for(seconds)
+    groups = defaultdict(lambda: [0, 0.0, None, None])
+    if res is not None:
+        rows = MesureRollup.objects.filter(resolution=res, bucket__gte=bucket_start(start, RESOLUTION_SECONDS[res]),
+                                           bucket__lt=end)
+        if capteur_ids is not None:
+            rows = rows.filter(capteur_id__in=capteur_ids)
+        items = rows.values_list("capteur_id", "bucket", "count", "total", "minimum", "maximum").iterator()
+    else:
+        rows = Mesure.objects.filter(date_releve__gte=start, date_releve__lt=end)
+        if capteur_ids is not None:
+            rows = rows.filter(capteur_id__in=capteur_ids)
+        items = ((c, d, 1, v, v, v) for c, d, v in rows.values_list("capteur_id", "date_releve", "valeur").iterator())
+
+    for capteur_id, bucket, count, total, low, high in items:
+        agg = groups[(capteur_id, bucket_start(bucket, seconds))]
+        agg[0] += count
+        agg[1] += total
+        agg[2] = low if agg[2] is None else min(agg[2], low)
+        agg[3] = high if agg[3] is None else max(agg[3], high)
+
+    return res or "raw", [
+        {
+            "capteur": capteur_id,
+            "bucket": bucket,
+            "count": count,
+            "min": low,
+            "max": high,
+            "avg": total / count,
+            "sum": total,
+        }
+        for (capteur_id, bucket), (count, total, low, high) in sorted(groups.items())
+    ]
@@ -0,0 +1,227 @@
+"""Recherche plein texte des alertes (`?search=` de AlerteViewSet).
+
+Index séparé, tenu à jour par des triggers en base (y compris pour
+bulk_create, update() et le renommage d'une localisation):
+  - SQLite: table FTS5 (message, niveau, nom du lieu), tokenizer unicode61
+    sans diacritiques ("inondé" = "inonde"), racinisation légère des mots
+    cherchés (`stem`), classement bm25 ;
+  - PostgreSQL: tsvector 'french' + unaccent (racinisation) dans une table
+    annexe avec index GIN, classement ts_rank.
+
+Chaque mot saisi est cherché en préfixe (recherche à la frappe), tous les
+mots doivent être présents. Ailleurs (autre moteur), `filter_alertes`
+revient aux icontains. `install()` recrée l'index et le remplit.
+
+SQLite ne reconstruit pas (migration qui ajoute une colonne indexée...)
+inondation_alerte ou inondation_localisation tant que ces triggers y font
+référence: la migration appelle `uninstall()` avant et `install()` après
+(cf. 0015). Si les triggers manquent, le contrôle `check_search_index` le
+signale et `manage.py alerte_search --rebuild` les remet en place.
+"""
+import re
+import unicodedata
+
+from django.core import checks
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+TABLE = 'inondation_alerte_fts'
+WORD = re.compile(r'\w+')
+# Racinisation légère des mots cherchés sous SQLite (FTS5 n'a pas de stemmer français):
+# cherchés en préfixe, "inondation" et "inondé" donnent tous deux "inond*"
+SUFFIXES = ('ations', 'ation', 'ements', 'ement', 'ees', 'ee', 'es', 'er', 'ez', 'e', 's')
+MIN_STEM = 4
+
+# Poids bm25 / ts_rank: message, niveau, lieu
+SQLITE_RANK = 'bm25(1.0, 0.5, 2.0)'
+
+SQLITE_TRIGGERS = {
+    'inondation_alerte_fts_ai': f"""
+        CREATE TRIGGER inondation_alerte_fts_ai AFTER INSERT ON inondation_alerte BEGIN
+            INSERT INTO {TABLE}(rowid, message, niveau, lieu)
+            SELECT new.id, new.message, new.niveau, nom FROM inondation_localisation WHERE id = new.localisation_id;
+        END""",
+    'inondation_alerte_fts_au': f"""
+        CREATE TRIGGER inondation_alerte_fts_au AFTER UPDATE OF message, niveau, localisation_id
+        ON inondation_alerte BEGIN
+            DELETE FROM {TABLE} WHERE rowid = old.id;
+            INSERT INTO {TABLE}(rowid, message, niveau, lieu)
+            SELECT new.id, new.message, new.niveau, nom FROM inondation_localisation WHERE id = new.localisation_id;
+        END""",
+    'inondation_alerte_fts_ad': f"""
+        CREATE TRIGGER inondation_alerte_fts_ad AFTER DELETE ON inondation_alerte BEGIN
+            DELETE FROM {TABLE} WHERE rowid = old.id;
+        END""",
+    'inondation_localisation_fts_au': f"""
+        CREATE TRIGGER inondation_localisation_fts_au AFTER UPDATE OF nom ON inondation_localisation BEGIN
+            UPDATE {TABLE} SET lieu = new.nom
+            WHERE rowid IN (SELECT id FROM inondation_alerte WHERE localisation_id = new.id);
+        END""",
+}
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5(message, niveau, lieu, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', '{SQLITE_RANK}')",
+    *SQLITE_TRIGGERS.values(),
+    f"INSERT INTO {TABLE}(rowid, message, niveau, lieu) SELECT a.id, a.message, a.niveau, l.nom "
+    "FROM inondation_alerte a JOIN inondation_localisation l ON l.id = a.localisation_id",
+    f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')",
+]
+
+PG_DOCUMENT = (
+    "setweight(to_tsvector('french', unaccent(coalesce(%(message)s, ''))), 'B') || "
+    "setweight(to_tsvector('french', unaccent(coalesce(%(niveau)s, ''))), 'C') || "
+    "setweight(to_tsvector('french', unaccent(coalesce(%(lieu)s, ''))), 'A')"
+)
+
+PG_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        alerte_id bigint PRIMARY KEY,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)",
+    f"""CREATE OR REPLACE FUNCTION inondation_alerte_fts_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM {TABLE} WHERE alerte_id = OLD.id;
+            RETURN NULL;
+        END IF;
+        INSERT INTO {TABLE}(alerte_id, document)
+        SELECT NEW.id, {PG_DOCUMENT % {'message': 'NEW.message', 'niveau': 'NEW.niveau', 'lieu': 'l.nom'}}
+        FROM inondation_localisation l WHERE l.id = NEW.localisation_id
+        ON CONFLICT (alerte_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS inondation_alerte_fts_sync ON inondation_alerte",
+    """CREATE TRIGGER inondation_alerte_fts_sync AFTER INSERT OR DELETE OR UPDATE OF message, niveau, localisation_id
+        ON inondation_alerte FOR EACH ROW EXECUTE FUNCTION inondation_alerte_fts_sync()""",
+    f"""CREATE OR REPLACE FUNCTION inondation_localisation_fts_sync() RETURNS trigger AS $$
+    BEGIN
+        UPDATE {TABLE} f SET document = {PG_DOCUMENT % {'message': 'a.message', 'niveau': 'a.niveau', 'lieu': 'NEW.nom'}}
+        FROM inondation_alerte a WHERE a.id = f.alerte_id AND a.localisation_id = NEW.id;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS inondation_localisation_fts_sync ON inondation_localisation",
+    """CREATE TRIGGER inondation_localisation_fts_sync AFTER UPDATE OF nom
+        ON inondation_localisation FOR EACH ROW EXECUTE FUNCTION inondation_localisation_fts_sync()""",
+]
+
+
+def supported(conn=None) -> bool:
+    return (conn or connection).vendor in ('sqlite', 'postgresql')
+
+
+def install(conn=None):
+    """(Re)crée l'index et ses triggers puis le remplit depuis les alertes existantes."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            uninstall(conn)
+            for sql in SQLITE_INSTALL:
+                cursor.execute(sql)
+        elif conn.vendor == 'postgresql':
+            for sql in PG_INSTALL:
+                cursor.execute(sql)
+            cursor.execute(
+                f"INSERT INTO {TABLE}(alerte_id, document) SELECT a.id, "
+                f"{PG_DOCUMENT % {'message': 'a.message', 'niveau': 'a.niveau', 'lieu': 'l.nom'}} "
+                "FROM inondation_alerte a JOIN inondation_localisation l ON l.id = a.localisation_id "
+                "ON CONFLICT (alerte_id) DO UPDATE SET document = EXCLUDED.document"
+            )
+
+
+def uninstall(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute("DROP TRIGGER IF EXISTS inondation_alerte_fts_sync ON inondation_alerte")
+            cursor.execute("DROP TRIGGER IF EXISTS inondation_localisation_fts_sync ON inondation_localisation")
+            cursor.execute("DROP FUNCTION IF EXISTS inondation_alerte_fts_sync()")
+            cursor.execute("DROP FUNCTION IF EXISTS inondation_localisation_fts_sync()")
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def stem(word: str) -> str:
+    word = ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def match_expression(text: str, vendor: str):
+    """Texte saisi -> requête du moteur (mots en préfixe, tous requis) ; None si aucun mot."""
+    words = WORD.findall(text.lower())
+    if not words:
+        return None
+    if vendor == 'postgresql':
+        return ' & '.join(f"{w}:*" for w in words)
+    return ' '.join(f'"{stem(w)}"*' for w in words)
+
+
+def filter_alertes(qs, text: str):
+    """Alertes correspondant à `text`, les plus pertinentes d'abord (puis les plus récentes)."""
+    vendor = connection.vendor
+    if not supported():
+        return qs.filter(
+            Q(message__icontains=text) | Q(niveau__icontains=text) | Q(localisation__nom__icontains=text)
+        )
+    query = match_expression(text, vendor)
+    if query is None:
+        return qs
+    if vendor == 'sqlite':
+        matches = RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [query])
+        # Rang lu dans l'ensemble des résultats, calculé une fois (index automatique sur id) ;
+        # un MATCH corrélé à chaque alerte relirait l'index plein texte ligne par ligne
+        rank = RawSQL(
+            f"SELECT m.rank FROM (SELECT rowid AS id, -rank AS rank FROM {TABLE} WHERE {TABLE} MATCH %s "
+            "LIMIT -1) m WHERE m.id = inondation_alerte.id", [query],
+            output_field=FloatField(),
+        )
+    else:
+        tsquery = "to_tsquery('french', unaccent(%s))"
+        matches = RawSQL(f"SELECT alerte_id FROM {TABLE} WHERE document @@ {tsquery}", [query])
+        rank = RawSQL(
+            f"SELECT ts_rank(document, {tsquery}) FROM {TABLE} WHERE alerte_id = inondation_alerte.id", [query],
+            output_field=FloatField(),
+        )
+    return qs.filter(id__in=matches).annotate(search_rank=rank).order_by('-search_rank', '-date_alerte')
+
+
+def index_installed(conn=None) -> bool:
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+                f"OR (type = 'trigger' AND name IN ({', '.join(['%s'] * len(SQLITE_TRIGGERS))}))",
+                [TABLE, *SQLITE_TRIGGERS],
+            )
+            return cursor.fetchone()[0] == 1 + len(SQLITE_TRIGGERS)
+        cursor.execute(
+            "SELECT COUNT(*) FROM pg_trigger WHERE tgname IN "
+            "('inondation_alerte_fts_sync', 'inondation_localisation_fts_sync')"
+        )
+        return cursor.fetchone()[0] == 2
+
+
+@checks.register(checks.Tags.database)
+def check_search_index(app_configs=None, databases=None, **kwargs):
+    if not databases or 'default' not in databases or not supported():
+        return []
+    if 'inondation_alerte' not in connection.introspection.table_names():
+        return []
+    if not index_installed():
+        return [checks.Warning(
+            "index de recherche des alertes absent ou incomplet (triggers supprimés par une migration ?)",
+            hint="manage.py alerte_search --rebuild",
+            id='inondation.W003',
+        )]
+    return []
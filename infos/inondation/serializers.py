@@ -1,7 +1,39 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+
+from .models import Localisation, Capteur, Mesure, Alerte, Signalement, Degat, AssistanceRequest
+
+
+def media_origin(request):
+    """Schéma + hôte des URLs de fichiers, calculés une fois par requête."""
+    if request is None:
+        return ''
+    origin = getattr(request, '_media_origin', None)
+    if origin is None:
+        origin = request._media_origin = request.build_absolute_uri('/')[:-1]
+    return origin
+
+
+def media_urls(request, files):
+    """URLs absolues des fichiers (SignalementPhoto, DegatPiece) ; ceux sans fichier sont ignorés."""
+    origin = media_origin(request)
+    urls = []
+    for f in files:
+        try:
+            url = f.file.url
+        except ValueError:
+            continue
+        urls.append(origin + url if url.startswith('/') else url)
+    return urls
+
+
+class MediaURLsField(serializers.ReadOnlyField):
+    """Relation vers des fichiers -> liste d'URLs ; la relation doit être préchargée (prefetch_related)."""
+
+    def to_representation(self, manager):
+        return media_urls(self.context.get('request'), manager.all())
 
-from .models import Localisation, Capteur, Mesure, Alerte
 
 class LocalisationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,9 +46,38 @@ class CapteurSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class MesureSerializer(serializers.ModelSerializer):
+    # L'unité est portée par le capteur: facultative en écriture, elle doit être la sienne
+    # (ou la fixe si le capteur n'en a pas encore)
+    unite = serializers.CharField(max_length=20, required=False, allow_blank=True, write_only=True)
+
     class Meta:
         model = Mesure
-        fields = '__all__'
+        fields = ['id', 'valeur', 'unite', 'date_releve', 'capteur']
+
+    def validate(self, attrs):
+        unite = attrs.pop('unite', '').strip()
+        capteur = attrs.get('capteur') or getattr(self.instance, 'capteur', None)
+        if capteur is not None:
+            if not capteur.unite and not unite:
+                raise serializers.ValidationError({'unite': "unite manquante (capteur sans unité)"})
+            if capteur.unite and unite and unite != capteur.unite:
+                raise serializers.ValidationError(
+                    {'unite': f"unite {unite} différente de celle du capteur ({capteur.unite})"}
+                )
+            self._new_unite = None if capteur.unite else unite
+        return attrs
+
+    def save(self, **kwargs):
+        capteur = self.validated_data.get('capteur') or getattr(self.instance, 'capteur', None)
+        if getattr(self, '_new_unite', None):
+            capteur.unite = self._new_unite
+            capteur.save(update_fields=['unite'])
+        return super().save(**kwargs)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['unite'] = instance.capteur.unite
+        return {name: data[name] for name in self.Meta.fields}
 
 class AlerteSerializer(serializers.ModelSerializer):
     localisation = LocalisationSerializer(read_only=True)
@@ -26,12 +87,44 @@ class AlerteSerializer(serializers.ModelSerializer):
         model = Alerte
         fields = ['id','localisation','niveau','message','date_alerte','has_signalement']
 
+    @staticmethod
+    def annotate(qs):
+        """Ajoute has_signalement (sous-requête EXISTS) pour éviter une requête par alerte."""
+        return qs.select_related('localisation').annotate(
+            has_signalement=Exists(Signalement.objects.filter(alerte_id=OuterRef('pk')))
+        )
+
     def get_has_signalement(self, obj):
-        try:
-            from .models import Signalement
-            return Signalement.objects.filter(alerte_id=obj.id).exists()
-        except Exception:
-            return False
+        value = getattr(obj, 'has_signalement', None)
+        if value is None:  # instance non annotée (création, mise à jour)
+            value = Signalement.objects.filter(alerte_id=obj.id).exists()
+        return value
+
+class SignalementSerializer(serializers.ModelSerializer):
+    alerte_id = serializers.IntegerField(read_only=True, allow_null=True)
+    photos = MediaURLsField()
+
+    class Meta:
+        model = Signalement
+        fields = ['id', 'description', 'severity', 'location_text', 'created_at', 'alerte_id', 'status', 'photos']
+
+class MySignalementSerializer(SignalementSerializer):
+    class Meta(SignalementSerializer.Meta):
+        fields = ['id', 'description', 'severity', 'location_text', 'created_at', 'alerte_id', 'photos']
+
+class DegatSerializer(serializers.ModelSerializer):
+    pieces = MediaURLsField()
+
+    class Meta:
+        model = Degat
+        fields = ['id', 'property_type', 'loss_amount_text', 'loss_description', 'people_affected', 'remarks',
+                  'created_at', 'pieces']
+
+class AssistanceRequestSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AssistanceRequest
+        fields = ['id', 'location_text', 'help_type', 'people_count', 'phone', 'availability', 'urgency_note',
+                  'created_at']
 
 class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
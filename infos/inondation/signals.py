@@ -0,0 +1,159 @@
+"""Publication des changements de modèles sur le flux temps réel."""
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Alerte, Capteur, Localisation, Signalement, SignalementPhoto, Mesure, Seuil
+from .eventbus import get_bus
+from .ingest import capteur_cache
+from . import carte, latest, rollups, versions
+from .thresholds import engine as threshold_engine, evaluate_on_commit
+
+
+def _publish_on_commit(event_type: str, payload: dict, **routing):
+    transaction.on_commit(lambda: get_bus().publish(event_type, payload, **routing))
+
+
+@lru_cache(maxsize=4096)
+def capteur_info(capteur_id: int):
+    """(code, (lat, lng), unité) d'un capteur, pour router les mesures sans requête par ligne."""
+    row = (
+        Capteur.objects.filter(pk=capteur_id)
+        .values_list("code", "localisation__latitude", "localisation__longitude", "unite")
+        .first()
+    )
+    if row is None:
+        return None, None, ""
+    return row[0], (row[1], row[2]), row[3]
+
+
+@receiver(post_save, sender=Capteur, dispatch_uid="realtime_capteur_cache")
+@receiver(post_delete, sender=Capteur, dispatch_uid="realtime_capteur_cache_delete")
+@receiver(post_save, sender=Localisation, dispatch_uid="realtime_localisation_cache")
+def _invalidate_capteur_info(sender, **kwargs):
+    capteur_info.cache_clear()
+    capteur_cache.clear()
+    threshold_engine.reload_rules()
+
+
+@receiver(post_save, sender=Seuil, dispatch_uid="thresholds_seuil")
+@receiver(post_delete, sender=Seuil, dispatch_uid="thresholds_seuil_delete")
+def _reload_seuils(sender, **kwargs):
+    threshold_engine.reload_rules()
+
+
+@receiver(post_save, sender=Alerte, dispatch_uid="version_alerte")
+@receiver(post_delete, sender=Alerte, dispatch_uid="version_alerte_delete")
+@receiver(post_save, sender=Localisation, dispatch_uid="version_localisation")
+@receiver(post_delete, sender=Localisation, dispatch_uid="version_localisation_delete")
+@receiver(post_save, sender=Signalement, dispatch_uid="version_signalement")
+@receiver(post_delete, sender=Signalement, dispatch_uid="version_signalement_delete")
+@receiver(post_save, sender=SignalementPhoto, dispatch_uid="version_signalement_photo")
+@receiver(post_delete, sender=SignalementPhoto, dispatch_uid="version_signalement_photo_delete")
+def _bump_versions(sender, **kwargs):
+    versions.bump(*versions.DEPENDENCIES[sender])
+
+
+@receiver(pre_save, sender=Alerte, dispatch_uid="carte_alerte_pre")
+@receiver(pre_save, sender=Signalement, dispatch_uid="carte_signalement_pre")
+def _carte_previous(sender, instance, update_fields=None, **kwargs):
+    # Localisation avant modification (pas de requête si update_fields l'exclut: changement de statut...)
+    instance._carte_localisation = None
+    if instance.pk is not None and (update_fields is None or 'localisation' in update_fields):
+        instance._carte_localisation = sender.objects.filter(pk=instance.pk).values_list(
+            'localisation_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Alerte, dispatch_uid="carte_alerte")
+@receiver(post_save, sender=Signalement, dispatch_uid="carte_signalement")
+def _carte_saved(sender, instance, created, update_fields=None, **kwargs):
+    layer = 'alertes' if sender is Alerte else 'signalements'
+    if created:
+        carte.moved(layer, None, instance.localisation_id)
+    elif getattr(instance, '_carte_localisation', None) is not None:
+        carte.moved(layer, instance._carte_localisation, instance.localisation_id)
+
+
+@receiver(post_delete, sender=Alerte, dispatch_uid="carte_alerte_delete")
+@receiver(post_delete, sender=Signalement, dispatch_uid="carte_signalement_delete")
+def _carte_deleted(sender, instance, **kwargs):
+    carte.moved('alertes' if sender is Alerte else 'signalements', instance.localisation_id, None)
+
+
+@receiver(pre_save, sender=Localisation, dispatch_uid="carte_localisation_pre")
+def _carte_localisation_previous(sender, instance, **kwargs):
+    instance._carte_position = carte.position(instance.pk) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Localisation, dispatch_uid="carte_localisation")
+def _carte_localisation_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_carte_position', None)
+    if not created and old is not None and old[0] != instance.geohash:
+        carte.localisation_moved(instance, old)
+
+
+def _localisation(loc):
+    return {"id": loc.id, "nom": loc.nom, "latitude": loc.latitude, "longitude": loc.longitude}
+
+
+@receiver(post_save, sender=Alerte, dispatch_uid="realtime_alerte")
+def alerte_saved(sender, instance, created, **kwargs):
+    loc = instance.localisation
+    _publish_on_commit("alert", {
+        "action": "created" if created else "updated",
+        "id": instance.id,
+        "niveau": instance.niveau,
+        "message": instance.message,
+        "date_alerte": instance.date_alerte,
+        "localisation": _localisation(loc),
+    }, point=(loc.latitude, loc.longitude))
+
+
+@receiver(post_save, sender=Signalement, dispatch_uid="realtime_signalement")
+def signalement_saved(sender, instance, created, update_fields=None, **kwargs):
+    topics = ["signalements"]
+    if created:
+        action = "created"
+    elif update_fields and set(update_fields) == {"status"}:
+        action = "status_changed"  # SignalementValidateView / SignalementResolveView
+        topics.append("signalement_status")
+    else:
+        action = "updated"
+    loc = instance.localisation
+    _publish_on_commit("report", {
+        "action": action,
+        "id": instance.id,
+        "status": instance.status,
+        "severity": instance.severity,
+        "type_incident": instance.type_incident,
+        "alerte_id": instance.alerte_id,
+        "localisation_id": instance.localisation_id,
+        "created_at": instance.created_at,
+    }, topics=topics, point=(loc.latitude, loc.longitude))
+
+
+def mesure_event(instance):
+    """(payload, routage) de l'événement "metric" d'une Mesure."""
+    code, point, unite = capteur_info(instance.capteur_id)
+    return {
+        "id": instance.id,
+        "capteur_id": instance.capteur_id,
+        "capteur": code,
+        "value": instance.valeur,
+        "unite": unite,
+        "date_releve": instance.date_releve,
+    }, {"point": point, "capteur": code}
+
+
+@receiver(post_save, sender=Mesure, dispatch_uid="realtime_mesure")
+def mesure_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    rollups.apply([instance])
+    latest.record([instance])
+    evaluate_on_commit([instance])
+    payload, routing = mesure_event(instance)
+    _publish_on_commit("metric", payload, **routing)
@@ -0,0 +1,9 @@
+"""Statistiques des métriques exposées (latences du bus, du démon d'ingestion, des envois push)."""
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Valeur au rang le plus proche de `pct` % dans une liste déjà triée (0.0 si vide)."""
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
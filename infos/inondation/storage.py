@@ -0,0 +1,113 @@
+"""Mode de stockage de la table Mesure (standard ou compact, cf. fields.py).
+
+Le mode est choisi par MESURE_COMPACT_STORAGE et doit correspondre à la
+table: `convert()` la réécrit par plages d'id (courtes transactions, reprise
+possible après interruption), application arrêtée, puis on bascule le
+réglage. Le contrôle `check_storage_mode`
+(`manage.py check --database default`, et avant `migrate`) signale un
+réglage qui ne correspond pas aux données. SQLite uniquement: ailleurs, les
+colonnes typées ne peuvent pas recevoir l'autre format.
+"""
+from django.core import checks
+from django.db import connection, transaction
+
+from .fields import compact_storage, value_scale
+from .models import Mesure
+
+MODES = ("standard", "compact")
+
+
+def _table():
+    return connection.ops.quote_name(Mesure._meta.db_table)
+
+
+def current_mode():
+    """Mode de la table en base, d'après le type déclaré de date_releve (None: pas de table)."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA table_info({_table()})")
+        declared = {row[1]: row[2].lower() for row in cursor.fetchall()}
+    if not declared:
+        return None
+    return "compact" if declared.get("date_releve") in ("integer", "bigint") else "standard"
+
+
+def convert(to: str, batch_size: int = 50000, log=None) -> int:
+    """Réécrit les mesures dans le format `to` ; renvoie le nombre de lignes converties.
+
+    Le type déclaré de la colonne compte (SQLite convertit les colonnes
+    `datetime` à la lecture): les dates sont recopiées dans une nouvelle
+    colonne par plages d'id, qui remplace ensuite l'ancienne.
+    """
+    if connection.vendor != "sqlite":
+        raise NotImplementedError("conversion du stockage des mesures: SQLite uniquement")
+    if current_mode() in (None, to):
+        return 0
+    scale = value_scale()
+    table = _table()
+    if to == "compact":
+        column = "releve_epoch integer NOT NULL DEFAULT 0"
+        assign = ("releve_epoch = CAST(strftime('%%s', date_releve) AS INTEGER), "
+                  f"valeur = CAST(ROUND(valeur * {scale}) AS INTEGER)")
+        pending, new = "releve_epoch = 0", "releve_epoch"
+    else:
+        column = "releve_texte datetime NOT NULL DEFAULT ''"
+        assign = ("releve_texte = strftime('%%Y-%%m-%%d %%H:%%M:%%S', date_releve, 'unixepoch'), "
+                  f"valeur = valeur * 1.0 / {scale}")
+        pending, new = "releve_texte = ''", "releve_texte"
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA table_info({table})")
+        if new not in {row[1] for row in cursor.fetchall()}:  # sinon: reprise d'une conversion interrompue
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        low, high = cursor.fetchone()
+    converted = 0
+    for start in range(low or 0, (high or 0) + 1, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {table} SET {assign} WHERE id >= %s AND id < %s AND {pending}",
+                           [start, start + batch_size])
+            converted += cursor.rowcount
+        if log:
+            log(converted)
+
+    # Bascule des colonnes en une transaction ; les index sur date_releve sont reconstruits
+    with connection.schema_editor() as editor:
+        for index in Mesure._meta.indexes:
+            editor.execute(f"DROP INDEX IF EXISTS {editor.quote_name(index.name)}")
+        editor.execute(f"ALTER TABLE {table} DROP COLUMN date_releve")
+        editor.execute(f"ALTER TABLE {table} RENAME COLUMN {new} TO date_releve")
+        for index in Mesure._meta.indexes:
+            editor.add_index(Mesure, index)
+    return converted
+
+
+def table_bytes():
+    """Octets occupés par la table et ses index (None si dbstat n'est pas disponible)."""
+    names = [Mesure._meta.db_table] + [index.name for index in Mesure._meta.indexes]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['%s'] * len(names))})", names
+            )
+            return cursor.fetchone()[0]
+    except Exception:
+        return None
+
+
+@checks.register(checks.Tags.database)
+def check_storage_mode(app_configs=None, databases=None, **kwargs):
+    if not databases or "default" not in databases:
+        return []
+    if compact_storage() and connection.vendor != "sqlite":
+        return [checks.Error("MESURE_COMPACT_STORAGE demande SQLite", id="inondation.E001")]
+    if connection.vendor != "sqlite":
+        return []
+    mode = current_mode()
+    expected = "compact" if compact_storage() else "standard"
+    if mode is not None and mode != expected:
+        return [checks.Error(
+            f"les mesures sont stockées en mode {mode} mais MESURE_COMPACT_STORAGE indique {expected}",
+            hint=f"manage.py mesure_storage --to {expected}, ou corriger MESURE_COMPACT_STORAGE",
+            id="inondation.E002",
+        )]
+    return []
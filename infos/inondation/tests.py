@@ -1,3 +1,930 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import archive, carte, daemon as ingest_daemon, export, latest, rollups, search, storage
+from .daemon import IngestDaemon
+from .eventbus import UnixSocketBus, run_hub
+from .feedcache import feed_cache
+from .ingest import encode_records, ingest, parse_records
+from .pagination import MesureKeysetPagination
+from .realtime import StreamFilter, broadcaster
+from .thresholds import ThresholdEngine
+from .models import (
+    Alerte, ArchiveMesure, AssistanceRequest, Capteur, CarteCellule, Degat, DegatPiece, Localisation, Mesure,
+    MesureRollup, Seuil, Signalement, SignalementPhoto,
+)
+
+
+class QueryBudgetTests(APITestCase):
+    """Nombre de requêtes SQL fixe par liste, quel que soit le nombre de lignes renvoyées.
+
+    Les listes conditionnelles (versions.py) lisent d'abord leur version: une requête de plus.
+    """
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True)
+        self.staff.groups.add(Group.objects.create(name='autorites'))
+        self.localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(
+            code='C1', type_capteur='niveau', localisation=self.localisation, unite='cm'
+        )
+
+    def add_rows(self, n):
+        start = Alerte.objects.count()
+        for i in range(start, start + n):
+            alerte = Alerte.objects.create(localisation=self.localisation, niveau='moyen', message=f'alerte {i}')
+            s = Signalement.objects.create(
+                localisation=self.localisation, alerte=alerte, created_by=self.staff, description=f's {i}'
+            )
+            SignalementPhoto.objects.create(signalement=s, file=f'signalements/p{i}a.jpg')
+            SignalementPhoto.objects.create(signalement=s, file=f'signalements/p{i}b.jpg')
+            d = Degat.objects.create(created_by=self.staff, property_type='maison')
+            DegatPiece.objects.create(degat=d, file=f'degats/d{i}.pdf')
+            AssistanceRequest.objects.create(created_by=self.staff, help_type='evacuation')
+            Mesure.objects.create(capteur=self.capteur, valeur=i, date_releve=timezone.now() - timedelta(minutes=i))
+            User.objects.create_user(f'u{i}').groups.add(Group.objects.get(name='autorites'))
+
+    def assert_budget(self, url, budget, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        for n in (1, 20):
+            self.add_rows(n)
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_alertes(self):
+        self.assert_budget('/api/alertes/', 2)
+
+    def test_signalements_by_alerte(self):
+        self.add_rows(1)
+        self.assert_budget(f'/api/signalements/?alerte_id={Alerte.objects.first().id}', 3)
+
+    def test_signalements(self):
+        self.assert_budget('/api/signalements/', 3, user=self.staff)
+
+    def test_my_signalements(self):
+        self.assert_budget('/api/signalements/mes/', 2, user=self.staff)
+
+    def test_degats(self):
+        self.assert_budget('/api/degats/', 2, user=self.staff)
+
+    def test_my_degats(self):
+        self.assert_budget('/api/degats/mes/', 2, user=self.staff)
+
+    def test_assistance(self):
+        self.assert_budget('/api/assistance/', 1, user=self.staff)
+
+    def test_my_assistance(self):
+        self.assert_budget('/api/assistance/mes/', 1, user=self.staff)
+
+    def test_users(self):
+        self.assert_budget('/api/users/', 2)
+
+    def test_capteurs(self):
+        self.assert_budget('/api/capteurs/', 1)
+
+    def test_mesures(self):
+        self.assert_budget('/api/mesures/', 1)
+
+    def test_payloads(self):
+        self.add_rows(1)
+        alerte = self.client.get('/api/alertes/').json()[0]
+        self.assertTrue(alerte['has_signalement'])
+        self.client.force_authenticate(self.staff)
+        signalement = self.client.get('/api/signalements/').json()[0]
+        self.assertEqual(
+            signalement['photos'],
+            ['http://testserver/media/signalements/p0a.jpg', 'http://testserver/media/signalements/p0b.jpg'],
+        )
+        self.assertEqual(self.client.get('/api/degats/mes/').json()[0]['pieces'],
+                         ['http://testserver/media/degats/d0.pdf'])
+
+
+class AlerteSearchTests(APITestCase):
+    def setUp(self):
+        self.medina = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.pikine = Localisation.objects.create(nom='Pikine', latitude=14.75, longitude=-17.39)
+        self.a = Alerte.objects.create(localisation=self.medina, niveau='fort', message='Rue inondée, eau stagnante')
+        self.b = Alerte.objects.create(localisation=self.pikine, niveau='moyen', message='Inondation près du canal')
+
+    def ids(self, text):
+        return [row['id'] for row in self.client.get('/api/alertes/', {'search': text}).json()]
+
+    def test_accents_and_stems(self):
+        self.assertEqual(sorted(self.ids('inonde')), [self.a.id, self.b.id])
+        self.assertEqual(self.ids('MEDINA'), [self.a.id])
+        self.assertEqual(self.ids('canal inondations'), [self.b.id])
+
+    def test_index_follows_updates(self):
+        Alerte.objects.filter(pk=self.b.pk).update(message='Caniveau bouché')
+        self.assertEqual(self.ids('canal'), [])
+        self.pikine.nom = 'Guédiawaye'
+        self.pikine.save()
+        self.assertEqual(self.ids('guediawaye'), [self.b.id])
+        self.b.delete()
+        self.assertEqual(self.ids('bouche'), [])
+
+    def test_place_name_ranks_above_message(self):
+        c = Alerte.objects.create(localisation=self.pikine, niveau='faible', message='Renfort venu de Médina')
+        self.assertEqual(self.ids('medina'), [self.a.id, c.id])
+        ranked = search.filter_alertes(Alerte.objects.all(), 'medina')
+        self.assertGreater(ranked[0].search_rank, ranked[1].search_rank)
+
+    def test_query_budget(self):
+        with self.assertNumQueries(2):  # version (ETag) + liste
+            self.client.get('/api/alertes/', {'search': 'inonde'})
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.alerte = Alerte.objects.create(localisation=self.localisation, niveau='fort', message='Rue inondée')
+
+    def test_not_modified_without_list_query(self):
+        for url in ('/api/alertes/', '/api/localisations/', f'/api/signalements/?alerte_id={self.alerte.id}'):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn('Last-Modified', first)
+            with self.assertNumQueries(1):
+                again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again['ETag'], first['ETag'])
+            by_date = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+            self.assertEqual(by_date.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        alertes = self.client.get('/api/alertes/')
+        localisations = self.client.get('/api/localisations/')
+        Signalement.objects.create(localisation=self.localisation, alerte=self.alerte, description='eau')
+        self.assertEqual(self.client.get('/api/alertes/', HTTP_IF_NONE_MATCH=alertes['ETag']).status_code, 200)
+        self.assertEqual(
+            self.client.get('/api/localisations/', HTTP_IF_NONE_MATCH=localisations['ETag']).status_code, 304
+        )
+        self.assertNotEqual(self.client.get('/api/alertes/?search=rue')['ETag'], alertes['ETag'])
+
+
+class FeedCacheTests(APITestCase):
+    def setUp(self):
+        caches['alertes'].clear()
+        self.localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.alerte = Alerte.objects.create(localisation=self.localisation, niveau='fort', message='Rue inondée')
+
+    def test_hit_and_invalidation(self):
+        first = self.client.get('/api/alertes/', {'level': 'high'})
+        with self.assertNumQueries(1):  # version seule
+            cached = self.client.get('/api/alertes/', {'level': 'high'})
+        self.assertEqual(cached.json(), first.json())
+        Signalement.objects.create(localisation=self.localisation, alerte=self.alerte, description='eau')
+        self.assertTrue(self.client.get('/api/alertes/', {'level': 'high'}).json()[0]['has_signalement'])
+
+    def test_stale_entry_while_recomputing(self):
+        first = self.client.get('/api/alertes/')
+        Alerte.objects.create(localisation=self.localisation, niveau='moyen', message='Canal bouché')
+        caches['alertes'].add(f'{feed_cache.key()}:lock', 1)  # un autre client recalcule
+        stale = self.client.get('/api/alertes/')
+        self.assertEqual(len(stale.json()), 1)
+        self.assertEqual(stale['ETag'], first['ETag'])
+        caches['alertes'].delete(f'{feed_cache.key()}:lock')
+        self.assertEqual(len(self.client.get('/api/alertes/').json()), 2)
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.client.get('/api/alertes/')
+        self.client.force_authenticate(User.objects.create_user('agent'))
+        with self.assertNumQueries(2):
+            self.client.get('/api/alertes/')
+
+
+class CarteTests(APITestCase):
+    BBOX = '-17.6,14.6,-17.3,14.8'
+
+    def setUp(self):
+        self.medina = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.pikine = Localisation.objects.create(nom='Pikine', latitude=14.75, longitude=-17.39)
+        for i in range(3):
+            Alerte.objects.create(localisation=self.medina, niveau='fort', message=f'Rue inondée {i}')
+        self.single = Alerte.objects.create(localisation=self.pikine, niveau='moyen', message='Canal bouché')
+
+    def cells(self):
+        return sorted(CarteCellule.objects.values_list('couche', 'precision', 'cellule', 'nombre'))
+
+    def test_clusters_and_points(self):
+        data = self.client.get('/api/carte/', {'bbox': self.BBOX, 'zoom': 12}).json()
+        self.assertEqual(data['type'], 'FeatureCollection')
+        clusters = [f for f in data['features'] if f['properties'].get('cluster')]
+        self.assertEqual([f['properties']['count'] for f in clusters], [3])
+        self.assertEqual(clusters[0]['geometry']['coordinates'], [-17.45, 14.68])
+        points = [f for f in data['features'] if not f['properties'].get('cluster')]
+        self.assertEqual([f['properties']['id'] for f in points], [self.single.id])
+        detail = self.client.get('/api/carte/', {'bbox': self.BBOX, 'zoom': 18}).json()
+        self.assertEqual(len(detail['features']), 4)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/carte/', {'bbox': '1,2,3'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/carte/', {'bbox': self.BBOX, 'zoom': 40}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/carte/', {'bbox': self.BBOX, 'layers': 'signalements'}).status_code, 403
+        )
+
+    def test_incremental_index_matches_rebuild(self):
+        moved = Alerte.objects.first()
+        moved.localisation = self.pikine
+        moved.save()
+        self.single.delete()
+        Signalement.objects.create(localisation=self.medina, description='eau')
+        self.pikine.latitude = 14.70
+        self.pikine.save()
+        incremental = self.cells()
+        carte.rebuild()
+        self.assertEqual(incremental, self.cells())
+
+
+class RealtimeStreamTests(TestCase):
+    async def read_frame(self, stream):
+        return (await asyncio.wait_for(anext(stream), 5)).decode()
+
+    async def test_async_stream_replays_then_follows_live_events(self):
+        missed = broadcaster.publish("alert", {"id": 1})
+        before = broadcaster.subscriber_count
+        response = await AsyncClient().get(
+            '/api/realtime/stream', {'topics': 'alerts'}, headers={'Last-Event-ID': str(missed.id - 1)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await self.read_frame(stream), 'retry: 5000\n\n')
+        self.assertIn(f'id: {missed.id}\n', await self.read_frame(stream))
+        self.assertEqual(broadcaster.subscriber_count, before + 1)
+        broadcaster.publish("metric", {"value": 1})  # autre sujet: filtré
+        live = broadcaster.publish("alert", {"id": 2})
+        self.assertIn(f'id: {live.id}\n', await self.read_frame(stream))
+        # Déconnexion du client: Django annule la tâche en attente sur le flux
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(broadcaster.subscriber_count, before)
+
+
+class RealtimeEventTests(TestCase):
+    def setUp(self):
+        self.localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+
+    def published(self, since):
+        return [(e.type, e.payload.get('action'), e.topics) for e in broadcaster.since(since)]
+
+    def test_model_events_are_published_after_commit(self):
+        start = broadcaster.last_id
+        with self.captureOnCommitCallbacks(execute=True):
+            alerte = Alerte.objects.create(localisation=self.localisation, niveau='fort', message='Rue inondée')
+            self.assertEqual(broadcaster.last_id, start)  # rien avant le commit
+        with self.captureOnCommitCallbacks(execute=True):
+            s = Signalement.objects.create(localisation=self.localisation, alerte=alerte, description='eau')
+            s.status = 'verified'
+            s.save(update_fields=['status'])
+        self.assertEqual(self.published(start), [
+            ('alert', 'created', ('alerts',)),
+            ('report', 'created', ('signalements',)),
+            ('report', 'status_changed', ('signalements', 'signalement_status')),
+        ])
+        event = broadcaster.since(start)[0]
+        self.assertEqual(event.point, (14.68, -17.45))
+        self.assertIn('"message": "Rue inond\\u00e9e"'.encode(), event.frame)
+
+    def test_replay_after_last_event_id(self):
+        first = broadcaster.publish('alert', {'id': 1})
+        second = broadcaster.publish('alert', {'id': 2})
+        self.assertEqual([e.id for e in broadcaster.since(first.id)], [second.id])
+        # Id inconnu (processus redémarré): tout le tampon est rejoué
+        self.assertEqual(broadcaster.since(second.id + 1000)[-1].id, second.id)
+
+
+class RealtimeFilterTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_topics_capteurs_and_bbox(self):
+        f = StreamFilter.from_params({
+            'topics': 'alerts,mesures', 'capteurs': 'C1', 'bbox': '-17.5,14.6,-17.4,14.7',
+        })
+        alert_in = broadcaster.publish('alert', {}, point=(14.65, -17.45))
+        alert_out = broadcaster.publish('alert', {}, point=(14.75, -17.45))
+        metric_c1 = broadcaster.publish('metric', {}, point=(14.65, -17.45), capteur='C1')
+        metric_c2 = broadcaster.publish('metric', {}, point=(14.65, -17.45), capteur='C2')
+        self.assertEqual([f.matches(e) for e in (alert_in, alert_out, metric_c1, metric_c2)],
+                         [True, False, True, False])
+
+    def test_signalement_topics_are_staff_only(self):
+        self.assertEqual(StreamFilter.from_params({}).topics, {'alerts', 'mesures'})
+        self.assertEqual(StreamFilter.from_params({'topics': 'signalements'}).topics, {'alerts', 'mesures'})
+        self.assertEqual(StreamFilter.from_params({}, staff=True).topics,
+                         {'alerts', 'signalements', 'signalement_status', 'mesures'})
+
+    async def first_event(self, response):
+        stream = aiter(response.streaming_content)
+        await anext(stream)  # retry
+        broadcaster.publish('report', {'id': 1}, topics=['signalements', 'signalement_status'])
+        broadcaster.publish('alert', {'id': 2})
+        frame = (await asyncio.wait_for(anext(stream), 5)).decode()
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        return frame
+
+    async def test_stream_rejects_or_hides_staff_topics_for_anonymous_clients(self):
+        client = AsyncClient()
+        response = await client.get('/api/realtime/stream', {'topics': 'signalement_status'})
+        self.assertEqual(response.status_code, 403)
+        response = await client.get('/api/realtime/stream', {'token': 'invalide', 'topics': 'signalements'})
+        self.assertEqual(response.status_code, 403)
+        frame = await self.first_event(await client.get('/api/realtime/stream'))
+        self.assertIn('"type": "alert"', frame)
+
+    async def test_staff_token_opens_staff_topics(self):
+        token = str(AccessToken.for_user(self.staff))
+        response = await AsyncClient().get('/api/realtime/stream', {'topics': 'signalement_status', 'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"type": "report"', await self.first_event(response))
+
+
+class EventBusTests(SimpleTestCase):
+    def start_hub(self, path):
+        ready = threading.Event()
+        hub = {}
+
+        async def serve():
+            hub['loop'], hub['task'] = asyncio.get_running_loop(), asyncio.current_task()
+            await run_hub(path, ready)
+
+        def run():
+            try:
+                asyncio.run(serve())  # annule aussi les connexions encore ouvertes
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.assertTrue(ready.wait(5))
+
+        def stop():
+            hub['loop'].call_soon_threadsafe(hub['task'].cancel)
+            thread.join(5)
+
+        self.addCleanup(stop)
+
+    def bus(self, path):
+        received = []
+        bus = UnixSocketBus(path, on_event=lambda *args, **kwargs: received.append((args, kwargs)))
+        return bus, received
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_hub_numbers_and_fans_out_to_every_worker(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bus.sock')
+        self.start_hub(path)
+        (a, got_a), (b, got_b) = self.bus(path), self.bus(path)
+        for bus in (a, b):
+            bus.start()
+            self.assertTrue(bus.wait_connected())
+        a.publish('alert', {'id': 1}, point=(14.7, -17.4))
+        b.publish('metric', {'value': 2}, capteur='C1')
+        self.assertTrue(self.wait_for(lambda: len(got_a) == 2 and len(got_b) == 2))
+        self.assertEqual(got_a, got_b)
+        (args, first), (_, second) = got_a
+        self.assertEqual(args, ('alert', {'id': 1}))
+        self.assertEqual(first['point'], [14.7, -17.4])
+        self.assertEqual(second['event_id'], first['event_id'] + 1)
+        self.assertEqual(a.stats()['received'], 2)
+
+    def test_local_delivery_when_the_hub_is_down(self):
+        bus, received = self.bus(os.path.join(tempfile.mkdtemp(), 'absent.sock'))
+        bus.publish('alert', {'id': 1})
+        self.assertEqual(received[0][0], ('alert', {'id': 1}))
+        self.assertIsNone(received[0][1]['event_id'])
+
+
+class MesureIngestTests(APITestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.now = int(timezone.now().timestamp()) - 60
+
+    def post(self, body, content_type, query=''):
+        return self.client.generic('POST', f'/api/mesures/bulk/{query}', body, content_type=content_type)
+
+    def errors(self, response):
+        return {row['row']: row['error'] for row in response.json()['rejected']}
+
+    def test_out_of_range_epochs_are_rejected_per_row(self):
+        rows = [
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': self.now},
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': 1_700_000_000_000},  # millisecondes envoyées comme secondes
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': -1e14},
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': 10 ** 400},
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': 'hier'},
+            {'capteur': 'C1', 'valeur': 1.5, 'ts': '9999-12-31T23:59:59Z'},
+        ]
+        response = self.client.post('/api/mesures/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(self.errors(response), {
+            1: 'date_releve dans le futur',
+            2: 'date_releve invalide',
+            3: 'date_releve invalide',
+            4: 'date_releve invalide',
+            5: 'date_releve dans le futur',
+        })
+        self.assertEqual(Mesure.objects.get().date_releve.timestamp(), self.now)
+
+    def test_text_formats(self):
+        csv_body = f"capteur,valeur,ts\nC1,1.5,{self.now}\nC1,1.5,1700000000000\nC2,1,{self.now}\nC1,abc,\n"
+        response = self.post(csv_body, 'text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.errors(response), {
+            1: 'date_releve dans le futur', 2: 'capteur inconnu', 3: 'valeur non numérique',
+        })
+        ndjson = '{"capteur": "C1", "valeur": 2, "unite": "mm"}\n{"capteur": "C1", "valeur": 2, "ts": -1e14}\n'
+        response = self.post(ndjson, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.errors(response), {
+            0: 'unite mm différente de celle du capteur (cm)', 1: 'date_releve invalide',
+        })
+
+    def test_binary_out_of_range_timestamp(self):
+        body = encode_records([(self.capteur.id, self.now, 1.5), (self.capteur.id, 0xFFFFFFFF, 1.5)])
+        response = self.post(body, 'application/x-sentinelle-mesures')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.errors(response), {1: 'date_releve dans le futur'})
+        self.assertEqual(Mesure.objects.get().date_releve.timestamp(), self.now)
+
+    def test_binary_framing_errors(self):
+        body = encode_records([(self.capteur.id, self.now, 1.5)])
+        for bad in (b'XXXX' + body[4:], body + b'\x00'):
+            response = self.post(bad, 'application/x-sentinelle-mesures')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Mesure.objects.exists())
+
+    def test_binary_rejected_rows(self):
+        sans_unite = Capteur.objects.create(code='C2', type_capteur='pluie', localisation=self.capteur.localisation)
+        body = encode_records([
+            (self.capteur.id, self.now, 1.5),
+            (self.capteur.id + 1000, self.now, 1.5),
+            (self.capteur.id, self.now, float('nan')),
+            (sans_unite.id, self.now, 2),
+            (self.capteur.id, 0, 3),  # 0: heure de réception
+        ])
+        response = self.post(body, 'application/x-sentinelle-mesures')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.errors(response), {
+            1: 'capteur inconnu', 2: 'valeur non numérique', 3: 'unite inconnue (paramètre unite)',
+        })
+        self.assertEqual(sorted(Mesure.objects.values_list('valeur', flat=True)), [1.5, 3])
+
+        # Le paramètre unite fixe celle du capteur qui n'en a pas, et doit concorder avec les autres
+        response = self.post(body, 'application/x-sentinelle-mesures', '?unite=mm')
+        self.assertEqual(self.errors(response), {
+            0: 'unite différente de celle du capteur', 1: 'capteur inconnu', 2: 'valeur non numérique',
+            4: 'unite différente de celle du capteur',
+        })
+        sans_unite.refresh_from_db()
+        self.assertEqual(sans_unite.unite, 'mm')
+
+    @override_settings(MESURE_BULK_MAX_ROWS=2)
+    def test_batch_size_limit(self):
+        body = encode_records([(self.capteur.id, self.now, 1.5)] * 3)
+        self.assertEqual(self.post(body, 'application/x-sentinelle-mesures').status_code, 400)
+        response = self.client.post('/api/mesures/bulk/', [{'capteur': 'C1', 'valeur': 1}] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RollupTests(APITestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.hour = datetime(2024, 6, 1, 10, tzinfo=dt_timezone.utc)
+
+    def rollup(self, resolution, bucket):
+        row = MesureRollup.objects.get(capteur=self.capteur, resolution=resolution, bucket=bucket)
+        return row.count, row.total, row.minimum, row.maximum
+
+    def test_saved_and_bulk_mesures_merge_into_the_same_buckets(self):
+        Mesure.objects.create(capteur=self.capteur, valeur=4, date_releve=self.hour + timedelta(seconds=10))
+        Mesure.objects.create(capteur=self.capteur, valeur=2, date_releve=self.hour + timedelta(seconds=50))
+        start = int(self.hour.timestamp())
+        rows = [
+            {'capteur': 'C1', 'valeur': 9, 'ts': start + 30},
+            {'capteur': 'C1', 'valeur': 1, 'ts': start + 90},
+        ]
+        response = self.client.post('/api/mesures/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(self.rollup('minute', self.hour), (3, 15, 2, 9))
+        self.assertEqual(self.rollup('minute', self.hour + timedelta(minutes=1)), (1, 1, 1, 1))
+        self.assertEqual(self.rollup('hour', self.hour), (4, 16, 1, 9))
+        self.assertEqual(self.rollup('day', self.hour.replace(hour=0)), (4, 16, 1, 9))
+
+    def test_backfill_matches_incremental_rollups(self):
+        for i in range(30):
+            Mesure.objects.create(capteur=self.capteur, valeur=i % 7, date_releve=self.hour + timedelta(minutes=7 * i))
+        columns = ('resolution', 'bucket', 'count', 'total', 'minimum', 'maximum')
+        incremental = sorted(MesureRollup.objects.values_list(*columns))
+        self.assertEqual(rollups.backfill(), len(incremental))
+        self.assertEqual(sorted(MesureRollup.objects.values_list(*columns)), incremental)
+
+    def test_series_is_served_by_the_coarsest_rollup(self):
+        for i in range(6):
+            Mesure.objects.create(capteur=self.capteur, valeur=i, date_releve=self.hour + timedelta(minutes=30 * i))
+        end = self.hour + timedelta(hours=3)
+        query = f'capteur=C1&from={self.hour.timestamp():.0f}&to={end.timestamp():.0f}'
+        response = self.client.get(f'/api/mesures/?{query}&resolution=2h')
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(body['source'], 'hour')
+        self.assertEqual([(p['count'], p['min'], p['max'], p['avg']) for p in body['results']],
+                         [(4, 0, 3, 1.5), (2, 4, 5, 4.5)])
+        response = self.client.get(f'/api/mesures/?{query}&resolution=45m')
+        self.assertEqual(response.json()['source'], 'minute')
+        self.assertEqual(sum(p['count'] for p in response.json()['results']), 6)
+
+
+class MesurePaginationTests(APITestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        # Plusieurs mesures par instant: le départage se fait par id
+        for i in range(12):
+            Mesure.objects.create(capteur=self.capteur, valeur=i, date_releve=self.start + timedelta(minutes=i // 3))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = json.loads(b''.join(response.streaming_content) if response.streaming else response.content)
+            ids += [row['id'] for row in body['results']]
+            url = body['next']
+        return ids
+
+    def test_pages_cover_every_row_once(self):
+        expected = list(Mesure.objects.order_by('date_releve', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/mesures/?page_size=5'), expected)
+        self.assertEqual(self.walk('/api/mesures/?page_size=4&order=desc'), expected[::-1])
+
+    def test_cursor_is_stable_when_rows_are_inserted_before_it(self):
+        first = self.client.get('/api/mesures/?page_size=5').json()
+        Mesure.objects.create(capteur=self.capteur, valeur=-1, date_releve=self.start - timedelta(minutes=1))
+        Mesure.objects.create(capteur=self.capteur, valeur=-1, date_releve=self.start)
+        rest = self.walk(first['next'])
+        served = [row['id'] for row in first['results']] + rest
+        self.assertEqual(len(served), 12)
+        self.assertEqual(sorted(served), sorted(Mesure.objects.filter(valeur__gte=0).values_list('id', flat=True)))
+
+    def test_streamed_pages_match_serialized_pages(self):
+        serialized = self.walk('/api/mesures/?page_size=5')
+        with mock.patch.object(MesureKeysetPagination, 'STREAM_THRESHOLD', 2):
+            self.assertTrue(self.client.get('/api/mesures/?page_size=5').streaming)
+            self.assertEqual(self.walk('/api/mesures/?page_size=5'), serialized)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/mesures/?cursor=xyz').status_code, 404)
+
+
+class LatestMesureTests(APITestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.c1 = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.c2 = Capteur.objects.create(code='C2', type_capteur='pluie', localisation=localisation, unite='mm')
+        self.now = timezone.now().replace(second=0, microsecond=0)
+
+    def current(self):
+        # Invalidation faite après commit, qui n'a pas lieu dans un TestCase
+        latest.snapshot_cache.invalidate()
+        response = self.client.get('/api/capteurs/latest/')
+        self.assertEqual(response.status_code, 200)
+        return {row['capteur']: row for row in response.json()['results']}
+
+    def test_late_reading_does_not_replace_the_newest(self):
+        Mesure.objects.create(capteur=self.c1, valeur=5, date_releve=self.now)
+        Mesure.objects.create(capteur=self.c1, valeur=1, date_releve=self.now - timedelta(minutes=5))
+        rows = [{'capteur': 'C2', 'valeur': v, 'ts': int(self.now.timestamp()) - i} for i, v in enumerate((3, 8))]
+        self.client.post('/api/mesures/bulk/', rows, format='json')
+        current = self.current()
+        self.assertEqual((current['C1']['value'], current['C2']['value']), (5, 3))
+
+    def test_trends_are_read_from_minute_rollups_in_one_query(self):
+        Mesure.objects.create(capteur=self.c1, valeur=10, date_releve=self.now - timedelta(hours=1))
+        Mesure.objects.create(capteur=self.c1, valeur=20, date_releve=self.now - timedelta(minutes=15))
+        Mesure.objects.create(capteur=self.c1, valeur=26, date_releve=self.now)
+        Mesure.objects.create(capteur=self.c2, valeur=2, date_releve=self.now)
+        latest.snapshot_cache.invalidate()
+        with self.assertNumQueries(1):
+            values = {row['capteur']: row for row in latest.snapshot()}
+        self.assertEqual(values['C1']['delta'], {'15m': 6, '1h': 16})
+        self.assertEqual(values['C2']['delta'], {'15m': None, '1h': None})
+
+
+class ThresholdTests(TestCase):
+    def setUp(self):
+        self.localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=self.localisation,
+                                              unite='cm')
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def feed(self, engine, values, step=60):
+        return engine.process([
+            Mesure(capteur=self.capteur, valeur=v, date_releve=self.start + timedelta(seconds=step * i))
+            for i, v in enumerate(values)
+        ])
+
+    def test_hysteresis_escalates_and_steps_down(self):
+        Seuil.objects.create(type_capteur='niveau', mesure='niveau', faible=10, moyen=20, fort=30, hysteresis=2)
+        engine = ThresholdEngine()
+        changes = self.feed(engine, [12, 21, 19, 18.5, 17.5, 9, 7.9])
+        self.assertEqual([(old, new) for _, _, old, new, _ in changes], [(0, 1), (1, 2), (2, 1), (1, 0)])
+        # Une seule alerte, escaladée puis gardée au niveau atteint
+        alerte = Alerte.objects.get()
+        self.assertEqual((alerte.localisation, alerte.niveau), (self.localisation, 'moyen'))
+        self.assertEqual(Seuil.objects.get().etats.get().niveau, '')
+
+    def test_cumul_window_slides_and_ignores_late_readings(self):
+        seuil = Seuil(mesure='cumul', fenetre_minutes=10, faible=5, moyen=50)
+        changes = []
+        engine = ThresholdEngine(rules={self.capteur.id: [seuil]}, on_change=lambda *c: changes.append(c))
+        self.feed(engine, [2, 2, 2])
+        self.assertEqual([(c[2], c[3], c[4]) for c in changes], [(0, 1, 6)])
+        late = Mesure(capteur=self.capteur, valeur=100, date_releve=self.start)
+        self.assertEqual(engine.process([late]), [])
+        engine.process([Mesure(capteur=self.capteur, valeur=0, date_releve=self.start + timedelta(minutes=20))])
+        self.assertEqual([(c[2], c[3], c[4]) for c in changes][1:], [(1, 0, 0)])
+
+
+class MesureExportTests(APITestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        for i in range(7):
+            Mesure.objects.create(capteur=self.capteur, valeur=i / 2, date_releve=self.start + timedelta(minutes=i))
+
+    def download(self, query):
+        response = self.client.get(f'/api/mesures/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_is_gzip_and_filtered(self):
+        end = self.start + timedelta(minutes=5)
+        response, body = self.download(f'capteur=C1&from={self.start.timestamp():.0f}&to={end.timestamp():.0f}')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="mesures.csv.gz"')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode())))
+        self.assertEqual([float(r['valeur']) for r in rows], [0, 0.5, 1, 1.5, 2])
+        self.assertEqual((rows[0]['capteur'], rows[0]['localisation'], rows[0]['unite']), ('C1', 'Médina', 'cm'))
+
+    def test_csv_chunks_concatenate_to_one_stream(self):
+        chunks = list(export.csv_gzip(export.export_queryset(), chunk_size=2))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(len(gzip.decompress(b''.join(chunks)).decode().splitlines()), 8)
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/mesures/export/?output=xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('csv', response.json()['formats'])
+
+    @skipUnless(export.pyarrow, 'pyarrow non installé')
+    def test_columnar_formats(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        _, body = self.download('output=parquet')
+        table = pyarrow.parquet.read_table(io.BytesIO(body))
+        self.assertEqual(table.column('valeur').to_pylist(), [i / 2 for i in range(7)])
+        chunks = list(export.arrow(export.export_queryset(), chunk_size=3))
+        table = pyarrow.ipc.open_stream(b''.join(chunks)).read_all()
+        self.assertEqual(table.num_rows, 7)
+        self.assertEqual(table.column('date_releve').to_pylist()[0], self.start)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        settings = self.settings(MESURE_ARCHIVE_DIR=self.dir, MESURE_RETENTION_DAYS=30,
+                                 MESURE_RETENTION_BY_TYPE={'pluie': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.niveau = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.pluie = Capteur.objects.create(code='P1', type_capteur='pluie', localisation=localisation, unite='mm')
+        self.now = datetime(2024, 6, 15, tzinfo=dt_timezone.utc)
+        start = datetime(2024, 4, 25, tzinfo=dt_timezone.utc)
+        # Du 25 avril au 24 mai: deux fichiers mensuels, dont une partie encore dans la rétention
+        for i in range(30):
+            for capteur in (self.niveau, self.pluie):
+                Mesure.objects.create(capteur=capteur, valeur=i + 0.25, date_releve=start + timedelta(days=i))
+
+    def rows(self, capteur):
+        expired = Mesure.objects.filter(capteur=capteur, date_releve__lt=self.now - timedelta(days=30))
+        return [
+            (pk, capteur.id, capteur.code, date, valeur, capteur.unite)
+            for pk, date, valeur in expired.order_by('date_releve').values_list('id', 'date_releve', 'valeur')
+        ]
+
+    def test_round_trip(self):
+        expected = self.rows(self.niveau)
+        self.assertEqual(archive.count_expired(self.now), len(expected))
+        self.assertEqual(archive.prune(self.now, batch_size=4), len(expected))
+
+        self.assertEqual(sorted(os.listdir(self.dir)), ['mesures-2024-04.csv.gz', 'mesures-2024-05.csv.gz'])
+        self.assertEqual(list(archive.read([self.niveau.id])), expected)
+        self.assertEqual(Mesure.objects.filter(capteur=self.pluie).count(), 30)  # rétention 0: conservées
+        self.assertEqual(archive.horizon(self.niveau.id), expected[-1][3])
+        window = list(archive.read(None, expected[3][3], expected[6][3]))
+        self.assertEqual(window, expected[3:6])
+        # Les agrégats restent servis pour les jours archivés
+        self.assertEqual(MesureRollup.objects.filter(capteur=self.niveau, resolution='day').count(), 30)
+
+    def test_unindexed_block_is_truncated(self):
+        expected = self.rows(self.niveau)
+        archive.prune(self.now, batch_size=3, limit=3)
+        # Bloc écrit puis arrêt avant l'indexation: il est écrasé au lot suivant
+        with open(os.path.join(self.dir, 'mesures-2024-04.csv.gz'), 'ab') as f:
+            f.write(b'\x1f\x8b orphelin')
+        archive.prune(self.now, batch_size=3)
+        self.assertEqual(list(archive.read([self.niveau.id])), expected)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('archive_mesures', '--dry-run', stdout=out)
+        self.assertFalse(ArchiveMesure.objects.exists())
+        call_command('archive_mesures', '--batch-size', '7', stdout=out)
+        self.assertFalse(Mesure.objects.filter(capteur=self.niveau).exists())
+        self.assertIn('niveau: 30 jours', out.getvalue())
+        self.assertIn('pluie: conservées', out.getvalue())
+
+        out = io.StringIO()
+        call_command('archive_mesures', '--read', '--capteur', 'C1', '--from', '2024-05-01T00:00:00Z', stdout=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows[0], list(archive.HEADER))
+        self.assertEqual([float(r[4]) for r in rows[1:]], [i + 0.25 for i in range(6, 30)])
+
+
+class CompactStorageTests(TransactionTestCase):
+    """Conversion de la table Mesure aller-retour (l'éditeur de schéma SQLite refuse les transactions ouvertes)."""
+
+    def setUp(self):
+        self.addCleanup(storage.convert, 'standard')
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.start = datetime(2024, 6, 1, 10, tzinfo=dt_timezone.utc)
+        for i in range(10):
+            date = self.start + timedelta(minutes=i)
+            Mesure.objects.create(capteur=self.capteur, valeur=i * 1.125 - 3, date_releve=date)
+
+    def values(self):
+        return list(Mesure.objects.order_by('id').values_list('id', 'date_releve', 'valeur'))
+
+    def raw_first(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT typeof(date_releve), valeur FROM inondation_mesure ORDER BY id LIMIT 1')
+            return cursor.fetchone()
+
+    def test_round_trip(self):
+        before = self.values()
+        self.assertEqual(storage.convert('compact', batch_size=3), 10)
+        self.assertEqual(storage.current_mode(), 'compact')
+        # Colonne valeur d'affinité REAL: SQLite l'écrit en entier sur disque mais la relit en réel
+        self.assertEqual(self.raw_first(), ('integer', -3000))
+        self.assertEqual([e.id for e in storage.check_storage_mode(databases=['default'])], ['inondation.E002'])
+
+        with override_settings(MESURE_COMPACT_STORAGE=True):
+            self.assertEqual(storage.check_storage_mode(databases=['default']), [])
+            self.assertEqual(self.values(), before)
+            since = Mesure.objects.filter(date_releve__gte=self.start + timedelta(minutes=7))
+            self.assertEqual(since.count(), 3)
+            Mesure.objects.create(capteur=self.capteur, valeur=2.5, date_releve=self.start + timedelta(hours=1))
+            self.assertEqual(rollups.backfill(), 14)  # 11 minutes, 2 heures, 1 jour
+            self.assertEqual(
+                MesureRollup.objects.get(resolution='hour', bucket=self.start).total, sum(v for _, _, v in before)
+            )
+            before = self.values()
+
+        self.assertEqual(storage.convert('standard', batch_size=4), 11)
+        self.assertEqual(storage.current_mode(), 'standard')
+        self.assertEqual(self.values(), before)
+        self.assertEqual(storage.convert('standard'), 0)
+
+
+class IngestDaemonTests(TestCase):
+    def setUp(self):
+        localisation = Localisation.objects.create(nom='Médina', latitude=14.68, longitude=-17.45)
+        self.capteur = Capteur.objects.create(code='C1', type_capteur='niveau', localisation=localisation, unite='cm')
+        self.now = int(timezone.now().timestamp()) - 60
+        self.dead_letter = os.path.join(tempfile.mkdtemp(), 'dead_letter.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.dead_letter))
+        self.daemon = IngestDaemon(batch_size=100, retry_seconds=0, max_retries=2, dead_letter=self.dead_letter)
+
+    def flush(self, lines=b'', records=()):
+        # Écriture dans le thread du test: celles du thread d'écriture ne seraient pas visibles ici
+        rows = self.daemon._lines(lines)
+        self.daemon._flush(rows, [parse_records(encode_records(records))] if records else [])
+
+    def set_aside(self):
+        with open(self.dead_letter) as f:
+            return [json.loads(line) for line in f]
+
+    def failing(self, error, when):
+        calls = []
+
+        def fn(batch):
+            calls.append(len(batch))
+            if when(batch, len(calls)):
+                raise error
+            return ingest(batch)
+        return calls, mock.patch.object(ingest_daemon, 'ingest', fn)
+
+    def test_out_of_range_epoch_is_rejected_and_the_others_written(self):
+        self.flush(f'C1,1.5,{self.now}\nC1,1.5,1700000000000\nC1,2.5,{self.now}\n'.encode())
+        self.assertEqual(sorted(Mesure.objects.values_list('valeur', flat=True)), [1.5, 2.5])
+        stats = self.daemon.stats()
+        self.assertEqual((stats['written'], stats['rejected'], stats['failures']), (2, 1, 0))
+
+    def test_failing_record_is_isolated(self):
+        lines = ''.join(f'C1,{i},{self.now - i}\n' for i in range(20))
+        calls, patch = self.failing(ValueError('bug'), lambda batch, n: any(r['valeur'] == '13' for r in batch))
+        with patch, self.assertLogs('inondation.daemon', 'ERROR'):
+            self.flush(lines.encode())
+        self.assertEqual(Mesure.objects.count(), 19)
+        self.assertFalse(Mesure.objects.filter(valeur=13).exists())
+        self.assertEqual(self.set_aside(), [{'capteur': 'C1', 'valeur': '13', 'date_releve': str(self.now - 13)}])
+        self.assertLess(len(calls), 20)  # découpage par moitiés, pas relevé par relevé
+        self.assertEqual(self.daemon.stats()['dead_letter'], 1)
+
+    @mock.patch.object(ingest_daemon, 'close_old_connections')
+    def test_transient_database_errors_are_retried(self, close):
+        calls, patch = self.failing(OperationalError('database is locked'), lambda batch, n: n <= 2)
+        with patch, self.assertLogs('inondation.daemon', 'ERROR'):
+            self.flush(f'C1,1,{self.now}\nC1,2,{self.now}\n'.encode())
+        self.assertEqual(calls, [2, 2, 2])
+        self.assertEqual(Mesure.objects.count(), 2)
+        self.assertEqual(self.daemon.stats()['failures'], 2)
+
+    @mock.patch.object(ingest_daemon, 'close_old_connections')
+    @mock.patch.object(ingest_daemon, 'ingest_records', side_effect=OperationalError('disk I/O error'))
+    def test_retries_are_bounded(self, ingest_records, close):
+        with self.assertLogs('inondation.daemon', 'ERROR'):
+            self.flush(records=[(self.capteur.id, self.now, 1.5), (self.capteur.id, self.now, 2.5)])
+        self.assertEqual(ingest_records.call_count, 3)
+        self.assertEqual(self.set_aside(), [
+            {'capteur_id': self.capteur.id, 'timestamp': self.now, 'valeur': 1.5},
+            {'capteur_id': self.capteur.id, 'timestamp': self.now, 'valeur': 2.5},
+        ])
+
+    async def test_backpressure_pauses_reading(self):
+        daemon = IngestDaemon(max_pending=10)
+        daemon._loop = asyncio.get_running_loop()
+        daemon._resume = asyncio.Event()
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'C1,1\n' * 12)
+        task = asyncio.create_task(daemon._line_stream(reader, None, b''))
+        await asyncio.sleep(0.05)
+        reader.feed_data(b'C1,2\n' * 5)
+        reader.feed_eof()
+        await asyncio.sleep(0.05)
+        # Tampon plein: la connexion n'est plus lue, les datagrammes sont perdus
+        self.assertFalse(task.done())
+        self.assertEqual(daemon.buffer.pending, 12)
+        daemon.datagram(b'C1,3\n')
+        # Le thread d'écriture a vidé le tampon
+        with daemon.buffer.cond:
+            daemon.buffer.take()
+            daemon.buffer.pending = 0
+        daemon._resume.set()
+        await asyncio.wait_for(task, 1)
+        stats = daemon.stats()
+        self.assertEqual((stats['received'], stats['dropped'], stats['depth']), (17, 1, 5))
+        self.assertGreater(stats['paused_s'], 0)
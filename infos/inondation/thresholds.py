@@ -0,0 +1,241 @@
+"""Moteur de seuils: lève ou escalade des Alertes à partir des mesures entrantes.
+
+Chaque lot de mesures (post_save ou ingestion en masse) est évalué après
+commit, mesure par mesure dans l'ordre des dates, contre les règles `Seuil`
+du capteur (règles propres au capteur et règles de son type):
+
+  - niveau: la valeur reçue ;
+  - montee: hausse depuis le plus ancien relevé de la fenêtre ;
+  - cumul : somme des valeurs de la fenêtre (pluie cumulée).
+
+Les fenêtres glissantes sont tenues en mémoire (une deque et une somme
+courante par capteur et par durée), l'historique n'est relu qu'une fois, au
+premier relevé d'un capteur. Un relevé plus ancien que le dernier déjà vu
+n'alimente pas les fenêtres. Les fenêtres étant propres au processus,
+l'ingestion d'un même capteur doit passer par un seul processus.
+
+Un changement de niveau (avec hystérésis) crée l'Alerte sur la Localisation
+du capteur, ou l'escalade (mise à jour du niveau, donc événement "alert" sur
+le flux temps réel) ; l'état est gardé dans EtatSeuil.
+"""
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Alerte, Capteur, EtatSeuil, Mesure, Seuil
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("faible", "moyen", "fort")
+RANK = {"": 0, "faible": 1, "moyen": 2, "fort": 3}
+LABELS = {"niveau": "niveau", "montee": "montée", "cumul": "cumul"}
+
+
+class Window:
+    """Relevés des `span` dernières secondes, avec leur somme."""
+    __slots__ = ("span", "points", "total", "last_ts")
+
+    def __init__(self, span: float):
+        self.span = span
+        self.points = deque()
+        self.total = 0.0
+        self.last_ts = float("-inf")
+
+    def push(self, ts: float, value: float) -> bool:
+        if ts < self.last_ts:
+            return False
+        self.last_ts = ts
+        points = self.points
+        points.append((ts, value))
+        self.total += value
+        limit = ts - self.span
+        while points[0][0] < limit:
+            self.total -= points.popleft()[1]
+        return True
+
+
+class Rule:
+    """Seuil compilé: paliers (rang, nom, valeur) croissants."""
+    __slots__ = ("id", "kind", "span", "levels", "hysteresis", "seuil")
+
+    def __init__(self, seuil: Seuil):
+        self.seuil = seuil
+        self.id = seuil.pk if seuil.pk is not None else id(seuil)
+        self.kind = seuil.mesure
+        self.span = float(seuil.fenetre_minutes * 60)
+        self.hysteresis = seuil.hysteresis or 0.0
+        self.levels = [
+            (RANK[name], name, getattr(seuil, name)) for name in LEVELS if getattr(seuil, name) is not None
+        ]
+
+    def rank(self, metric: float, current: int) -> int:
+        new = 0
+        for rank, _, threshold in self.levels:
+            if metric >= threshold:
+                new = rank
+        if new >= current:
+            return new
+        # Descente: un palier atteint est gardé tant que la valeur reste au-dessus de seuil - hystérésis
+        for rank, _, threshold in reversed(self.levels):
+            if rank <= current and metric > threshold - self.hysteresis:
+                return max(rank, new)
+        return new
+
+
+class Track:
+    """Une règle appliquée à un capteur: sa fenêtre et son niveau courant."""
+    __slots__ = ("rule", "window", "rank")
+
+    def __init__(self, rule: Rule, window: Window, rank: int):
+        self.rule = rule
+        self.window = window
+        self.rank = rank
+
+
+class ThresholdEngine:
+    def __init__(self, rules=None, on_change=None, warm_up: bool = True):
+        """`rules`: {capteur_id: [Seuil]} fixe (tests, benchmark) ; sinon lues en base."""
+        self._fixed_rules = rules
+        self.on_change = on_change or persist_change
+        self.warm_up = warm_up
+        self._lock = threading.Lock()
+        self._plans = {}    # capteur_id -> (fenêtres, [Track])
+        self._windows = {}  # (capteur_id, span) -> Window, conservées au rechargement des règles
+        self._state = {}    # (rule id, capteur_id) -> rang
+        self.evaluated = 0
+        self.changes = 0
+
+    def reload_rules(self):
+        with self._lock:
+            self._plans.clear()
+
+    def _load(self, capteur_id, before):
+        if self._fixed_rules is not None:
+            seuils = self._fixed_rules.get(capteur_id, [])
+        else:
+            capteur = Capteur.objects.filter(pk=capteur_id).values("type_capteur").first()
+            if capteur is None:
+                seuils = []
+            else:
+                seuils = list(Seuil.objects.filter(
+                    Q(capteur_id=capteur_id) | Q(capteur__isnull=True, type_capteur=capteur["type_capteur"]),
+                    actif=True,
+                ))
+        rules = [Rule(s) for s in seuils if s.fenetre_minutes or s.mesure == "niveau"]
+        if rules and self.warm_up and self._fixed_rules is None:
+            self._restore(capteur_id, rules, before)
+        tracks = [
+            Track(r, None if r.kind == "niveau" else self._window(capteur_id, r.span),
+                  self._state.get((r.id, capteur_id), 0))
+            for r in rules
+        ]
+        windows = list({id(t.window): t.window for t in tracks if t.window is not None}.values())
+        plan = self._plans[capteur_id] = (windows, tracks)
+        return plan
+
+    def _restore(self, capteur_id, rules, before):
+        """Premier relevé du capteur: niveaux en cours et fenêtres reconstruites depuis l'historique."""
+        for etat in EtatSeuil.objects.filter(capteur_id=capteur_id, seuil_id__in=[r.id for r in rules]):
+            self._state[(etat.seuil_id, capteur_id)] = RANK.get(etat.niveau, 0)
+        spans = {r.span for r in rules if r.kind != "niveau"}
+        if not spans:
+            return
+        # Le lot en cours est déjà en base (évaluation après commit): on s'arrête avant lui
+        history = (
+            Mesure.objects.filter(capteur_id=capteur_id, date_releve__lt=before,
+                                  date_releve__gte=before - timedelta(seconds=max(spans)))
+            .order_by("date_releve", "id").values_list("date_releve", "valeur")
+        )
+        windows = [self._window(capteur_id, span) for span in spans]
+        for date, value in history.iterator():
+            ts = date.timestamp()
+            for window in windows:
+                window.push(ts, value)
+
+    def _window(self, capteur_id, span):
+        key = (capteur_id, span)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = Window(span)
+        return window
+
+    def process(self, mesures):
+        """Évalue un lot ; renvoie la liste des changements de niveau appliqués."""
+        changes = []
+        # Attributs lus une seule fois par mesure (capteur_id passe par un descripteur Django)
+        rows = sorted(((m.date_releve, m.capteur_id, m.valeur, m) for m in mesures), key=itemgetter(0))
+        with self._lock:
+            plans = self._plans
+            for date, capteur_id, value, m in rows:
+                plan = plans.get(capteur_id)
+                if plan is None:
+                    plan = self._load(capteur_id, date)
+                windows, tracks = plan
+                if not tracks:
+                    continue
+                ts = date.timestamp()
+                fresh = True
+                for window in windows:
+                    fresh = window.push(ts, value)
+                for track in tracks:
+                    rule = track.rule
+                    kind = rule.kind
+                    if kind == "niveau":
+                        metric = value
+                    elif not fresh:
+                        continue
+                    elif kind == "cumul":
+                        metric = track.window.total
+                    else:
+                        metric = value - track.window.points[0][1]
+                    current = track.rank
+                    rank = rule.rank(metric, current)
+                    if rank != current:
+                        track.rank = self._state[(rule.id, capteur_id)] = rank
+                        changes.append((rule, m, current, rank, metric))
+            self.evaluated += len(rows)
+            self.changes += len(changes)
+        for change in changes:
+            try:
+                self.on_change(*change)
+            except Exception:
+                logger.exception("seuil %s: échec de l'enregistrement du changement de niveau", change[0].id)
+        return changes
+
+
+def persist_change(rule: Rule, mesure, old_rank: int, new_rank: int, metric: float):
+    """Crée ou escalade l'Alerte correspondant à un changement de niveau."""
+    niveau = LEVELS[new_rank - 1] if new_rank else ""
+    seuil = rule.seuil
+    with transaction.atomic():
+        etat, _ = EtatSeuil.objects.select_for_update().get_or_create(seuil=seuil, capteur_id=mesure.capteur_id)
+        if new_rank > old_rank:
+            capteur = Capteur.objects.select_related("localisation").get(pk=mesure.capteur_id)
+            threshold = getattr(seuil, niveau)
+            message = (
+                f"Capteur {capteur.code}: {LABELS[rule.kind]} {metric:.2f} {capteur.unite} "
+                f"(seuil {niveau} {threshold:g}"
+                + (f" sur {seuil.fenetre_minutes} min)" if rule.kind != "niveau" else ")")
+            )
+            alerte = Alerte.objects.filter(pk=etat.alerte_id).first() if old_rank and etat.alerte_id else None
+            if alerte is not None:
+                alerte.niveau, alerte.message = niveau, message
+                alerte.save(update_fields=["niveau", "message"])  # escalade: événement "alert" updated
+            else:
+                alerte = Alerte.objects.create(localisation=capteur.localisation, niveau=niveau, message=message)
+            etat.alerte = alerte
+        etat.niveau = niveau
+        etat.save()
+
+
+engine = ThresholdEngine()
+
+
+def evaluate_on_commit(mesures):
+    mesures = list(mesures)
+    transaction.on_commit(lambda: engine.process(mesures), robust=True)
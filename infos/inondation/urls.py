@@ -6,8 +6,8 @@ from rest_framework_simplejwt.views import (
 )
 from .views import LocalisationViewSet, CapteurViewSet, MesureViewSet, AlerteViewSet, UserViewSet
 from .views import RegisterView, LoginView
-from .views import CurrentUserView
-from .views_sse import sse_stream
+from .views import CurrentUserView, CarteView
+from .views_sse import sse_stream, realtime_stats
 from .views import PasswordResetRequestView, PasswordResetConfirmView, SignalementCreateView, MySignalementsView, DegatCreateView, MyDegatsView, AssistanceCreateView, MyAssistanceView, SignalementValidateView, SignalementResolveView
 
 router = DefaultRouter()
@@ -28,6 +28,9 @@ urlpatterns = [
     path('auth/password-reset/', PasswordResetRequestView.as_view(), name='password_reset_request'),
     path('auth/password-reset/confirm/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
 
+    # Carte (GeoJSON, clusters côté serveur)
+    path('carte/', CarteView.as_view(), name='carte'),
+
     # Signalement citoyen
     path('signalements/', SignalementCreateView.as_view(), name='signalement_create'),
     path('signalements/mes/', MySignalementsView.as_view(), name='my_signalements'),
@@ -46,6 +49,7 @@ urlpatterns = [
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    # SSE realtime (mock)
+    # SSE realtime
     path('realtime/stream', sse_stream, name='sse_stream'),
+    path('realtime/stats', realtime_stats, name='realtime_stats'),
 ]
@@ -0,0 +1,88 @@
+"""GET conditionnels (ETag / Last-Modified) des listes publiques.
+
+Chaque ressource a un compteur (ResourceVersion) incrémenté, dans la
+transaction d'écriture, par les receivers post_save / post_delete de
+signals.py (cf. DEPENDENCIES: une alerte embarque sa localisation et
+has_signalement). Les écritures qui ne passent pas par save()/delete()
+(queryset.update(), bulk_create) doivent appeler `bump()` elles-mêmes.
+
+`conditional_response` lit la version (une requête par clé primaire) avant
+tout le reste: si If-None-Match / If-Modified-Since correspondent, 304 sans
+exécuter la requête de liste ni les serializers. L'ETag (fort) combine
+version, chemin complet (filtres) et en-tête Accept ; Last-Modified est la
+date de la dernière écriture.
+"""
+import hashlib
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Alerte, Localisation, ResourceVersion, Signalement, SignalementPhoto
+
+RESOURCES = ('alertes', 'localisations', 'signalements')
+
+# Modèle écrit -> versions à incrémenter
+DEPENDENCIES = {
+    Alerte: ('alertes',),
+    Localisation: ('localisations', 'alertes'),
+    Signalement: ('signalements', 'alertes'),
+    SignalementPhoto: ('signalements',),
+}
+
+
+def bump(*names):
+    now = timezone.now()
+    updated = ResourceVersion.objects.filter(pk__in=names).update(value=F('value') + 1, updated_at=now)
+    if updated < len(names):
+        ResourceVersion.objects.bulk_create(
+            [ResourceVersion(name=name, value=1, updated_at=now) for name in names], ignore_conflicts=True
+        )
+
+
+def current(name):
+    """(version, date de dernière écriture) de la ressource."""
+    row = ResourceVersion.objects.filter(pk=name).values_list('value', 'updated_at').first()
+    if row is None:
+        obj, _ = ResourceVersion.objects.get_or_create(name=name)
+        row = obj.value, obj.updated_at
+    return row
+
+
+def etag(request, name, value):
+    variant = hashlib.md5(
+        f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}".encode(), usedforsecurity=False
+    ).hexdigest()[:16]
+    return f'"{name}-{value}-{variant}"'
+
+
+def stamp(response, tag, last_modified):
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)  # revalider à chaque fois (polling)
+    return response
+
+
+def conditional_response(request, name, build):
+    """304 si le client a déjà cette version, sinon `build((version, date))`, la réponse complète, avec ETag / Last-Modified."""
+    value, updated_at = current(name)
+    tag, last_modified = etag(request, name, value), int(updated_at.timestamp())
+    not_modified = get_conditional_response(request, etag=tag, last_modified=last_modified)
+    if not_modified is not None:
+        return stamp(not_modified, tag, last_modified)
+    response = build((value, updated_at))
+    if response.status_code == 200 and not response.has_header('ETag'):  # sinon: version servie déjà estampillée
+        stamp(response, tag, last_modified)
+    return response
+
+
+class ConditionalListMixin:
+    """`list` conditionnel pour un ViewSet ; `version_resource` nomme le compteur."""
+    version_resource = None
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.version_resource,
+            lambda version: super(ConditionalListMixin, self).list(request, *args, **kwargs),
+        )
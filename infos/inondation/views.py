@@ -1,4 +1,5 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from .models import Localisation, Capteur, Mesure, Alerte
 from .serializers import LocalisationSerializer, CapteurSerializer, MesureSerializer, AlerteSerializer
 from .serializers import RegisterSerializer
@@ -10,18 +11,32 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import RegisterSerializer, UserSerializer
+from .serializers import (
+    SignalementSerializer, MySignalementSerializer, DegatSerializer, AssistanceRequestSerializer, media_urls,
+)
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from .models import Localisation, Alerte, Signalement, SignalementPhoto, Degat, DegatPiece, AssistanceRequest
-from django.db.models import Q
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from urllib.parse import urlencode
 from urllib.request import urlopen, Request
 import json as pyjson
-
-class LocalisationViewSet(viewsets.ModelViewSet):
+from .ingest import BinaryMesureParser, CSVParser, NDJSONParser, capteur_cache, ingest, ingest_records
+from . import export as mesure_export, latest, rollups
+from . import search as alerte_search
+from .versions import ConditionalListMixin, conditional_response
+from .feedcache import feed_cache
+from . import carte
+from django.http import StreamingHttpResponse
+from .pagination import MesureKeysetPagination
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+class LocalisationViewSet(ConditionalListMixin, viewsets.ModelViewSet):
+    version_resource = 'localisations'
     queryset = Localisation.objects.all()
     serializer_class = LocalisationSerializer
 
@@ -29,23 +44,119 @@ class CapteurViewSet(viewsets.ModelViewSet):
     queryset = Capteur.objects.all()
     serializer_class = CapteurSerializer
 
+    @action(detail=False, methods=['get'], url_path='latest')
+    def latest(self, request):
+        """Valeur courante de chaque capteur et variations sur 15 min / 1 h (cf. latest.py)."""
+        return Response({'results': latest.snapshot()})
+
 class MesureViewSet(viewsets.ModelViewSet):
+    """Mesures de capteurs.
+
+    Filtres: `capteur` (ids ou codes séparés par des virgules), `from` et `to`
+    (ISO 8601 ou epoch). La liste est paginée par curseur (cf. pagination.py).
+    Avec `resolution` (ex. 15m, 1h, 1d), elle renvoie une série agrégée servie
+    par les tables d'agrégats (cf. rollups.py).
+    """
     queryset = Mesure.objects.all()
     serializer_class = MesureSerializer
+    pagination_class = MesureKeysetPagination
+    SERIES_DEFAULT_SPAN = timedelta(days=7)
+    SERIES_MAX_POINTS = 20000
+
+    def _params(self):
+        params = self.request.query_params
+        capteur_ids = None
+        raw = [v.strip() for v in (params.get('capteur') or '').split(',') if v.strip()]
+        if raw:
+            ids = {int(v) for v in raw if v.isdigit()}
+            codes = [v for v in raw if not v.isdigit()]
+            if codes:
+                ids.update(capteur_cache.resolve(codes).values())
+            capteur_ids = sorted(ids)
+        try:
+            start = rollups.parse_instant(params.get('from'))
+            end = rollups.parse_instant(params.get('to'))
+        except ValueError as exc:
+            raise ValidationError({'detail': str(exc)})
+        return capteur_ids, start, end
+
+    def get_queryset(self):
+        qs = Mesure.objects.select_related('capteur')  # unité du capteur
+        if self.action != 'list':
+            return qs
+        capteur_ids, start, end = self._params()
+        if capteur_ids is not None:
+            qs = qs.filter(capteur_id__in=capteur_ids)
+        if start is not None:
+            qs = qs.filter(date_releve__gte=start)
+        if end is not None:
+            qs = qs.filter(date_releve__lt=end)
+        return qs
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """Export en flux: `output=csv` (gzip, défaut), `parquet` ou `arrow` ; mêmes filtres que la liste."""
+        fmt = request.query_params.get('output', 'csv')
+        capteur_ids, start, end = self._params()
+        try:
+            chunks = mesure_export.encode(fmt, mesure_export.export_queryset(capteur_ids, start, end))
+        except mesure_export.FormatUnavailable as exc:
+            return Response({'error': str(exc), 'formats': mesure_export.available_formats()}, status=400)
+        content_type, extension = mesure_export.FORMATS[fmt]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="mesures.{extension}"'
+        return response
+
+    def _list_rows(self, request, *args, **kwargs):
+        if self.paginator.wants_stream(request):
+            return self.paginator.stream_response(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('resolution'):
+            return self._list_rows(request, *args, **kwargs)
+        try:
+            seconds = rollups.parse_resolution(request.query_params['resolution'])
+        except ValueError as exc:
+            raise ValidationError({'resolution': str(exc)})
+        capteur_ids, start, end = self._params()
+        end = end or timezone.now()
+        start = start or end - self.SERIES_DEFAULT_SPAN
+        if seconds is None:
+            return self._list_rows(request, *args, **kwargs)
+        points = (end - start).total_seconds() / seconds * (len(capteur_ids) if capteur_ids else Capteur.objects.count())
+        if points > self.SERIES_MAX_POINTS:
+            raise ValidationError({'resolution': f'trop de points ({int(points)}), choisir une résolution plus grossière'})
+        source, results = rollups.series(capteur_ids, start, end, seconds)
+        return Response({
+            'resolution': seconds,
+            'source': source,
+            'from': start,
+            'to': end,
+            'results': results,
+        })
+
+    @action(detail=False, methods=['post'], url_path='bulk',
+            parser_classes=[JSONParser, NDJSONParser, CSVParser, BinaryMesureParser])
+    def bulk(self, request):
+        """Ingestion d'un lot de mesures (JSON, NDJSON, CSV ou binaire compact), cf. ingest.py."""
+        if request.content_type.startswith(BinaryMesureParser.media_type):
+            report = ingest_records(request.data, unite=request.query_params.get('unite'))
+        else:
+            report = ingest(request.data)
+        code = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=code)
 
-class AlerteViewSet(viewsets.ModelViewSet):
+class AlerteViewSet(ConditionalListMixin, viewsets.ModelViewSet):
+    version_resource = 'alertes'
     queryset = Alerte.objects.all()
     serializer_class = AlerteSerializer
 
     def get_queryset(self):
-        qs = Alerte.objects.select_related('localisation').all().order_by('-date_alerte')
+        qs = AlerteSerializer.annotate(Alerte.objects.all()).order_by('-date_alerte')
         search = self.request.query_params.get('search')
         if search:
-            qs = qs.filter(
-                Q(message__icontains=search)
-                | Q(niveau__icontains=search)
-                | Q(localisation__nom__icontains=search)
-            )
+            qs = alerte_search.filter_alertes(qs, search)
         level = (self.request.query_params.get('level') or '').lower().strip()
         if level:
             # Map niveaux UI -> niveaux backend
@@ -60,8 +171,39 @@ class AlerteViewSet(viewsets.ModelViewSet):
             qs = qs.filter(niveau__icontains=mapped)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        if not feed_cache.cacheable(request):
+            return super().list(request, *args, **kwargs)
+        # Liste anonyme: réponse partagée, cf. feedcache.py
+        return conditional_response(request, 'alertes', lambda version: feed_cache.response(
+            request, version, lambda: self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+        ))
+
+class CarteView(APIView):
+    """GeoJSON des alertes (et des signalements pour le staff) d'une bbox, regroupés selon le zoom (cf. carte.py)."""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            bbox = [float(v) for v in (params.get('bbox') or '').split(',')]
+            zoom = int(params.get('zoom') or 12)
+        except ValueError:
+            bbox, zoom = [], -1
+        if (len(bbox) != 4 or not (-180 <= bbox[0] < bbox[2] <= 180 and -90 <= bbox[1] < bbox[3] <= 90)
+                or not 0 <= zoom <= 22):
+            raise ValidationError({'bbox': "attendu: bbox=min_lng,min_lat,max_lng,max_lat et zoom entre 0 et 22"})
+        layers = [layer for layer in (params.get('layers') or 'alertes').split(',') if layer]
+        unknown = set(layers) - set(carte.LAYERS)
+        if unknown:
+            raise ValidationError({'layers': f"couche(s) inconnue(s): {', '.join(sorted(unknown))}"})
+        if 'signalements' in layers and not request.user.is_staff:
+            raise PermissionDenied("couche signalements réservée aux autorités")
+        return Response(carte.features(bbox, zoom, layers))
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = User.objects.all().order_by('id')
+    queryset = User.objects.prefetch_related('groups').order_by('id')
     serializer_class = UserSerializer
 
 
@@ -171,34 +313,20 @@ class SignalementCreateView(APIView):
         return [permissions.AllowAny()]
 
     def get(self, request):
+        return conditional_response(request, 'signalements', lambda version: self._list(request))
+
+    def _list(self, request):
         # Liste des signalements; supporte le filtre alerte_id pour joindre aux alertes
         # et 'status' pour la vue de validation (pending|verified|resolved)
         alerte_id = request.query_params.get('alerte_id')
         status_param = (request.query_params.get('status') or '').lower().strip()
-        qs = Signalement.objects.all()
+        qs = Signalement.objects.prefetch_related('photos')
         if alerte_id:
             qs = qs.filter(alerte_id=alerte_id)
         if status_param in ('pending', 'verified', 'resolved'):
             qs = qs.filter(status=status_param)
         qs = qs.order_by('-created_at')[:50]
-        def photo_url(p):
-            try:
-                return request.build_absolute_uri(p.file.url)
-            except Exception:
-                return None
-        data = []
-        for s in qs:
-            data.append({
-                'id': s.id,
-                'description': s.description,
-                'severity': s.severity,
-                'location_text': s.location_text,
-                'created_at': s.created_at,
-                'alerte_id': s.alerte_id,
-                'status': s.status,
-                'photos': [u for u in [photo_url(p) for p in s.photos.all()] if u],
-            })
-        return Response(data)
+        return Response(SignalementSerializer(qs, many=True, context={'request': request}).data)
     """
     Endpoint simple pour recevoir un signalement citoyen et le mapper vers une Alerte.
     Champs attendus (multipart ou JSON):
@@ -302,12 +430,7 @@ class SignalementCreateView(APIView):
                 SignalementPhoto.objects.create(signalement=signalement, file=f)
 
             # Construire URLs photos (après upload)
-            def photo_url(p):
-                try:
-                    return request.build_absolute_uri(p.file.url)
-                except Exception:
-                    return None
-            photos_urls = [u for u in [photo_url(p) for p in signalement.photos.all()] if u]
+            photos_urls = media_urls(request, signalement.photos.all())
 
             return Response({
                 "success": True,
@@ -348,26 +471,9 @@ class MySignalementsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = Signalement.objects.filter(created_by=request.user).order_by('-created_at')[:100]
-
-        def photo_url(p):
-            try:
-                return request.build_absolute_uri(p.file.url)
-            except Exception:
-                return None
-
-        data = []
-        for s in qs:
-            data.append({
-                'id': s.id,
-                'description': s.description,
-                'severity': s.severity,
-                'location_text': s.location_text,
-                'created_at': s.created_at,
-                'alerte_id': s.alerte_id,
-                'photos': [u for u in [photo_url(p) for p in s.photos.all()] if u],
-            })
-        return Response(data)
+        qs = (Signalement.objects.filter(created_by=request.user).prefetch_related('photos')
+              .order_by('-created_at')[:100])
+        return Response(MySignalementSerializer(qs, many=True, context={'request': request}).data)
 
 
 class DegatCreateView(APIView):
@@ -380,25 +486,8 @@ class DegatCreateView(APIView):
         return [permissions.AllowAny()]
 
     def get(self, request):
-        qs = Degat.objects.all().order_by('-created_at')[:100]
-        def piece_url(p):
-            try:
-                return request.build_absolute_uri(p.file.url)
-            except Exception:
-                return None
-        data = []
-        for d in qs:
-            data.append({
-                'id': d.id,
-                'property_type': d.property_type,
-                'loss_amount_text': d.loss_amount_text,
-                'loss_description': d.loss_description,
-                'people_affected': d.people_affected,
-                'remarks': d.remarks,
-                'created_at': d.created_at,
-                'pieces': [u for u in [piece_url(p) for p in d.pieces.all()] if u],
-            })
-        return Response(data)
+        qs = Degat.objects.prefetch_related('pieces').order_by('-created_at')[:100]
+        return Response(DegatSerializer(qs, many=True, context={'request': request}).data)
 
     def post(self, request):
         try:
@@ -416,12 +505,7 @@ class DegatCreateView(APIView):
             for f in files:
                 DegatPiece.objects.create(degat=d, file=f)
 
-            def piece_url(p):
-                try:
-                    return request.build_absolute_uri(p.file.url)
-                except Exception:
-                    return None
-            pieces_urls = [u for u in [piece_url(p) for p in d.pieces.all()] if u]
+            pieces_urls = media_urls(request, d.pieces.all())
             return Response({
                 'success': True,
                 'degat_id': d.id,
@@ -435,25 +519,8 @@ class MyDegatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = Degat.objects.filter(created_by=request.user).order_by('-created_at')[:100]
-        def piece_url(p):
-            try:
-                return request.build_absolute_uri(p.file.url)
-            except Exception:
-                return None
-        data = []
-        for d in qs:
-            data.append({
-                'id': d.id,
-                'property_type': d.property_type,
-                'loss_amount_text': d.loss_amount_text,
-                'loss_description': d.loss_description,
-                'people_affected': d.people_affected,
-                'remarks': d.remarks,
-                'created_at': d.created_at,
-                'pieces': [u for u in [piece_url(p) for p in d.pieces.all()] if u],
-            })
-        return Response(data)
+        qs = Degat.objects.filter(created_by=request.user).prefetch_related('pieces').order_by('-created_at')[:100]
+        return Response(DegatSerializer(qs, many=True, context={'request': request}).data)
 
 
 class AssistanceCreateView(APIView):
@@ -467,20 +534,7 @@ class AssistanceCreateView(APIView):
 
     def get(self, request):
         qs = AssistanceRequest.objects.all().order_by('-created_at')[:100]
-        data = [
-            {
-                'id': a.id,
-                'location_text': a.location_text,
-                'help_type': a.help_type,
-                'people_count': a.people_count,
-                'phone': a.phone,
-                'availability': a.availability,
-                'urgency_note': a.urgency_note,
-                'created_at': a.created_at,
-            }
-            for a in qs
-        ]
-        return Response(data)
+        return Response(AssistanceRequestSerializer(qs, many=True).data)
 
     def post(self, request):
         try:
@@ -505,17 +559,4 @@ class MyAssistanceView(APIView):
 
     def get(self, request):
         qs = AssistanceRequest.objects.filter(created_by=request.user).order_by('-created_at')[:100]
-        data = [
-            {
-                'id': a.id,
-                'location_text': a.location_text,
-                'help_type': a.help_type,
-                'people_count': a.people_count,
-                'phone': a.phone,
-                'availability': a.availability,
-                'urgency_note': a.urgency_note,
-                'created_at': a.created_at,
-            }
-            for a in qs
-        ]
-        return Response(data)
+        return Response(AssistanceRequestSerializer(qs, many=True).data)
@@ -1,26 +1,135 @@
-from django.http import StreamingHttpResponse
-from django.utils.timezone import now
-import json
-import time
-
-def sse_stream(request):
-    # Optionnel: vérifier auth si nécessaire
-    def event_stream():
-        yield "retry: 5000\n"  # délai de reconnexion côté client
-        while True:
-            payload = {
-                "type": "metric",
-                "ts": now().isoformat(),
-                "payload": {"value": 10}
-            }
-            data = json.dumps(payload)
-            yield f"event: metric\n"
-            yield f"data: {data}\n\n"
-            # Heartbeat pour garder la connexion
-            yield "data: :ping\n\n"
-            time.sleep(5)
-
-    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+"""Flux temps réel (Server-Sent Events).
+
+Servi en ASGI (`uvicorn information.asgi:application`), le flux est un
+générateur asynchrone: une connexion inactive ne coûte qu'une coroutine en
+attente sur sa file, pas un thread. Quand le client se déconnecte, Django
+annule la coroutine (CancelledError) et la connexion est libérée.
+Sous WSGI (`runserver`), on retombe sur un générateur synchrone.
+
+Les événements viennent du `broadcaster` (cf. realtime.py). Un client qui se
+reconnecte avec `Last-Event-ID` (ou `?lastEventId=`) reçoit d'abord les
+événements manqués encore présents dans le tampon ; un nouveau client reçoit
+d'abord la valeur courante de chaque capteur (trames "metric" sans id,
+`payload.snapshot = true`, cf. latest.py). Les paramètres `topics`,
+`capteurs` et `bbox` restreignent le flux (cf. realtime.StreamFilter), ex.:
+
+    /api/realtime/stream?topics=alerts,mesures&bbox=-17.55,14.65,-17.35,14.80
+    /api/realtime/stream?topics=signalement_status&token=<jeton JWT>
+
+Les sujets signalements et signalement_status sont réservés au personnel
+(is_staff), comme l'API REST des signalements. EventSource ne pouvant pas
+envoyer d'en-tête, le jeton d'accès JWT est aussi accepté en `?token=` ; la
+session Django et l'en-tête Authorization restent possibles. Demander un de
+ces sujets sans y avoir droit renvoie 403.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import latest
+from .eventbus import get_bus
+from .feedcache import feed_cache
+from .realtime import STAFF_TOPICS, Event, StreamFilter, broadcaster
+
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000
+PING = b": ping\n\n"  # commentaire SSE: garde la connexion ouverte, ignoré par EventSource
+
+# Nombre de flux ouverts dans ce processus (utile pour le test de charge)
+active_connections = 0
+
+
+def _snapshot_frames(rows, stream_filter):
+    """Valeurs courantes des capteurs, en trames "metric" sans id."""
+    for row in rows:
+        point = (row["localisation"]["latitude"], row["localisation"]["longitude"])
+        event = Event(None, "metric", dict(row, snapshot=True), point=point, capteur=row["capteur"])
+        if stream_filter.matches(event):
+            yield event.frame
+
+
+def _last_event_id(request):
+    raw = request.headers.get('Last-Event-ID') or request.GET.get('lastEventId')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+async def _event_stream_async(last_id, stream_filter):
+    global active_connections
+    active_connections += 1
+    sub, backlog = broadcaster.subscribe(last_id, stream_filter)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()  # délai de reconnexion côté client
+        if last_id is None and "mesures" in stream_filter.topics:
+            for frame in _snapshot_frames(await sync_to_async(latest.snapshot)(), stream_filter):
+                yield frame
+        for event in backlog:
+            yield event.frame
+        while not sub.overflowed:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield PING
+                continue
+            yield event.frame
+    finally:
+        # Atteint aussi sur déconnexion du client (CancelledError / aclose)
+        broadcaster.unsubscribe(sub)
+        active_connections -= 1
+
+
+def _event_stream_sync(last_id, stream_filter):
+    yield f"retry: {RETRY_MS}\n\n".encode()
+    if last_id is None:
+        last_id = broadcaster.last_id
+        if "mesures" in stream_filter.topics:
+            yield from _snapshot_frames(latest.snapshot(), stream_filter)
+    while True:
+        events = broadcaster.wait(last_id, HEARTBEAT_SECONDS)
+        if not events:
+            yield PING
+        for event in events:
+            last_id = event.id
+            if stream_filter.matches(event):
+                yield event.frame
+
+
+def _is_staff(request) -> bool:
+    """Client du personnel: session Django, ou jeton JWT (en-tête Authorization ou `?token=`)."""
+    user = request.user
+    if not user.is_authenticated:
+        auth = JWTAuthentication()
+        header = auth.get_header(request)
+        raw = auth.get_raw_token(header) if header else request.GET.get('token')
+        if not raw:
+            return False
+        try:
+            user = auth.get_user(auth.get_validated_token(raw))
+        except (InvalidToken, AuthenticationFailed):
+            return False
+    return bool(user.is_active and user.is_staff)
+
+
+async def sse_stream(request):
+    get_bus()  # s'assure que ce worker reçoit les événements des autres
+    last_id = _last_event_id(request)
+    staff = await sync_to_async(_is_staff)(request)
+    requested = {t.strip() for t in request.GET.get('topics', '').split(',')}
+    if not staff and requested & STAFF_TOPICS:
+        return JsonResponse({"detail": "sujets réservés au personnel"}, status=403)
+    stream_filter = StreamFilter.from_params(request.GET, staff=staff)
+    if isinstance(request, ASGIRequest):
+        stream = _event_stream_async(last_id, stream_filter)
+    else:
+        stream = _event_stream_sync(last_id, stream_filter)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
     response['Cache-Control'] = 'no-cache'
     response['X-Accel-Buffering'] = 'no'  # nginx
     response['Access-Control-Allow-Origin'] = '*'
@@ -28,3 +137,11 @@ def sse_stream(request):
     return response
 
 
+def realtime_stats(request):
+    return JsonResponse({
+        "active_connections": active_connections,
+        "subscribers": broadcaster.subscriber_count,
+        "last_event_id": broadcaster.last_id,
+        "bus": get_bus().stats(),
+        "alert_cache": feed_cache.stats(),
+    })
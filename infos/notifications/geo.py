@@ -0,0 +1,146 @@
+"""Index spatial des abonnements push (geohash) et géorepérage vectorisé.
+
+Chaque PushSubscription géolocalisé porte un geohash (colonne indexée).
+Une recherche par rayon se fait en deux temps:
+  1. préfiltre SQL: plages de geohash couvrant la bounding box + bornes lat/lng;
+  2. distance exacte (haversine) calculée en lot avec NumPy sur les candidats.
+"""
+import re
+from math import asin, ceil, cos, radians, sin, sqrt
+
+import numpy as np
+from django.db.models import Q
+
+from .models import PushSubscription
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+GEOHASH_PRECISION = 9  # ~5 m
+MAX_COVERING_CELLS = 16
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_COORDS_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int):
+    """Dimensions (lat, lng) en degrés d'une cellule geohash."""
+    total = 5 * precision
+    lng_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def bounding_box(lat: float, lng: float, radius_km: float):
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlng = radius_km / (KM_PER_DEG_LAT * max(cos(radians(lat)), 1e-6))
+    return (
+        max(lat - dlat, -90.0), max(lng - dlng, -180.0),
+        min(lat + dlat, 90.0), min(lng + dlng, 180.0),
+    )
+
+
+def covering_cells(min_lat, min_lng, max_lat, max_lng, max_cells: int = MAX_COVERING_CELLS):
+    """Préfixes geohash les plus fins qui couvrent la box en au plus `max_cells` cellules."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lng = cell_size(precision)
+        rows = ceil((max_lat - min_lat) / cell_lat) + 1
+        cols = ceil((max_lng - min_lng) / cell_lng) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+    cells = set()
+    for i in range(rows + 1):
+        lat = min(min_lat + i * cell_lat, max_lat)
+        for j in range(cols + 1):
+            lng = min(min_lng + j * cell_lng, max_lng)
+            cells.add(geohash_encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def prefix_filter(field: str, prefixes) -> Q:
+    """Geohash `field` commençant par l'un des `prefixes`, en plages parcourables par l'index."""
+    cells = Q()
+    for prefix in prefixes:
+        # "{" suit "z" dans l'ordre ASCII: plage = tous les geohash de ce préfixe
+        cells |= Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + "{"})
+    return cells
+
+
+def box_filter(field: str, min_lat, min_lng, max_lat, max_lng) -> Q:
+    """Préfiltre SQL sur la colonne geohash `field`: plages des préfixes couvrant la box."""
+    return prefix_filter(field, covering_cells(min_lat, min_lng, max_lat, max_lng))
+
+
+def parse_coordinates(text: str):
+    """(lat, lng) d'un libellé de la forme "lat, lng", None sinon."""
+    match = _COORDS_RE.match(text or "")
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distance haversine entre deux points (version scalaire)."""
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Distances (km) entre un point et des tableaux de coordonnées."""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def subscriptions_within(lat: float, lng: float, radius_km: float, queryset=None):
+    """Abonnements situés à moins de `radius_km` du point.
+
+    Renvoie des tuples (id, endpoint, p256dh, auth), directement utilisables
+    par `push.send_push`.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_km)
+    qs = queryset if queryset is not None else PushSubscription.objects.all()
+    rows = list(
+        qs.filter(box_filter("geohash", min_lat, min_lng, max_lat, max_lng))
+        .filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+        .values_list("id", "endpoint", "p256dh", "auth", "latitude", "longitude")
+    )
+    if not rows:
+        return []
+    coords = np.array([(r[4], r[5]) for r in rows], dtype=np.float64)
+    inside = haversine_km(lat, lng, coords[:, 0], coords[:, 1]) <= radius_km
+    return [rows[i][:4] for i in np.flatnonzero(inside)]
@@ -0,0 +1,96 @@
+import base64
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pywebpush import webpush
+
+from notifications.transport import PushTransport
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+class _FakePushHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, comme les vrais services push
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakePushServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark: coût par message de pywebpush.webpush() (chemin historique) "
+        "contre PushTransport (VAPID en cache + session poolée), sur un faux service push local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        n = opts["messages"]
+        server = _FakePushServer(("127.0.0.1", 0), _FakePushHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint_base = f"http://127.0.0.1:{server.server_address[1]}/push/"
+
+        private_key = settings.VAPID_PRIVATE_KEY
+        if not private_key:
+            key = ec.generate_private_key(ec.SECP256R1())
+            private_key = _b64(key.private_numbers().private_value.to_bytes(32, "big"))
+        client_key = ec.generate_private_key(ec.SECP256R1())
+        p256dh = _b64(client_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint,
+        ))
+        auth = _b64(os.urandom(16))
+        body = '{"title": "Bench", "body": "Sentinel Dakar", "url": "/alertes"}'
+
+        def legacy(i):
+            webpush(
+                subscription_info={"endpoint": f"{endpoint_base}{i}", "keys": {"p256dh": p256dh, "auth": auth}},
+                data=body,
+                vapid_private_key=private_key,
+                vapid_claims={"sub": settings.VAPID_SUBJECT},
+            )
+
+        transport = PushTransport(private_key, settings.VAPID_SUBJECT, pool_size=1)
+
+        def pooled(i):
+            transport.send(f"{endpoint_base}{i}", p256dh, auth, body)
+
+        try:
+            results = {name: self._measure(fn, n) for name, fn in (("webpush()", legacy), ("PushTransport", pooled))}
+        finally:
+            transport.close()
+            server.shutdown()
+
+        for name, per_msg in results.items():
+            self.stdout.write(f"{name:<14} {per_msg * 1e6:9.0f} µs/message  ({1 / per_msg:7.0f} msg/s)")
+        self.stdout.write(
+            f"gain: x{results['webpush()'] / results['PushTransport']:.2f} "
+            f"({transport.signer.signatures} signature(s) VAPID pour {n} messages)"
+        )
+        self.stdout.write("NB: serveur local en HTTP clair, le coût des poignées de main TLS n'est pas mesuré.")
+
+    def _measure(self, fn, n):
+        fn(-1)  # échauffement
+        started = time.perf_counter()
+        for i in range(n):
+            fn(i)
+        return (time.perf_counter() - started) / n
@@ -0,0 +1,43 @@
+import logging
+import os
+import socket
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import run_once
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Draine la file d'envoi push et SMS (NotificationJob / NotificationDelivery)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=None, help="envois simultanés par lot")
+        parser.add_argument("--sleep", type=float, default=1.0, help="pause (s) quand la file est vide")
+        parser.add_argument("--once", action="store_true", help="s'arrêter dès que la file est vide")
+
+    def handle(self, *args, **opts):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.stdout.write(f"push_worker {worker_id} démarré")
+        try:
+            while True:
+                try:
+                    counts = run_once(worker_id, opts["batch_size"], opts["workers"])
+                except Exception:
+                    # Base indisponible...: les livraisons réservées reviennent à l'expiration du bail
+                    logger.exception("push_worker %s: échec de la réservation ou de l'enregistrement", worker_id)
+                    time.sleep(opts["sleep"])
+                    continue
+                if counts:
+                    self.stdout.write(" ".join(f"{k}={v}" for k, v in counts.items()))
+                    continue
+                if opts["once"]:
+                    break
+                time.sleep(opts["sleep"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"push_worker {worker_id} arrêté")
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from notifications.geo import geohash_encode
+
+    PushSubscription = apps.get_model('notifications', 'PushSubscription')
+    qs = PushSubscription.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True)
+    batch = []
+    for sub in qs.only('id', 'latitude', 'longitude').iterator(chunk_size=1000):
+        sub.geohash = geohash_encode(sub.latitude, sub.longitude)
+        batch.append(sub)
+        if len(batch) >= 1000:
+            PushSubscription.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        PushSubscription.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_pushsubscription_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushsubscription',
+            name='geohash',
+            field=models.CharField(max_length=12, blank=True, default="", db_index=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
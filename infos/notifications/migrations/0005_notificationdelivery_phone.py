@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationjob_notificationdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationdelivery',
+            name='phone',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notificationdelivery_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationjob',
+            name='send_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notificationjob',
+            name='sent_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
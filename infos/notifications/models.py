@@ -12,6 +12,7 @@ class PushSubscription(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     locality = models.CharField(max_length=120, blank=True, default="")
+    geohash = models.CharField(max_length=12, blank=True, default="", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,3 +22,42 @@ class PushSubscription(models.Model):
 from django.db import models
 
 # Create your models here.
+
+
+class NotificationJob(models.Model):
+    """Envoi push ou SMS mis en file (outbox), traité par la commande `push_worker`."""
+    kind = models.CharField(max_length=30)  # broadcast | area | test | sms
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, default="pending")  # pending | running | done
+    total = models.IntegerField(default=0)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    sent_count = models.IntegerField(default=0)  # envois acceptés, cumulés par les workers
+    send_seconds = models.FloatField(default=0)  # temps passé à envoyer (débit = sent_count / send_seconds)
+
+    def __str__(self) -> str:
+        return f"NotificationJob<{self.id} {self.kind} {self.status}>"
+
+
+class NotificationDelivery(models.Model):
+    """Envoi d'un job vers un abonnement (ou un numéro) ; une ligne par destinataire."""
+    job = models.ForeignKey(NotificationJob, on_delete=models.CASCADE, related_name="deliveries")
+    subscription = models.ForeignKey(PushSubscription, null=True, blank=True, on_delete=models.SET_NULL)
+    phone = models.CharField(max_length=20, blank=True, default="")  # jobs "sms": numéro E.164
+    status = models.CharField(max_length=20, default="pending")  # pending | sent | gone | rejected | failed
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    claimed_by = models.CharField(max_length=64, blank=True, default="")
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["claimed_by"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"NotificationDelivery<{self.job_id}:{self.subscription_id} {self.status}>"
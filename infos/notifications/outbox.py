@@ -0,0 +1,294 @@
+"""File d'envoi push et SMS persistante (outbox).
+
+Les vues se contentent d'enregistrer un NotificationJob et une ligne
+NotificationDelivery par destinataire (abonnement push, ou numéro pour les
+jobs "sms") ; la commande `push_worker` draine la
+file par lots. Plusieurs workers peuvent tourner en parallèle: chaque lot est
+réservé par un UPDATE conditionnel (claimed_by / claimed_until), une réservation
+expirée redevenant disponible si un worker meurt en cours de route.
+
+Un lot est envoyé par tranches assez petites pour tenir, au pire (tous les
+envois au délai maximal), dans la moitié du bail ; le bail est renouvelé avant
+chaque tranche et seules les livraisons encore réservées par ce worker sont
+envoyées puis mises à jour. Une livraison reprise par un autre worker (bail
+expiré) n'est donc ni renvoyée ni écrasée. Un lot interrompu par une
+exception (base, clé VAPID...) compte comme un essai pour chacune de ses
+livraisons: le délai entre essais et la limite PUSH_MAX_ATTEMPTS s'appliquent.
+"""
+import json
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils import timezone
+
+from . import sms
+from .models import NotificationJob, NotificationDelivery
+from .push import fan_out, delete_gone
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_CHUNK = 1000
+WRITE_CHUNK = 200
+RESULT_FIELDS = ("status", "attempts", "last_error", "next_attempt_at")
+
+
+def _conf(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _subscription_ids(subscriptions):
+    if hasattr(subscriptions, "values_list"):
+        return list(subscriptions.values_list("id", flat=True))
+    return [s[0] if isinstance(s, tuple) else s.id for s in subscriptions]
+
+
+def _create_job(kind: str, payload: dict, deliveries, created_by=None) -> NotificationJob:
+    now = timezone.now()
+    with transaction.atomic():
+        job = NotificationJob.objects.create(
+            kind=kind,
+            payload=payload,
+            total=len(deliveries),
+            created_by=created_by,
+            status="pending" if deliveries else "done",
+            finished_at=None if deliveries else now,
+        )
+        for i in range(0, len(deliveries), ENQUEUE_CHUNK):
+            NotificationDelivery.objects.bulk_create([
+                NotificationDelivery(job=job, next_attempt_at=now, **fields)
+                for fields in deliveries[i:i + ENQUEUE_CHUNK]
+            ])
+    return job
+
+
+def enqueue(kind: str, payload: dict, subscriptions, created_by=None) -> NotificationJob:
+    """Met un envoi en file et renvoie le job créé (sans rien envoyer)."""
+    ids = _subscription_ids(subscriptions)
+    return _create_job(kind, payload, [{"subscription_id": sub_id} for sub_id in ids], created_by)
+
+
+def enqueue_sms(message: str, numbers, created_by=None) -> NotificationJob:
+    """Met en file un SMS vers des numéros déjà normalisés (`sms.normalize_numbers`)."""
+    return _create_job("sms", {"message": message}, [{"phone": number} for number in numbers], created_by)
+
+
+def claim_batch(worker_id: str, batch_size: int, max_rounds: int = 5):
+    """Réserve au plus `batch_size` livraisons dues pour ce worker.
+
+    Si un autre worker a raflé tous les candidats entre le SELECT et l'UPDATE,
+    on recommence: une liste vide signifie bien que la file est vide.
+    """
+    for _ in range(max_rounds):
+        now = timezone.now()
+        lease_until = now + timedelta(seconds=_conf("PUSH_CLAIM_LEASE_SECONDS", 120))
+        free = Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+        candidates = list(
+            NotificationDelivery.objects
+            .filter(status="pending", next_attempt_at__lte=now)
+            .filter(free)
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not candidates:
+            return []
+        # Seul le premier worker à passer cet UPDATE obtient la ligne
+        claimed = NotificationDelivery.objects.filter(id__in=candidates, status="pending").filter(free).update(
+            claimed_by=worker_id, claimed_until=lease_until,
+        )
+        if claimed:
+            return list(
+                NotificationDelivery.objects
+                .filter(id__in=candidates, claimed_by=worker_id, claimed_until=lease_until)
+                .select_related("job", "subscription")
+            )
+    return []
+
+
+def _backoff(attempts: int) -> timedelta:
+    base = _conf("PUSH_RETRY_BASE_SECONDS", 30)
+    cap = _conf("PUSH_RETRY_MAX_SECONDS", 3600)
+    delay = min(cap, base * (2 ** (attempts - 1)))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def chunk_size(max_workers: int, timeout: float, lease_seconds: float) -> int:
+    """Livraisons par tranche: pire cas (ceil(n / workers) * timeout) <= moitié du bail."""
+    rounds = max(1, int(lease_seconds / 2 // timeout))
+    return max_workers * rounds
+
+
+def renew(worker_id: str, ids, lease_seconds: float) -> set:
+    """Prolonge le bail des livraisons encore réservées par ce worker ; renvoie leurs ids."""
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    NotificationDelivery.objects.filter(id__in=ids, claimed_by=worker_id, claimed_until__gt=now).update(
+        claimed_until=lease_until,
+    )
+    return set(
+        NotificationDelivery.objects
+        .filter(id__in=ids, claimed_by=worker_id, claimed_until=lease_until)
+        .values_list("id", flat=True)
+    )
+
+
+def _write_back(worker_id: str, deliveries) -> int:
+    """Enregistre les résultats et libère les lignes, seulement là où ce worker a encore le bail."""
+    now = timezone.now()
+    written = 0
+    for i in range(0, len(deliveries), WRITE_CHUNK):
+        chunk = deliveries[i:i + WRITE_CHUNK]
+        values = {
+            name: Case(*[
+                When(pk=d.pk, then=Value(getattr(d, name), output_field=NotificationDelivery._meta.get_field(name)))
+                for d in chunk
+            ])
+            for name in RESULT_FIELDS
+        }
+        written += NotificationDelivery.objects.filter(
+            pk__in=[d.pk for d in chunk], claimed_by=worker_id, claimed_until__gt=now,
+        ).update(**values, claimed_by="", claimed_until=None, updated_at=now)
+    return written
+
+
+def _send_push(job, deliveries, max_workers, timeout) -> dict:
+    subs = [
+        (d.subscription.id, d.subscription.endpoint, d.subscription.p256dh, d.subscription.auth)
+        for d in deliveries if d.subscription is not None
+    ]
+    results, _ = fan_out(subs, json.dumps(job.payload), max_workers, timeout)
+    by_sub = {r[0]: (r[2], r[4]) for r in results}
+    return {d.id: by_sub.get(d.subscription_id, ("gone", "subscription removed")) for d in deliveries}
+
+
+def _send_sms(job, deliveries) -> dict:
+    by_number = sms.deliver([d.phone for d in deliveries], job.payload["message"])
+    return {d.id: by_number[d.phone] for d in deliveries}
+
+
+def process_batch(worker_id: str, deliveries, max_workers: int = None) -> dict:
+    """Envoie un lot réservé par `worker_id` et enregistre le résultat de chaque livraison."""
+    max_attempts = _conf("PUSH_MAX_ATTEMPTS", 5)
+    max_workers = max_workers or _conf("PUSH_FANOUT_WORKERS", 16)
+    timeout = _conf("PUSH_SEND_TIMEOUT_SECONDS", 10.0)
+    lease = _conf("PUSH_CLAIM_LEASE_SECONDS", 120)
+    job_ids = {d.job_id for d in deliveries}
+    NotificationJob.objects.filter(id__in=job_ids, status="pending").update(status="running")
+
+    counts = {"sent": 0, "gone": 0, "rejected": 0, "retry": 0, "failed": 0, "lost": 0}
+    gone_subs = []
+    step = chunk_size(max_workers, timeout, lease)
+    if any(d.job.kind == "sms" for d in deliveries):
+        # Les SMS sont limités en débit: la tranche doit aussi tenir dans la moitié du bail
+        step = min(step, max(1, int(_conf("SMS_RATE_PER_SECOND", 50.0) * lease / 2)))
+    for i in range(0, len(deliveries), step):
+        chunk = deliveries[i:i + step]
+        held = renew(worker_id, [d.id for d in chunk], lease)
+        counts["lost"] += len(chunk) - len(held)
+        chunk = [d for d in chunk if d.id in held]
+        by_job = {}
+        for d in chunk:
+            by_job.setdefault(d.job_id, []).append(d)
+        now = timezone.now()
+        for job_deliveries in by_job.values():
+            job = job_deliveries[0].job
+            started = time.perf_counter()
+            if job.kind == "sms":
+                outcome = _send_sms(job, job_deliveries)
+            else:
+                outcome = _send_push(job, job_deliveries, max_workers, timeout)
+            NotificationJob.objects.filter(id=job.id).update(
+                sent_count=F("sent_count") + sum(1 for status, _ in outcome.values() if status == "sent"),
+                send_seconds=F("send_seconds") + (time.perf_counter() - started),
+            )
+            for d in job_deliveries:
+                status, error = outcome[d.id]
+                d.attempts += 1
+                d.last_error = error
+                if status == "failed" and d.attempts < max_attempts:
+                    d.next_attempt_at = now + _backoff(d.attempts)
+                    counts["retry"] += 1
+                    continue
+                d.status = status
+                counts[status] += 1
+                if status == "gone" and d.subscription_id is not None:
+                    gone_subs.append(d.subscription_id)
+        # Bail perdu malgré le renouvellement (worker suspendu...): le repreneur fait foi
+        counts["lost"] += len(chunk) - _write_back(worker_id, chunk)
+
+    delete_gone(gone_subs)
+    for job_id in job_ids:
+        _finish_if_drained(job_id)
+    return counts
+
+
+def _finish_if_drained(job_id: int):
+    if not NotificationDelivery.objects.filter(job_id=job_id, status="pending").exists():
+        NotificationJob.objects.filter(id=job_id).exclude(status="done").update(
+            status="done", finished_at=timezone.now(),
+        )
+
+
+def fail_batch(worker_id: str, deliveries, error: str) -> dict:
+    """Lot interrompu: un essai de plus pour chaque livraison encore réservée par ce worker."""
+    max_attempts = _conf("PUSH_MAX_ATTEMPTS", 5)
+    now = timezone.now()
+    held = list(NotificationDelivery.objects.filter(
+        pk__in=[d.pk for d in deliveries], claimed_by=worker_id, claimed_until__gt=now,
+    ))
+    counts = {"retry": 0, "failed": 0}
+    for d in held:
+        d.attempts += 1
+        d.last_error = error[:255]
+        if d.attempts < max_attempts:
+            d.next_attempt_at = now + _backoff(d.attempts)
+            counts["retry"] += 1
+        else:
+            d.status = "failed"
+            counts["failed"] += 1
+    _write_back(worker_id, held)
+    for job_id in {d.job_id for d in held}:
+        _finish_if_drained(job_id)
+    return counts
+
+
+def run_once(worker_id: str, batch_size: int = 500, max_workers: int = None) -> dict:
+    deliveries = claim_batch(worker_id, batch_size)
+    if not deliveries:
+        return {}
+    try:
+        return process_batch(worker_id, deliveries, max_workers)
+    except Exception as exc:
+        logger.exception("push_worker %s: échec d'un lot de %d livraisons", worker_id, len(deliveries))
+        return fail_batch(worker_id, deliveries, f"{type(exc).__name__}: {exc}")
+
+
+def job_progress(job: NotificationJob) -> dict:
+    by_status = dict(
+        job.deliveries.values_list("status").annotate(n=Count("id")).order_by()
+    )
+    done = job.total - by_status.get("pending", 0)
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "total": job.total,
+        "pending": by_status.get("pending", 0),
+        "sent": by_status.get("sent", 0),
+        "removed": by_status.get("gone", 0),
+        "rejected": by_status.get("rejected", 0),
+        "failed": by_status.get("failed", 0),
+        "last_error": (
+            job.deliveries.exclude(last_error="").order_by("-updated_at")
+            .values_list("last_error", flat=True).first() or ""
+        ),
+        "progress": round(done / job.total, 3) if job.total else 1.0,
+        "duration_s": round(job.send_seconds, 3),
+        "throughput_per_s": round(job.sent_count / job.send_seconds, 1) if job.send_seconds > 0 else 0.0,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,145 @@
+"""Tampon de présence: regroupe les écritures de `update_presence`.
+
+Les positions reçues sont gardées en mémoire et écrites en lot (bulk_update)
+toutes les `PRESENCE_FLUSH_INTERVAL` secondes ou dès que `PRESENCE_MAX_PENDING`
+endpoints sont en attente. Un ping qui ne bouge pas de plus de
+`PRESENCE_MIN_MOVE_M` mètres (et garde la même localité) est ignoré ; plusieurs
+pings du même endpoint entre deux flushs fusionnent en une seule écriture.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .geo import distance_km, geohash_encode
+from .models import PushSubscription
+
+FLUSH_CHUNK = 500
+MAX_TRACKED = 200_000
+
+
+class PresenceBuffer:
+    def __init__(self, min_move_m: float = 25.0, max_pending: int = 500, flush_interval: float = 5.0):
+        self.min_move_m = min_move_m
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = {}  # endpoint -> (lat, lng, locality, user_id)
+        self._last = {}  # endpoint -> (lat, lng, locality) dernière position retenue
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self.counters = {"accepted": 0, "merged": 0, "skipped": 0, "flushed": 0, "flushes": 0}
+
+    def _moved(self, previous, lat, lng, locality) -> bool:
+        p_lat, p_lng, p_locality = previous
+        if p_locality != locality:
+            return True
+        if lat is None or lng is None or p_lat is None or p_lng is None:
+            return (lat, lng) != (p_lat, p_lng)
+        return distance_km(p_lat, p_lng, lat, lng) * 1000 >= self.min_move_m
+
+    def record(self, endpoint: str, lat, lng, locality: str = "", user_id=None) -> str:
+        """Enregistre un ping ; renvoie "accepted", "merged" ou "skipped"."""
+        with self._lock:
+            previous = self._pending.get(endpoint)
+            reference = previous[:3] if previous else self._last.get(endpoint)
+            if reference is not None and not self._moved(reference, lat, lng, locality):
+                self.counters["skipped"] += 1
+                return "skipped"
+            self._pending[endpoint] = (lat, lng, locality, user_id)
+            outcome = "merged" if previous else "accepted"
+            self.counters[outcome] += 1
+            full = len(self._pending) >= self.max_pending
+        self._ensure_timer()
+        if full:
+            self.flush()
+        return outcome
+
+    def flush(self) -> int:
+        """Écrit les positions en attente ; renvoie le nombre de lignes mises à jour."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                updated, matched = self._write(pending)
+            except Exception:
+                # Remettre en file sans écraser les pings arrivés entre-temps
+                with self._lock:
+                    for endpoint, value in pending.items():
+                        self._pending.setdefault(endpoint, value)
+                raise
+            with self._lock:
+                if len(self._last) > MAX_TRACKED:
+                    self._last.clear()
+                # Seuls les endpoints réellement abonnés servent de référence au seuil de déplacement
+                for endpoint in matched:
+                    self._last[endpoint] = pending[endpoint][:3]
+                self.counters["flushed"] += updated
+                self.counters["flushes"] += 1
+            return updated
+
+    def _write(self, pending: dict) -> tuple[int, set[str]]:
+        """Renvoie le nombre d'abonnements mis à jour et les endpoints trouvés en base."""
+        by_user = {v[3]: v for v in pending.values() if v[3] is not None}
+        endpoints = list(pending)
+        now = timezone.now()
+        updated, matched = 0, set()
+        seen = set()  # un abonnement retrouvé par son utilisateur peut revenir par son endpoint
+        for i in range(0, len(endpoints), FLUSH_CHUNK):
+            chunk = endpoints[i:i + FLUSH_CHUNK]
+            users = list(by_user) if i == 0 else []
+            # Même règle que l'ancienne vue: l'endpoint, plus tous les abonnements de l'utilisateur
+            subs = [
+                sub for sub in PushSubscription.objects.filter(Q(endpoint__in=chunk) | Q(user_id__in=users))
+                .only("id", "endpoint", "user_id")
+                if sub.id not in seen
+            ]
+            seen.update(sub.id for sub in subs)
+            for sub in subs:
+                if sub.endpoint in pending:
+                    matched.add(sub.endpoint)
+                lat, lng, locality, _ = pending.get(sub.endpoint) or by_user[sub.user_id]
+                sub.latitude, sub.longitude, sub.locality = lat, lng, locality
+                sub.geohash = geohash_encode(lat, lng) if lat is not None and lng is not None else ""
+                sub.updated_at = now
+            PushSubscription.objects.bulk_update(
+                subs, ["latitude", "longitude", "locality", "geohash", "updated_at"], batch_size=FLUSH_CHUNK,
+            )
+            updated += len(subs)
+        return updated, matched
+
+    def _ensure_timer(self):
+        if self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name="presence-flush", daemon=True)
+                self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+            finally:
+                close_old_connections()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "pending": len(self._pending)}
+
+
+buffer = PresenceBuffer(
+    min_move_m=getattr(settings, "PRESENCE_MIN_MOVE_M", 25.0),
+    max_pending=getattr(settings, "PRESENCE_MAX_PENDING", 500),
+    flush_interval=getattr(settings, "PRESENCE_FLUSH_INTERVAL", 5.0),
+)
+atexit.register(buffer.flush)
@@ -0,0 +1,108 @@
+"""Moteur d'envoi Web Push en parallèle (fan-out).
+
+Les envois sont répartis sur un pool de threads borné et passent par le
+transport partagé (`transport.py`: signature VAPID en cache, une session HTTP
+keep-alive par origine de service push). Les abonnements expirés (404/410)
+sont collectés puis supprimés en une seule requête à la fin du passage.
+"""
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from pywebpush import WebPushException
+
+from inondation.stats import percentile
+
+from .models import PushSubscription
+from .transport import PushTransport, get_transport, origin_of
+
+GONE_STATUSES = (404, 410)
+DELETE_CHUNK = 500
+
+
+def _send_one(transport: PushTransport, sub: tuple, body: str, timeout: float):
+    """Envoie un message ; renvoie (id, origine, statut, latence_s, erreur).
+
+    statut: "sent", "gone" (endpoint à supprimer) ou "failed".
+    """
+    sub_id, endpoint, p256dh, auth = sub
+    origin = origin_of(endpoint)
+    started = time.perf_counter()
+    try:
+        transport.send(endpoint, p256dh, auth, body, timeout=timeout)
+        outcome, error = "sent", ""
+    except WebPushException as e:
+        response = getattr(e, "response", None)
+        # Attention: une Response HTTP en erreur est "falsy", d'où le test explicite à None
+        if response is not None and response.status_code in GONE_STATUSES:
+            outcome = "gone"
+        else:
+            outcome = "failed"
+        error = f"HTTP {response.status_code}" if response is not None else str(e)[:200]
+    except Exception as e:
+        outcome, error = "failed", f"{type(e).__name__}: {e}"[:200]
+    return sub_id, origin, outcome, time.perf_counter() - started, error
+
+
+def _as_tuples(subscriptions):
+    if hasattr(subscriptions, "values_list"):
+        return list(subscriptions.values_list("id", "endpoint", "p256dh", "auth"))
+    return [s if isinstance(s, tuple) else (s.id, s.endpoint, s.p256dh, s.auth) for s in subscriptions]
+
+
+def fan_out(subs, body: str, max_workers: int = None, timeout: float = 10.0, transport: PushTransport = None):
+    """Envoie `body` (déjà sérialisé) à chaque tuple (id, endpoint, p256dh, auth).
+
+    Renvoie la liste des résultats (id, origine, statut, latence_s, erreur) et la
+    durée totale ; ne touche pas à la base.
+    """
+    max_workers = max_workers or getattr(settings, "PUSH_FANOUT_WORKERS", 16)
+    transport = transport or get_transport()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webpush") as pool:
+        results = list(pool.map(lambda s: _send_one(transport, s, body, timeout), subs))
+    return results, time.perf_counter() - started
+
+
+def delete_gone(ids) -> int:
+    """Supprime en lot les abonnements expirés."""
+    ids = list(ids)
+    removed = 0
+    for i in range(0, len(ids), DELETE_CHUNK):
+        removed += PushSubscription.objects.filter(id__in=ids[i:i + DELETE_CHUNK]).delete()[0]
+    return removed
+
+
+def run_stats(results, duration: float) -> dict:
+    """Statistiques d'un passage: débit, percentiles de latence, échecs par origine."""
+    latencies = sorted(r[3] for r in results)
+    counts = Counter(r[2] for r in results)
+    failed_by_origin = Counter(r[1] for r in results if r[2] != "sent")
+    return {
+        "sent": counts["sent"],
+        "failed": counts["failed"],
+        "total": len(results),
+        "duration_s": round(duration, 3),
+        "throughput_per_s": round(len(results) / duration, 1) if duration > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p90": round(percentile(latencies, 90) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "failed_by_origin": dict(failed_by_origin),
+    }
+
+
+def send_push(subscriptions, payload: dict, max_workers: int = None, timeout: float = 10.0) -> dict:
+    """Envoie `payload` à tous les abonnements et renvoie les statistiques du passage.
+
+    `subscriptions` peut être un QuerySet de PushSubscription, un itérable
+    d'instances ou de tuples (id, endpoint, p256dh, auth).
+    """
+    results, duration = fan_out(_as_tuples(subscriptions), json.dumps(payload), max_workers, timeout)
+    stats = run_stats(results, duration)
+    stats["removed"] = delete_gone(r[0] for r in results if r[2] == "gone")
+    return stats
@@ -0,0 +1,206 @@
+"""Envoi de SMS en masse via un backend interchangeable.
+
+Même principe que les backends e-mail de Django: `settings.SMS_BACKEND` donne le
+chemin de la classe à utiliser. Les numéros sont normalisés (E.164, Sénégal par
+défaut), dédoublonnés puis soumis par lots de `max_batch_size`, au rythme
+maximal autorisé par le fournisseur (`SMS_RATE_PER_SECOND`, par processus).
+
+Les vues ne font que mettre l'envoi en file (outbox.enqueue_sms, une
+livraison par numéro) ; `push_worker` le soumet via `deliver`. Un lot en
+erreur (exception du backend) est journalisé puis retenté comme un push ; un
+lot accepté en partie est marqué "rejected", sans nouvel essai, le
+fournisseur ne disant pas quels numéros il a refusés. Le débit obtenu
+(SMS acceptés par seconde d'envoi) figure dans l'état du job (outbox.job_progress).
+
+Backends fournis:
+  - FileSmsBackend: écrit chaque lot dans un fichier JSON lines (dev / recette) ;
+  - LocmemSmsBackend: garde les lots en mémoire (`LocmemSmsBackend.outbox`).
+"""
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .geo import bounding_box, box_filter, haversine_km, parse_coordinates
+
+DEFAULT_COUNTRY_CODE = "221"
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_phone(raw: str, country_code: str = DEFAULT_COUNTRY_CODE):
+    """Numéro au format E.164 (+221...), ou None s'il est inexploitable."""
+    digits = re.sub(r"[^\d+]", "", raw or "")
+    if digits.startswith("00"):
+        digits = "+" + digits[2:]
+    if digits.startswith("+"):
+        number = digits[1:]
+    elif digits.startswith(country_code) and len(digits) > 9:
+        number = digits
+    else:
+        number = country_code + digits.lstrip("0")
+    if not number.isdigit() or not 8 <= len(number) <= 15:
+        return None
+    return "+" + number
+
+
+class BaseSmsBackend:
+    max_batch_size = 100
+
+    def send_batch(self, numbers, message: str) -> int:
+        """Soumet un lot au fournisseur ; renvoie le nombre de SMS acceptés."""
+        raise NotImplementedError
+
+
+class FileSmsBackend(BaseSmsBackend):
+    max_batch_size = 500
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, "SMS_FILE_PATH", settings.BASE_DIR / "sms_outbox.jsonl")
+
+    def send_batch(self, numbers, message: str) -> int:
+        line = json.dumps({
+            "ts": datetime.now(dt_timezone.utc).isoformat(),
+            "to": list(numbers),
+            "message": message,
+        }, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+        return len(numbers)
+
+
+class LocmemSmsBackend(BaseSmsBackend):
+    outbox = []
+
+    def send_batch(self, numbers, message: str) -> int:
+        LocmemSmsBackend.outbox.append({"to": list(numbers), "message": message})
+        return len(numbers)
+
+
+def get_backend() -> BaseSmsBackend:
+    path = getattr(settings, "SMS_BACKEND", "notifications.sms.FileSmsBackend")
+    return import_string(path)()
+
+
+class RateLimiter:
+    """Seau à jetons: au plus `rate` SMS par seconde, rafales de `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def acquire(self, n: int):
+        n = min(n, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            time.sleep((n - self.tokens) / self.rate)
+
+
+def normalize_numbers(numbers):
+    """(numéros E.164 uniques, nombre d'invalides, nombre de doublons)."""
+    numbers = list(numbers)
+    unique, invalid = [], 0
+    seen = set()
+    for raw in numbers:
+        number = normalize_phone(raw)
+        if number is None:
+            invalid += 1
+        elif number not in seen:
+            seen.add(number)
+            unique.append(number)
+    return unique, invalid, len(numbers) - len(unique) - invalid
+
+
+def batch_size_for(backend: BaseSmsBackend) -> int:
+    batch_size = getattr(settings, "SMS_BATCH_SIZE", None) or backend.max_batch_size
+    return min(batch_size, backend.max_batch_size)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter(burst: int) -> RateLimiter:
+    """Seau à jetons partagé par le processus (plusieurs workers = plusieurs seaux)."""
+    global _limiter
+    rate = getattr(settings, "SMS_RATE_PER_SECOND", 50.0)
+    with _limiter_lock:
+        if _limiter is None or (_limiter.rate, _limiter.capacity) != (rate, max(burst, 1)):
+            _limiter = RateLimiter(rate, burst)
+        return _limiter
+
+
+def _submit(backend: BaseSmsBackend, batch, message: str):
+    """Soumet un lot ; renvoie (acceptés, erreur) sans lever."""
+    try:
+        return backend.send_batch(batch, message), ""
+    except Exception as e:
+        logger.exception("sms: échec d'envoi d'un lot de %d numéros", len(batch))
+        return 0, f"{type(e).__name__}: {e}"[:200]
+
+
+def deliver(numbers, message: str, backend: BaseSmsBackend = None) -> dict:
+    """Envoie à des numéros déjà normalisés ; renvoie {numéro: (statut, erreur)}.
+
+    statut: "sent", "rejected" (lot accepté en partie) ou "failed" (à retenter).
+    """
+    backend = backend or get_backend()
+    batch_size = batch_size_for(backend)
+    limiter = get_limiter(batch_size)
+    outcome = {}
+    for i in range(0, len(numbers), batch_size):
+        batch = numbers[i:i + batch_size]
+        limiter.acquire(len(batch))
+        accepted, error = _submit(backend, batch, message)
+        if error:
+            status = "failed"
+        elif accepted >= len(batch):
+            status = "sent"
+        else:
+            status, error = "rejected", f"{accepted}/{len(batch)} acceptés par le fournisseur"
+        outcome.update((number, (status, error)) for number in batch)
+    return outcome
+
+
+def phones_within(lat: float, lng: float, radius_km: float):
+    """Téléphones des signalements et demandes d'assistance situés dans le rayon.
+
+    Préfiltre SQL par geohash (celui de la Localisation des signalements, celui
+    de la demande d'assistance quand son `location_text` est de la forme
+    "lat, lng"), puis distance exacte en lot.
+    """
+    from inondation.models import AssistanceRequest, Signalement
+
+    box = bounding_box(lat, lng, radius_km)
+    min_lat, min_lng, max_lat, max_lng = box
+    rows = list(
+        Signalement.objects.exclude(phone="")
+        .filter(box_filter("localisation__geohash", *box))
+        .filter(localisation__latitude__range=(min_lat, max_lat),
+                localisation__longitude__range=(min_lng, max_lng))
+        .values_list("phone", "localisation__latitude", "localisation__longitude")
+    )
+    assistance = AssistanceRequest.objects.exclude(phone="").filter(box_filter("geohash", *box))
+    for phone, text in assistance.values_list("phone", "location_text"):
+        coords = parse_coordinates(text)
+        if coords:
+            rows.append((phone, *coords))
+    if not rows:
+        return []
+    coords = np.array([(r[1], r[2]) for r in rows], dtype=np.float64)
+    inside = haversine_km(lat, lng, coords[:, 0], coords[:, 1]) <= radius_km
+    return [rows[i][0] for i in np.flatnonzero(inside)]
@@ -1,3 +1,377 @@
-from django.test import TestCase
+import io
+import random
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from py_vapid import Vapid, b64urlencode
+from pywebpush import WebPushException
+from rest_framework.test import APITestCase
+
+from inondation.models import Alerte, AssistanceRequest, Localisation, Signalement
+
+from . import outbox
+from .geo import bounding_box, covering_cells, distance_km, geohash_encode, subscriptions_within
+from .models import NotificationDelivery, NotificationJob, PushSubscription
+from .presence import PresenceBuffer
+from .sms import BaseSmsBackend, LocmemSmsBackend, deliver, phones_within
+from .push import delete_gone, fan_out, run_stats
+from .transport import SessionPool, VapidSigner
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return WebPushException(f"Push failed: {status}", response=response)
+
+
+class FakeTransport:
+    """Transport de test: le statut renvoyé dépend de l'endpoint (".../410", ".../500", ".../boom")."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, endpoint, p256dh, auth, data, ttl=0, timeout=10.0):
+        self.sent.append((endpoint, data))
+        last = endpoint.rsplit("/", 1)[-1]
+        if last == "boom":
+            raise ConnectionError("reset")
+        if last.isdigit():
+            raise http_error(int(last))
+
+
+def subscription(name, **fields):
+    return PushSubscription.objects.create(
+        endpoint=f"https://push.example.com/{name}", p256dh="k", auth="a", **fields
+    )
+
+
+class FanOutTests(TestCase):
+    def test_outcomes_and_stats(self):
+        names = ["ok", "410", "500", "boom"]
+        subs = [(i, f"https://push.example.com/{name}", "k", "a") for i, name in enumerate(names)]
+        transport = FakeTransport()
+        results, duration = fan_out(subs, '{"title": "x"}', max_workers=2, transport=transport)
+        self.assertEqual(len(transport.sent), 4)
+        self.assertEqual([r[2] for r in results], ["sent", "gone", "failed", "failed"])
+        self.assertEqual(results[2][4], "HTTP 500")
+        self.assertTrue(results[3][4].startswith("ConnectionError"))
+        stats = run_stats(results, duration)
+        self.assertEqual((stats["sent"], stats["failed"], stats["total"]), (1, 2, 4))
+        self.assertEqual(stats["failed_by_origin"], {"https://push.example.com": 3})
+
+    def test_delete_gone(self):
+        keep, gone = subscription("keep"), subscription("gone")
+        self.assertEqual(delete_gone([gone.id]), 1)
+        self.assertEqual(list(PushSubscription.objects.values_list("id", flat=True)), [keep.id])
+
+
+class GeoTests(TestCase):
+    def test_geohash_encode(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_covering_cells_contain_every_point_of_the_box(self):
+        random.seed(2)
+        box = bounding_box(14.69, -17.44, 3.0)
+        cells = covering_cells(*box)
+        self.assertLessEqual(len(cells), 16)
+        for _ in range(500):
+            lat, lng = random.uniform(box[0], box[2]), random.uniform(box[1], box[3])
+            self.assertTrue(geohash_encode(lat, lng).startswith(tuple(cells)), (lat, lng))
+
+    def test_subscriptions_within_radius(self):
+        center = (14.69, -17.44)
+        inside = subscription("inside", latitude=14.70, longitude=-17.44)
+        # Coin de la bounding box: dans le préfiltre SQL, hors du rayon
+        corner = subscription("corner", latitude=14.69 + 0.0125, longitude=-17.44 + 0.0125)
+        subscription("far", latitude=14.80, longitude=-17.30)
+        subscription("unknown")
+        for s in PushSubscription.objects.exclude(latitude=None):
+            s.geohash = geohash_encode(s.latitude, s.longitude)
+            s.save()
+        self.assertGreater(distance_km(*center, corner.latitude, corner.longitude), 1.5)
+        found = subscriptions_within(*center, 1.5)
+        self.assertEqual([row[0] for row in found], [inside.id])
+        self.assertEqual(found[0][1:], (inside.endpoint, "k", "a"))
+
+
+@override_settings(PUSH_MAX_ATTEMPTS=3, PUSH_RETRY_BASE_SECONDS=30, PUSH_CLAIM_LEASE_SECONDS=120,
+                   PUSH_SEND_TIMEOUT_SECONDS=10)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        patcher = mock.patch("notifications.push.get_transport", return_value=self.transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, *names):
+        return outbox.enqueue("test", {"title": "x"}, [subscription(name) for name in names])
+
+    def sent(self):
+        return sorted(endpoint.rsplit("/", 1)[-1] for endpoint, _ in self.transport.sent)
+
+    def test_outcomes_and_backoff(self):
+        job = self.enqueue("ok", "500", "410")
+        started = timezone.now()
+        self.assertEqual(
+            outbox.run_once("w1"), {"sent": 1, "gone": 1, "rejected": 0, "retry": 1, "failed": 0, "lost": 0},
+        )
+        retry = NotificationDelivery.objects.get(status="pending")
+        self.assertEqual((retry.attempts, retry.last_error, retry.claimed_by), (1, "HTTP 500", ""))
+        self.assertGreaterEqual(retry.next_attempt_at, started + timedelta(seconds=24))
+        self.assertLessEqual(retry.next_attempt_at, timezone.now() + timedelta(seconds=36))
+        self.assertFalse(PushSubscription.objects.filter(endpoint__endswith="/410").exists())
+        self.assertEqual(outbox.run_once("w1"), {})  # pas encore dû
+
+        NotificationDelivery.objects.filter(pk=retry.pk).update(next_attempt_at=timezone.now(), attempts=2)
+        self.assertEqual(outbox.run_once("w1")["failed"], 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual(outbox.job_progress(job)["failed"], 1)
+
+    def test_batch_exception_counts_as_an_attempt(self):
+        job = self.enqueue("a", "b")
+        with mock.patch("notifications.push.get_transport", side_effect=ValueError("clé VAPID invalide")), \
+                self.assertLogs("notifications.outbox", "ERROR"):
+            self.assertEqual(outbox.run_once("w1"), {"retry": 2, "failed": 0})
+        rows = NotificationDelivery.objects.all()
+        self.assertEqual({(d.status, d.attempts, d.claimed_by) for d in rows}, {("pending", 1, "")})
+        self.assertEqual(rows[0].last_error, "ValueError: clé VAPID invalide")
+        self.assertGreater(rows[0].next_attempt_at, timezone.now())
+
+        rows.update(next_attempt_at=timezone.now(), attempts=4)
+        with mock.patch("notifications.outbox.process_batch", side_effect=RuntimeError("x")), \
+                self.assertLogs("notifications.outbox", "ERROR"):
+            self.assertEqual(outbox.run_once("w1"), {"retry": 0, "failed": 2})
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+
+    @mock.patch("notifications.management.commands.push_worker.time.sleep")
+    def test_worker_survives_a_failing_round(self, sleep):
+        with mock.patch("notifications.management.commands.push_worker.run_once",
+                        side_effect=[DatabaseError("base verrouillée"), {}]) as run_once, \
+                self.assertLogs("notifications.management.commands.push_worker", "ERROR"):
+            call_command("push_worker", "--once", stdout=io.StringIO())
+        self.assertEqual(run_once.call_count, 2)
+
+    def test_concurrent_claims_are_disjoint(self):
+        self.enqueue("a", "b", "c", "d", "e")
+        first = outbox.claim_batch("w1", 3)
+        second = outbox.claim_batch("w2", 10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({d.id for d in first} & {d.id for d in second})
+        outbox.process_batch("w2", second)
+        outbox.process_batch("w1", first)
+        self.assertEqual(self.sent(), ["a", "b", "c", "d", "e"])
+        self.assertEqual(NotificationDelivery.objects.filter(status="sent").count(), 5)
+
+    def test_expired_lease_is_neither_sent_nor_overwritten(self):
+        self.enqueue("a", "b")
+        stale = outbox.claim_batch("w1", 10)
+        NotificationDelivery.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        fresh = outbox.claim_batch("w2", 10)
+        self.assertEqual(len(fresh), 2)
+        self.assertEqual(outbox.process_batch("w1", stale)["lost"], 2)
+        self.assertEqual(self.sent(), [])
+        self.assertEqual(set(NotificationDelivery.objects.values_list("claimed_by", flat=True)), {"w2"})
+        self.assertEqual(outbox.process_batch("w2", fresh)["sent"], 2)
+        self.assertEqual(self.sent(), ["a", "b"])
+
+    @override_settings(PUSH_CLAIM_LEASE_SECONDS=20)
+    def test_lease_taken_over_during_a_batch(self):
+        self.enqueue("a", "b", "c")
+        batch = outbox.claim_batch("w1", 10)
+        taken = []
+        real_fan_out = outbox.fan_out
+
+        def slow_fan_out(*args):
+            # w1 se fige pendant sa première tranche ; son bail expire et w2 reprend toute la file
+            if not taken:
+                NotificationDelivery.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+                taken.extend(outbox.claim_batch("w2", 10))
+            return real_fan_out(*args)
+
+        with mock.patch("notifications.outbox.fan_out", slow_fan_out):
+            counts = outbox.process_batch("w1", batch, max_workers=1)  # tranches d'une livraison
+        self.assertEqual(len(self.transport.sent), 1)
+        self.assertEqual(counts["lost"], 3)
+        self.assertEqual(len(taken), 3)
+        rows = NotificationDelivery.objects.all()
+        self.assertEqual({(d.status, d.attempts, d.claimed_by) for d in rows}, {("pending", 0, "w2")})
+
+    def test_chunks_fit_in_the_lease(self):
+        self.assertEqual(outbox.chunk_size(16, 10, 120), 96)  # 6 tours de 10 s au pire
+        self.assertEqual(outbox.chunk_size(16, 10, 15), 16)
+
+
+class TransportTests(TestCase):
+    def setUp(self):
+        vapid = Vapid()
+        vapid.generate_keys()
+        self.key = b64urlencode(vapid.private_key.private_numbers().private_value.to_bytes(32, "big"))
+
+    def test_vapid_header_signed_once_per_audience(self):
+        signer = VapidSigner(self.key, "mailto:admin@example.com", ttl=3600, refresh_margin=600)
+        first = signer.headers_for("https://fcm.googleapis.com")
+        self.assertIs(signer.headers_for("https://fcm.googleapis.com"), first)
+        self.assertTrue(first["Authorization"].startswith("vapid t="))
+        signer.headers_for("https://updates.push.services.mozilla.com")
+        self.assertEqual(signer.signatures, 2)
+
+    def test_vapid_header_refreshed_before_expiry(self):
+        signer = VapidSigner(self.key, "mailto:admin@example.com", ttl=3600, refresh_margin=600)
+        now = 1_700_000_000
+        with mock.patch("notifications.transport.time.time", return_value=now):
+            first = signer.headers_for("https://fcm.googleapis.com")
+        with mock.patch("notifications.transport.time.time", return_value=now + 2999):
+            self.assertIs(signer.headers_for("https://fcm.googleapis.com"), first)
+        with mock.patch("notifications.transport.time.time", return_value=now + 3000):
+            self.assertIsNot(signer.headers_for("https://fcm.googleapis.com"), first)
+        self.assertEqual(signer.signatures, 2)
+
+    def test_one_session_per_origin(self):
+        pool = SessionPool(pool_size=4)
+        self.addCleanup(pool.close)
+        session = pool.get("https://fcm.googleapis.com")
+        self.assertIs(pool.get("https://fcm.googleapis.com"), session)
+        self.assertIsNot(pool.get("https://updates.push.services.mozilla.com"), session)
+        self.assertEqual(session.get_adapter("https://fcm.googleapis.com/x")._pool_maxsize, 4)
+
+
+class PresenceTests(APITestCase):
+    def setUp(self):
+        # Intervalle long: pas de flush par le thread minuteur pendant le test
+        self.buffer = PresenceBuffer(min_move_m=25.0, max_pending=3, flush_interval=3600)
+        self.sub = subscription("phone")
+
+    def test_pings_merge_until_flush(self):
+        endpoint = self.sub.endpoint
+        self.assertEqual(self.buffer.record(endpoint, 14.6900, -17.4400, "Médina"), "accepted")
+        self.assertEqual(self.buffer.record(endpoint, 14.6950, -17.4400, "Médina"), "merged")
+        self.assertEqual(self.buffer.record(endpoint, 14.6951, -17.4400, "Médina"), "skipped")  # ~11 m
+        self.sub.refresh_from_db()
+        self.assertIsNone(self.sub.latitude)
+        with self.assertNumQueries(2):  # SELECT + bulk_update
+            self.assertEqual(self.buffer.flush(), 1)
+        self.sub.refresh_from_db()
+        self.assertEqual((self.sub.latitude, self.sub.locality), (14.6950, "Médina"))
+        self.assertEqual(self.sub.geohash, geohash_encode(14.6950, -17.4400))
+        self.assertEqual(self.buffer.record(endpoint, 14.6951, -17.4400, "Médina"), "skipped")
+        self.assertEqual(self.buffer.record(endpoint, 14.6951, -17.4400, "Fass"), "accepted")
+        stats = self.buffer.stats()
+        self.assertEqual((stats["accepted"], stats["merged"], stats["skipped"], stats["pending"]), (2, 1, 2, 1))
+
+    def test_user_subscriptions_follow_and_full_buffer_flushes(self):
+        user = User.objects.create_user("agent")
+        other = subscription("laptop", user=user)
+        self.buffer.record(self.sub.endpoint, 14.70, -17.45, user_id=user.id)
+        self.buffer.record("https://push.example.com/unknown", 14.71, -17.45)
+        self.assertEqual(PushSubscription.objects.exclude(latitude=None).count(), 0)
+        self.buffer.record("https://push.example.com/other", 14.72, -17.45)  # 3 en attente: flush
+        self.assertEqual(self.buffer.stats()["pending"], 0)
+        other.refresh_from_db()
+        self.assertEqual(other.latitude, 14.70)
+
+    @mock.patch("notifications.presence.FLUSH_CHUNK", 1)
+    def test_subscription_is_written_once_across_chunks(self):
+        user = User.objects.create_user("agent")
+        other = subscription("laptop", user=user)
+        self.buffer.record(self.sub.endpoint, 14.70, -17.45, user_id=user.id)
+        self.buffer.record(other.endpoint, 14.75, -17.45, user_id=user.id)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.buffer.stats()["flushed"], 2)
+        other.refresh_from_db()
+        self.assertEqual(other.latitude, 14.75)
+
+    def test_view_records_in_buffer(self):
+        with mock.patch("notifications.views.presence_buffer", self.buffer):
+            with self.assertNumQueries(0):
+                response = self.client.post("/api/notifications/presence/", {
+                    "endpoint": self.sub.endpoint, "lat": "14.69", "lng": "-17.44",
+                }, format="json")
+        self.assertEqual(response.json(), {"ok": True, "status": "accepted"})
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+class FailingSmsBackend(BaseSmsBackend):
+    def send_batch(self, numbers, message):
+        raise ConnectionError("gateway down")
+
+
+class PartialSmsBackend(BaseSmsBackend):
+    def send_batch(self, numbers, message):
+        return len(numbers) - 1
+
+
+@override_settings(SMS_BACKEND="notifications.sms.LocmemSmsBackend", SMS_RATE_PER_SECOND=1000,
+                   PUSH_MAX_ATTEMPTS=3)
+class AreaSmsTests(APITestCase):
+    def setUp(self):
+        LocmemSmsBackend.outbox.clear()
+        self.addCleanup(LocmemSmsBackend.outbox.clear)
+        self.staff = User.objects.create_user("staff", is_staff=True)
+        medina = Localisation.objects.create(nom="Médina", latitude=14.690, longitude=-17.440)
+        far = Localisation.objects.create(nom="Rufisque", latitude=14.716, longitude=-17.273)
+        self.alerte = Alerte.objects.create(localisation=medina, niveau="fort", message="Rue inondée")
+        Signalement.objects.create(localisation=medina, description="eau", phone="77 123 45 67")
+        Signalement.objects.create(localisation=far, description="eau", phone="77 000 00 00")
+        AssistanceRequest.objects.create(location_text="14.695, -17.442", help_type="secours", phone="+221771234567")
+        AssistanceRequest.objects.create(location_text="14.693,-17.441", help_type="secours", phone="76 555 44 33")
+        AssistanceRequest.objects.create(location_text="Médina", help_type="secours", phone="70 111 22 33")
+        AssistanceRequest.objects.create(location_text="14.69, -17.44", help_type="secours", phone="12")
+
+    def test_phones_within_uses_the_geohash_prefilter(self):
+        self.assertEqual(AssistanceRequest.objects.exclude(geohash="").count(), 3)
+        with self.assertNumQueries(2):
+            phones = phones_within(14.690, -17.440, 1.5)
+        self.assertEqual(sorted(phones), ["+221771234567", "12", "76 555 44 33", "77 123 45 67"])
+
+    def test_queued_then_sent_by_the_worker(self):
+        self.client.force_login(self.staff)
+        response = self.client.post("/api/notifications/alert-area/sms/", {
+            "alerte_id": self.alerte.id, "radius_km": 1.5, "body": "Évacuez",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data["total"], data["invalid"], data["duplicates"]), (2, 1, 1))
+        self.assertEqual(LocmemSmsBackend.outbox, [])
+        self.assertEqual(outbox.run_once("w1")["sent"], 2)
+        self.assertEqual(LocmemSmsBackend.outbox, [{"to": ["+221771234567", "+221765554433"], "message": "Évacuez"}])
+        progress = self.client.get(f"/api/notifications/jobs/{data['job_id']}/").json()
+        self.assertEqual((progress["status"], progress["sent"]), ("done", 2))
+        job = NotificationJob.objects.get()
+        self.assertEqual(job.sent_count, 2)
+        self.assertGreater(job.send_seconds, 0)
+        self.assertEqual(progress["throughput_per_s"], round(2 / job.send_seconds, 1))
+
+    def test_deliver_batches_by_backend_size(self):
+        numbers = [f"+2217700000{i:02d}" for i in range(5)]
+        with mock.patch.object(LocmemSmsBackend, "max_batch_size", 2):
+            outcome = deliver(numbers, "x")
+        self.assertEqual([len(batch["to"]) for batch in LocmemSmsBackend.outbox], [2, 2, 1])
+        self.assertEqual(set(outcome.values()), {("sent", "")})
+
+    @override_settings(SMS_BACKEND="notifications.tests.FailingSmsBackend")
+    def test_backend_errors_are_logged_retried_and_reported(self):
+        job = outbox.enqueue_sms("Évacuez", ["+221771234567"])
+        with self.assertLogs("notifications.sms", "ERROR") as logs:
+            self.assertEqual(outbox.run_once("w1")["retry"], 1)
+        self.assertIn("gateway down", logs.output[0])
+        progress = outbox.job_progress(job)
+        self.assertEqual((progress["pending"], progress["last_error"]), (1, "ConnectionError: gateway down"))
+        with self.assertLogs("notifications.sms", "ERROR"):
+            outcome = deliver(["+221771234567"], "x", backend=FailingSmsBackend())
+        self.assertEqual(outcome, {"+221771234567": ("failed", "ConnectionError: gateway down")})
+
+    @override_settings(SMS_BACKEND="notifications.tests.PartialSmsBackend")
+    def test_partial_batch_is_rejected_without_retry(self):
+        job = outbox.enqueue_sms("Évacuez", ["+221771234567", "+221765554433"])
+        self.assertEqual(outbox.run_once("w1")["rejected"], 2)
+        self.assertEqual(outbox.run_once("w1"), {})
+        self.assertEqual(outbox.job_progress(job)["rejected"], 2)
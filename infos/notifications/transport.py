@@ -0,0 +1,126 @@
+"""Couche de transport Web Push: signature VAPID mise en cache et sessions poolées.
+
+`pywebpush.webpush()` recharge la clé privée et re-signe un JWT ECDSA à chaque
+message, puis ouvre une nouvelle connexion HTTPS. Ici:
+  - un en-tête VAPID est signé une fois par audience (origine du service push)
+    et réutilisé jusqu'à peu avant son expiration ;
+  - une `requests.Session` keep-alive est conservée par origine, pour tout le
+    processus (vues, `push_worker`).
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
+
+VAPID_TTL_SECONDS = 12 * 60 * 60
+VAPID_REFRESH_MARGIN_SECONDS = 10 * 60
+
+
+def origin_of(endpoint: str) -> str:
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+
+class SessionPool:
+    """Une `requests.Session` par origine, partagée entre les threads d'envoi."""
+
+    def __init__(self, pool_size: int = 16):
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, origin: str) -> requests.Session:
+        session = self._sessions.get(origin)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(origin)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._sessions[origin] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class VapidSigner:
+    """Signe et met en cache un en-tête Authorization VAPID par audience."""
+
+    def __init__(self, private_key: str, subject: str,
+                 ttl: int = VAPID_TTL_SECONDS, refresh_margin: int = VAPID_REFRESH_MARGIN_SECONDS):
+        self._vapid = Vapid.from_string(private_key=private_key)
+        self.subject = subject
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._cache = {}  # audience -> (exp, headers)
+        self._lock = threading.Lock()
+        self.signatures = 0
+
+    def headers_for(self, audience: str) -> dict:
+        now = int(time.time())
+        cached = self._cache.get(audience)
+        if cached is None or cached[0] - self.refresh_margin <= now:
+            with self._lock:
+                cached = self._cache.get(audience)
+                if cached is None or cached[0] - self.refresh_margin <= now:
+                    exp = now + self.ttl
+                    headers = self._vapid.sign({"sub": self.subject, "aud": audience, "exp": exp})
+                    cached = (exp, headers)
+                    self._cache[audience] = cached
+                    self.signatures += 1
+        return cached[1]
+
+
+class PushTransport:
+    """Envoie des messages Web Push en réutilisant signatures et connexions."""
+
+    def __init__(self, private_key: str, subject: str, pool_size: int = 16):
+        self.signer = VapidSigner(private_key, subject)
+        self.sessions = SessionPool(pool_size=pool_size)
+
+    def send(self, endpoint: str, p256dh: str, auth: str, data: str,
+             ttl: int = 0, timeout: float = 10.0) -> requests.Response:
+        """Même contrat que `pywebpush.webpush`: lève WebPushException au-delà de 202."""
+        origin = origin_of(endpoint)
+        pusher = WebPusher(
+            {"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}},
+            requests_session=self.sessions.get(origin),
+        )
+        response = pusher.send(data, dict(self.signer.headers_for(origin)), ttl=ttl, timeout=timeout)
+        if response.status_code > 202:
+            raise WebPushException(
+                f"Push failed: {response.status_code} {response.reason}", response=response,
+            )
+        return response
+
+    def close(self):
+        self.sessions.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> PushTransport:
+    """Transport partagé par le processus, créé à la première utilisation."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PushTransport(
+                    settings.VAPID_PRIVATE_KEY,
+                    settings.VAPID_SUBJECT,
+                    pool_size=getattr(settings, "PUSH_FANOUT_WORKERS", 16),
+                )
+    return _transport
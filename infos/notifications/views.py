@@ -3,30 +3,17 @@ from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import user_passes_test
-from pywebpush import webpush, WebPushException
-from .models import PushSubscription
-from django.db.models import Q
-from math import radians, sin, cos, asin, sqrt
+from .models import PushSubscription, NotificationJob
+from .outbox import enqueue, enqueue_sms, job_progress
+from .geo import subscriptions_within
+from .presence import buffer as presence_buffer
+from .sms import normalize_numbers, phones_within
 from inondation.models import Signalement, Alerte
 
 
-def _send_all(payload: dict):
-    body = json.dumps(payload)
-    sent, removed = 0, 0
-    for sub in list(PushSubscription.objects.all()):
-        sub_json = {"endpoint": sub.endpoint, "keys": {"p256dh": sub.p256dh, "auth": sub.auth}}
-        try:
-            webpush(
-                subscription_info=sub_json,
-                data=body,
-                vapid_private_key=settings.VAPID_PRIVATE_KEY,
-                vapid_claims={"sub": settings.VAPID_SUBJECT},
-            )
-            sent += 1
-        except WebPushException as e:
-            if getattr(e, "response", None) and e.response.status_code in (404, 410):
-                sub.delete(); removed += 1
-    return {"sent": sent, "removed": removed}
+def _enqueue_all(request, kind: str, payload: dict):
+    job = enqueue(kind, payload, PushSubscription.objects.all(), created_by=request.user)
+    return JsonResponse({"ok": True, "job_id": job.id, "total": job.total}, status=202)
 
 
 @csrf_exempt
@@ -59,8 +46,7 @@ def test_push(request):
     if request.method != "POST":
         return JsonResponse({"error": "method not allowed"}, status=405)
     payload = {"title": "Test Sentinel Dakar", "body": "Notification de test", "url": "/alertes"}
-    stats = _send_all(payload)
-    return JsonResponse({"ok": True, **stats})
+    return _enqueue_all(request, "test", payload)
 
 
 @user_passes_test(lambda u: u.is_staff or u.is_superuser)
@@ -70,8 +56,16 @@ def validate_signalement(request, pk: int):
         return JsonResponse({"error": "method not allowed"}, status=405)
     # TODO: marquer le signalement pk validé + créer une alerte réelle
     payload = {"title": "Alerte validée", "body": f"Signalement #{pk} validé.", "url": "/alertes"}
-    stats = _send_all(payload)
-    return JsonResponse({"ok": True, **stats})
+    return _enqueue_all(request, "broadcast", payload)
+
+@user_passes_test(lambda u: u.is_staff or u.is_superuser)
+def notification_job_status(request, pk: int):
+    try:
+        job = NotificationJob.objects.get(pk=pk)
+    except NotificationJob.DoesNotExist:
+        return JsonResponse({"error": "not found"}, status=404)
+    return JsonResponse({"ok": True, **job_progress(job)})
+
 
 def vapid_public_key(request):
     """Expose la clé publique VAPID au front si la variable est définie côté serveur."""
@@ -94,22 +88,35 @@ def update_presence(request):
         locality = data.get("locality") or ""
         if not endpoint:
             return JsonResponse({"error": "endpoint required"}, status=400)
-        qs = PushSubscription.objects.filter(endpoint=endpoint)
-        if getattr(request, "user", None) and request.user.is_authenticated:
-            qs = qs | PushSubscription.objects.filter(user=request.user)
-        updated = qs.update(latitude=lat, longitude=lng, locality=locality)
-        return JsonResponse({"ok": True, "updated": int(updated)})
+        if lat is not None and lng is not None:
+            lat, lng = float(lat), float(lng)
+        user_id = request.user.id if getattr(request, "user", None) and request.user.is_authenticated else None
+        outcome = presence_buffer.record(endpoint, lat, lng, locality, user_id=user_id)
+        return JsonResponse({"ok": True, "status": outcome})
     except Exception:
         return JsonResponse({"error": "presence failed"}, status=500)
 
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
+@user_passes_test(lambda u: u.is_staff or u.is_superuser)
+def presence_stats(request):
+    return JsonResponse({"ok": True, **presence_buffer.stats()})
+
+
+def _reference_location(signalement_id, alerte_id):
+    """Coordonnées du signalement, à défaut de l'alerte ; (None, None) sinon."""
+    if signalement_id:
+        try:
+            s = Signalement.objects.select_related("localisation").get(pk=signalement_id)
+            return s.localisation.latitude, s.localisation.longitude
+        except Signalement.DoesNotExist:
+            pass
+    if alerte_id:
+        try:
+            a = Alerte.objects.select_related("localisation").get(pk=alerte_id)
+            return a.localisation.latitude, a.localisation.longitude
+        except Alerte.DoesNotExist:
+            pass
+    return None, None
 
 
 @user_passes_test(lambda u: u.is_staff or u.is_superuser)
@@ -126,47 +133,15 @@ def alert_area_push(request):
         body = data.get("body") or "Risque élevé dans votre zone. Restez vigilants."
         url = data.get("url") or "/alertes"
 
-        lat = lng = None
-        if signalement_id:
-            try:
-                s = Signalement.objects.select_related("localisation").get(pk=signalement_id)
-                lat = s.localisation.latitude
-                lng = s.localisation.longitude
-            except Signalement.DoesNotExist:
-                pass
-        if lat is None and alerte_id:
-            try:
-                a = Alerte.objects.select_related("localisation").get(pk=alerte_id)
-                lat = a.localisation.latitude
-                lng = a.localisation.longitude
-            except Alerte.DoesNotExist:
-                pass
+        lat, lng = _reference_location(signalement_id, alerte_id)
         if lat is None or lng is None:
             return JsonResponse({"error": "no reference location"}, status=400)
 
         payload = {"title": title, "body": body, "url": url}
-        body_json = json.dumps(payload)
-
-        sent = removed = 0
-        for sub in list(PushSubscription.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True)):
-            try:
-                d = _haversine_km(lat, lng, float(sub.latitude), float(sub.longitude))
-            except Exception:
-                continue
-            if d <= radius_km:
-                sub_json = {"endpoint": sub.endpoint, "keys": {"p256dh": sub.p256dh, "auth": sub.auth}}
-                try:
-                    webpush(
-                        subscription_info=sub_json,
-                        data=body_json,
-                        vapid_private_key=settings.VAPID_PRIVATE_KEY,
-                        vapid_claims={"sub": settings.VAPID_SUBJECT},
-                    )
-                    sent += 1
-                except WebPushException as e:
-                    if getattr(e, "response", None) and e.response.status_code in (404, 410):
-                        sub.delete(); removed += 1
-        return JsonResponse({"ok": True, "sent": sent, "removed": removed})
+
+        targets = subscriptions_within(lat, lng, radius_km)
+        job = enqueue("area", payload, targets, created_by=request.user)
+        return JsonResponse({"ok": True, "job_id": job.id, "total": job.total}, status=202)
     except Exception:
         return JsonResponse({"error": "alert-area failed"}, status=500)
 
@@ -176,9 +151,17 @@ def alert_area_push(request):
 def alert_area_sms(request):
     if request.method != "POST":
         return JsonResponse({"error": "method not allowed"}, status=405)
-    # Placeholder: à brancher avec un fournisseur SMS (Twilio, etc.)
-    # Ici, on retourne simplement un statut factice.
     try:
-        return JsonResponse({"ok": True, "sms_sent": 0})
+        data = json.loads(request.body.decode("utf-8"))
+        radius_km = float(data.get("radius_km") or 1.5)
+        body = data.get("body") or "Alerte inondation dans votre zone. Restez vigilants."
+        lat, lng = _reference_location(data.get("signalement_id"), data.get("alerte_id"))
+        if lat is None or lng is None:
+            return JsonResponse({"error": "no reference location"}, status=400)
+        numbers, invalid, duplicates = normalize_numbers(phones_within(lat, lng, radius_km))
+        job = enqueue_sms(body, numbers, created_by=request.user)
+        return JsonResponse({
+            "ok": True, "job_id": job.id, "total": job.total, "invalid": invalid, "duplicates": duplicates,
+        }, status=202)
     except Exception:
         return JsonResponse({"error": "alert-area-sms failed"}, status=500)